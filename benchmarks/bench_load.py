@@ -0,0 +1,64 @@
+"""
+Compare pandas to_sql against the bulk loader for enriched_customers.
+
+    python -m benchmarks.bench_load --sizes 10000 100000 1000000
+"""
+import argparse
+import logging
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import make_enriched
+from etl.load import bulk_load
+
+
+def _to_sql(df, db_path: Path):
+    with sqlite3.connect(db_path) as conn:
+        df.to_sql("enriched_customers", conn, if_exists="replace", index=False)
+
+
+def _to_sql_indexed(df, db_path: Path):
+    # Like-for-like with the bulk loader, which also builds the secondary indexes
+    _to_sql(df, db_path)
+    with sqlite3.connect(db_path) as conn:
+        for column in ("Region", "Country", "City"):
+            conn.execute(f'CREATE INDEX ix_{column.lower()} ON enriched_customers ("{column}")')
+
+
+def _bulk(df, db_path: Path):
+    bulk_load(df, "enriched_customers", db_path=db_path)
+
+
+def run(sizes: list[int], repeats: int = 3) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in sizes:
+            df = make_enriched(n_rows)
+            for name, loader in (("to_sql", _to_sql), ("to_sql+idx", _to_sql_indexed), ("bulk_load", _bulk)):
+                timings = []
+                for i in range(repeats):
+                    db_path = Path(tmp) / f"{name}_{n_rows}_{i}.db"
+                    start = time.perf_counter()
+                    loader(df, db_path)
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                results.append({"loader": name, "rows": n_rows, "seconds": best, "rows_per_s": n_rows / best})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'loader':<11} {'rows':>10} {'seconds':>9} {'rows/s':>12}")
+    for r in run(args.sizes, args.repeats):
+        print(f"{r['loader']:<11} {r['rows']:>10,} {r['seconds']:>9.3f} {r['rows_per_s']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Benchmark the pipeline stages and the whole pipeline on a synthetic Northwind database, with weather
+served by a local stub OpenWeather server (no API key needed). Results are stored in
+output/benchmarks.db so runs can be compared.
+
+    python -m benchmarks.bench_pipeline --scales 10000 100000 1000000 --latency 0.02 --throttle-rate 0.02
+    python -m benchmarks.bench_pipeline --stages region_join load --scales 10000000 --repeats 1
+    python -m benchmarks.bench_pipeline --compare
+
+The weather_shards stage fetches the distinct cities the way the DAG's mapped fetch_weather tasks do under
+the LocalExecutor: one process per shard, each with an equal slice of the rate limit. Compare --shards 1
+(the old single fetch task) against --shards 4 at the same latency and --calls-per-minute.
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import subprocess
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmarks.synthetic import write_northwind, write_region_mapping_xlsx
+from config.config import OUTPUT_DIR, LOAD_MODE, WEATHER_SHARDS
+from etl import instrumentation, quality
+from etl.analysis import region_weather_summary
+from etl.api_integration import enrich_with_weather, weather_for_locations
+from etl.city_index import CityIdIndex
+from etl.extract import extract_orders_customers
+from etl.load import load_to_db
+from etl.pipeline import unique_locations, weather_shard
+from etl.region_mapping import load_region_mapping
+from etl.transform import enrich_with_region
+from etl.weather_cache import WeatherCache
+from etl.weather_client import TokenBucket, WeatherClient
+from tests.stub_openweather import StubOpenWeather
+
+RESULTS_DB = OUTPUT_DIR / "benchmarks.db"
+ORDERS_PER_CUSTOMER = 3
+
+
+# Each stage takes the prepared inputs and returns the rows it processed
+def _extract(ctx):
+    customers, orders = extract_orders_customers(mode="full", source_db=ctx.northwind)
+    return len(customers) + len(orders)
+
+def _weather(ctx, customers):
+    # Cold cache and city index every time: all distinct cities go to the (stub) API
+    run = uuid.uuid4().hex
+    limiter = TokenBucket(ctx.calls_per_minute, calls_per_month=None)
+    with WeatherClient("benchmark", base_url=ctx.stub.base_url, limiter=limiter) as client, \
+            WeatherCache(ctx.tmp / f"cache-{run}.db") as cache:
+        return enrich_with_weather(customers.copy(), client=client, cache=cache,
+                                   index=CityIdIndex(ctx.tmp / f"ids-{run}.yaml"))
+
+def _enrich(ctx):
+    return len(_weather(ctx, ctx.customers))
+
+def _fetch_shard(base_url: str, tmp: Path, locations, shard: int, n_shards: int, calls_per_minute: int) -> int:
+    # One mapped task: its own process, cold cache and city index, 1/n of the rate limit
+    run = f"{uuid.uuid4().hex}-{shard}"
+    limiter = TokenBucket(max(1, calls_per_minute // n_shards), calls_per_month=None)
+    with WeatherClient("benchmark", base_url=base_url, limiter=limiter) as client, \
+            WeatherCache(tmp / f"cache-{run}.db") as cache:
+        located = weather_shard(locations, shard, n_shards)
+        return len(weather_for_locations(located, client=client, cache=cache,
+                                         index=CityIdIndex(tmp / f"ids-{run}.yaml")))
+
+def _weather_shards(ctx):
+    locations = unique_locations(ctx.customers.copy())
+    with ProcessPoolExecutor(max_workers=ctx.shards) as pool:
+        fetched = pool.map(_fetch_shard, *zip(*[(ctx.stub.base_url, ctx.tmp, locations, shard, ctx.shards,
+                                                  ctx.calls_per_minute) for shard in range(ctx.shards)]))
+        return sum(fetched)
+
+def _region_join(ctx):
+    return len(enrich_with_region(ctx.customers_weather, ctx.mapping))
+
+def _dq(ctx):
+    return quality.check(ctx.enriched, "enriched", references={"region_mapping": ctx.mapping})["rows"]
+
+def _load(ctx):
+    load_to_db(ctx.enriched, "enriched_customers", if_exists=LOAD_MODE, db_path=ctx.tmp / "target.db")
+    return len(ctx.enriched)
+
+def _summary(ctx):
+    region_weather_summary(ctx.enriched)
+    return len(ctx.enriched)
+
+def _pipeline(ctx):
+    customers, orders = extract_orders_customers(mode="full", source_db=ctx.northwind)
+    mapping = load_region_mapping(ctx.mapping_xlsx, ctx.tmp / f"mapping-{uuid.uuid4().hex}.parquet")
+    enriched = enrich_with_region(_weather(ctx, customers), mapping)
+    report = quality.check(enriched, "enriched", references={"region_mapping": mapping})
+    db_path = ctx.tmp / "pipeline.db"
+    load_to_db(enriched, "enriched_customers", if_exists=LOAD_MODE, db_path=db_path)
+    load_to_db(orders, "orders", if_exists=LOAD_MODE, db_path=db_path)
+    region_weather_summary(enriched)
+    return report["rows"] + len(orders)
+
+STAGES = {
+    "extract": _extract,
+    "enrich": _enrich,
+    "weather_shards": _weather_shards,
+    "region_join": _region_join,
+    "dq": _dq,
+    "load": _load,
+    "summary": _summary,
+    "pipeline": _pipeline,
+}
+
+
+def _prepare(tmp: Path, scale: int, n_cities: int, stub: StubOpenWeather, calls_per_minute: int,
+             shards: int = WEATHER_SHARDS):
+    """Synthetic sources plus each stage's input, built once per scale outside the timings."""
+    ctx = SimpleNamespace(tmp=tmp, stub=stub, calls_per_minute=calls_per_minute, shards=shards)
+    ctx.northwind = write_northwind(tmp / "northwind.db", scale, scale * ORDERS_PER_CUSTOMER, n_cities)
+    ctx.mapping_xlsx = write_region_mapping_xlsx(tmp / "region_mapping.xlsx")
+    ctx.mapping = load_region_mapping(ctx.mapping_xlsx, tmp / "region_mapping.parquet")
+    ctx.customers, _ = extract_orders_customers(mode="full", source_db=ctx.northwind)
+    ctx.customers_weather = _weather(ctx, ctx.customers)
+    ctx.enriched = enrich_with_region(ctx.customers_weather, ctx.mapping)
+    return ctx
+
+def _measure(stage: str, ctx, repeats: int) -> dict:
+    timings, peaks, cpu, http_calls = [], [], [], []
+    throttled = ctx.stub.throttled
+    for _ in range(repeats):
+        with instrumentation.stage(f"bench_{stage}") as metrics:
+            start = time.perf_counter()
+            rows = STAGES[stage](ctx)
+            timings.append(time.perf_counter() - start)
+        if metrics.result is not None:
+            peaks.append(metrics.result["peak_rss_mb"])
+            cpu.append(metrics.result["cpu_s"])
+            http_calls.append(metrics.result["http_calls"])
+    p50 = float(np.percentile(timings, 50))
+    return {
+        "stage": stage,
+        "rows": rows,
+        "repeats": repeats,
+        "p50_s": round(p50, 4),
+        "p95_s": round(float(np.percentile(timings, 95)), 4),
+        "min_s": round(min(timings), 4),
+        "rows_per_s": round(rows / p50) if p50 else None,
+        "cpu_s": round(float(np.median(cpu)), 4) if cpu else None,
+        # Process high-water mark during the stage, so it includes the inputs already in memory
+        "peak_rss_mb": max(p for p in peaks if p is not None) if any(p is not None for p in peaks) else None,
+        "http_calls": int(np.median(http_calls)) if http_calls else None,
+        "throttled": (ctx.stub.throttled - throttled) // repeats,
+    }
+
+def run(scales: list[int], stages: list[str], repeats: int = 3, n_cities: int = 1000,
+        latency: float = 0.0, throttle_rate: float = 0.0, calls_per_minute: int = 600_000,
+        shards: int = WEATHER_SHARDS) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubOpenWeather(latency=latency, throttle_rate=throttle_rate) as stub:
+        for scale in scales:
+            scale_dir = Path(tmp) / str(scale)
+            scale_dir.mkdir()
+            ctx = _prepare(scale_dir, scale, min(n_cities, scale), stub, calls_per_minute, shards)
+            for stage in stages:
+                results.append({"scale": scale, **_measure(stage, ctx, repeats)})
+    # The stages' own metrics aren't part of any pipeline run
+    instrumentation._finished.clear()
+    return results
+
+
+# ------------------- Stored results -------------------
+RESULT_COLUMNS = ("stage", "scale", "rows", "repeats", "p50_s", "p95_s", "min_s", "rows_per_s", "cpu_s",
+                  "peak_rss_mb", "http_calls", "throttled")
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _ensure_results_table(conn: sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS benchmark_results (
+            run_id TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            git_rev TEXT,
+            params TEXT,
+            {', '.join(RESULT_COLUMNS)}
+        )
+    """)
+
+def store(results: list[dict], params: dict, db_path: Path = RESULTS_DB) -> str:
+    """Append a run's results; returns its run id."""
+    run_id = uuid.uuid4().hex[:12]
+    created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    with sqlite3.connect(db_path) as conn:
+        _ensure_results_table(conn)
+        conn.executemany(
+            f"INSERT INTO benchmark_results VALUES ({', '.join('?' * (4 + len(RESULT_COLUMNS)))})",
+            [(run_id, created_at, _git_revision(), json.dumps(params), *(r[c] for c in RESULT_COLUMNS))
+             for r in results],
+        )
+    conn.close()
+    return run_id
+
+def _change(now, before) -> float | None:
+    return round(now / before - 1, 3) if now is not None and before else None
+
+def compare(db_path: Path = RESULTS_DB) -> list[dict]:
+    """Each (stage, scale) of the latest run against the previous run that measured it."""
+    with sqlite3.connect(db_path) as conn:
+        _ensure_results_table(conn)
+        rows = conn.execute("""
+            SELECT cur.stage, cur.scale, cur.p50_s, cur.peak_rss_mb, prev.git_rev, prev.p50_s, prev.peak_rss_mb
+            FROM benchmark_results cur
+            LEFT JOIN benchmark_results prev ON prev.rowid = (
+                SELECT rowid FROM benchmark_results p
+                WHERE p.stage = cur.stage AND p.scale = cur.scale AND p.rowid < cur.rowid AND p.run_id != cur.run_id
+                ORDER BY p.rowid DESC LIMIT 1)
+            WHERE cur.run_id = (SELECT run_id FROM benchmark_results ORDER BY rowid DESC LIMIT 1)
+            ORDER BY cur.rowid
+        """).fetchall()
+    conn.close()
+    return [
+        {"stage": stage, "scale": scale, "p50_s": p50, "peak_rss_mb": peak, "previous_git_rev": prev_rev,
+         "p50_change": _change(p50, prev_p50), "peak_change": _change(peak, prev_peak)}
+        for stage, scale, p50, peak, prev_rev, prev_p50, prev_peak in rows
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000],
+                        help="customers per run (orders are 3x)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--cities", type=int, default=1000, help="distinct customer cities")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub API seconds per request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of stub requests answered 429")
+    parser.add_argument("--calls-per-minute", type=int, default=600_000, help="client rate limit")
+    parser.add_argument("--shards", type=int, default=WEATHER_SHARDS, help="weather_shards stage processes")
+    parser.add_argument("--compare", action="store_true", help="only compare the last two stored runs")
+    parser.add_argument("--results-db", type=Path, default=RESULTS_DB)
+    args = parser.parse_args()
+    # Synthetic cities in unmapped countries are skipped with a warning on every enrich run
+    logging.disable(logging.WARNING)
+
+    if not args.compare:
+        params = {"cities": args.cities, "latency": args.latency, "throttle_rate": args.throttle_rate,
+                  "calls_per_minute": args.calls_per_minute, "shards": args.shards, "load_mode": LOAD_MODE}
+        results = run(args.scales, args.stages, args.repeats, args.cities, args.latency, args.throttle_rate,
+                      args.calls_per_minute, args.shards)
+        store(results, params, args.results_db)
+        print(f"{'stage':<12} {'scale':>10} {'p50 s':>9} {'p95 s':>9} {'rows/s':>12} {'peak MB':>9} "
+              f"{'http':>6} {'429':>5}")
+        for r in results:
+            print(f"{r['stage']:<12} {r['scale']:>10,} {r['p50_s']:>9.3f} {r['p95_s']:>9.3f} "
+                  f"{r['rows_per_s'] or 0:>12,} {r['peak_rss_mb'] or 0:>9.1f} {r['http_calls'] or 0:>6} "
+                  f"{r['throttled']:>5}")
+
+    print(f"\n{'stage':<12} {'scale':>10} {'p50 s':>9} {'vs prev':>9} {'peak MB':>9} {'vs prev':>9}")
+    for c in compare(args.results_db):
+        p50_change = f"{c['p50_change']:+.1%}" if c["p50_change"] is not None else "-"
+        peak_change = f"{c['peak_change']:+.1%}" if c["peak_change"] is not None else "-"
+        print(f"{c['stage']:<12} {c['scale']:>10,} {c['p50_s']:>9.3f} {p50_change:>9} "
+              f"{c['peak_rss_mb'] or 0:>9.1f} {peak_change:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Latency of the serving queries (etl/serving.py) for concurrent readers, on an idle target.db and while
+loads keep rebuilding enriched_customers and the serving tables.
+
+    python -m benchmarks.bench_serving --rows 100000 1000000 --readers 8 --seconds 5
+"""
+import argparse
+import logging
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import make_enriched, CITIES, REGIONS
+from etl.load import bulk_load
+from etl.serving import ReadPool, refresh_serving_tables
+
+TEMPERATURE_RANGES = [(-5, 0), (10, 12), (20, 25), (30, 40)]
+
+
+def _load(df, db_path: Path):
+    bulk_load(df, "enriched_customers", db_path=db_path)
+    refresh_serving_tables(db_path)
+
+
+def _random_query(pool: ReadPool, rng: random.Random) -> str:
+    city, country = rng.choice(CITIES)
+    kind = rng.choice(("region", "country", "city", "temperature", "region_summary"))
+    if kind == "region":
+        pool.customers_by_region(rng.choice(REGIONS), limit=100)
+    elif kind == "country":
+        pool.customers_by_country(country, limit=100)
+    elif kind == "city":
+        pool.customers_by_city(country, city, limit=100)
+    elif kind == "temperature":
+        pool.customers_by_temperature(*rng.choice(TEMPERATURE_RANGES), limit=100)
+    else:
+        pool.region_summary()
+    return kind
+
+
+def _read(pool: ReadPool, n_readers: int, seconds: float) -> dict[str, list[float]]:
+    """Run `n_readers` threads issuing random queries for `seconds`; latencies per query kind."""
+    latencies: dict[str, list[float]] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader(seed):
+        rng, own = random.Random(seed), {}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            kind = _random_query(pool, rng)
+            own.setdefault(kind, []).append(time.perf_counter() - start)
+        with lock:
+            for kind, values in own.items():
+                latencies.setdefault(kind, []).extend(values)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+
+def run(sizes: list[int], n_readers: int = 8, seconds: float = 5.0) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in sizes:
+            db_path = Path(tmp) / f"target_{n_rows}.db"
+            df = make_enriched(n_rows)
+            _load(df, db_path)
+            with ReadPool(db_path, size=n_readers) as pool:
+                for phase in ("idle", "during load"):
+                    stop, loads = threading.Event(), []
+
+                    def writer():
+                        while not stop.is_set():
+                            start = time.perf_counter()
+                            _load(df, db_path)
+                            loads.append(time.perf_counter() - start)
+
+                    loader = threading.Thread(target=writer) if phase == "during load" else None
+                    if loader:
+                        loader.start()
+                    try:
+                        latencies = _read(pool, n_readers, seconds)
+                    finally:
+                        stop.set()
+                        if loader:
+                            loader.join()
+                    for kind, values in sorted(latencies.items()):
+                        ms = np.array(values) * 1000
+                        results.append({"rows": n_rows, "phase": phase, "query": kind, "queries": len(ms),
+                                        "p50_ms": float(np.percentile(ms, 50)),
+                                        "p99_ms": float(np.percentile(ms, 99)), "loads": len(loads)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0, help="reading time per phase")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'rows':>10} {'phase':<12} {'query':<15} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8} {'loads':>6}")
+    for r in run(args.rows, args.readers, args.seconds):
+        print(f"{r['rows']:>10,} {r['phase']:<12} {r['query']:<15} {r['queries']:>8,} {r['p50_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['loads']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Seeded synthetic data shaped like the pipeline's datasets, for benchmarks."""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CITIES = [
+    ("Berlin", "Germany"), ("München", "Germany"), ("México D.F.", "Mexico"), ("London", "UK"),
+    ("Århus", "Denmark"), ("Paris", "France"), ("São Paulo", "Brazil"), ("Madrid", "Spain"),
+    ("Tsawassen", "Canada"), ("Seattle", "USA"), ("Graz", "Austria"), ("Bräcke", "Sweden"),
+]
+REGIONS = ["Western Europe", "Central America", "British Isles", "Scandinavia", "South America",
+           "Southern Europe", "North America", None]
+# The region mapping workbook's rows: Country, Region starting 2016, Region until 2017
+REGION_MAPPING = [
+    ("France", "France", "Europe"), ("Germany", "Germany", "Europe"), ("Brazil", "Brazil", "USA"),
+    ("Belgium", "France", "Europe"), ("Switzerland", "Germany", "Europe"), ("Venezuela", "Brazil", "USA"),
+    ("Austria", "Germany", "Europe"), ("Mexico", "Brazil", "USA"), ("USA", "USA", "USA"),
+    ("Sweden", "Sweden", "Europe"), ("Finland", "Sweden", "Europe"), ("Italy", "Europe", "Europe"),
+    ("Spain", "Spain", "Europe"), ("UK", "UK", "Europe"), ("Ireland", "UK", "Europe"),
+    ("Portugal", "Spain", "Europe"), ("Canada", "USA", "USA"), ("Denmark", "Sweden", "Europe"),
+    ("Poland", "Poland", "Europe"), ("Norway", "Sweden", "Europe"), ("Argentina", "Brazil", "USA"),
+]
+WEATHER = ["clear sky", "few clouds", "scattered clouds", "light rain", "overcast clouds", None]
+
+
+def make_enriched(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Enriched customers with the same columns and value shapes as output/enriched.csv."""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(n_rows)
+    city_idx = rng.integers(0, len(CITIES), n_rows)
+    cities = np.array([c for c, _ in CITIES], dtype=object)[city_idx]
+    countries = np.array([c for _, c in CITIES], dtype=object)[city_idx]
+    return pd.DataFrame({
+        "CustomerID": [f"C{i:08d}" for i in ids],
+        "CompanyName": [f"Company {i}" for i in ids],
+        "ContactName": [f"Contact {i % 5003}" for i in ids],
+        "ContactTitle": rng.choice(["Owner", "Sales Representative", "Marketing Manager"], n_rows),
+        "Address": [f"Street {i % 9973} {i % 97}" for i in ids],
+        "City": cities,
+        "Region": rng.choice(np.array(REGIONS, dtype=object), n_rows),
+        "PostalCode": [f"{i % 99999:05d}" for i in ids],
+        "Country": countries,
+        "Phone": [f"030-{i % 10_000_000:07d}" for i in ids],
+        "Fax": None,
+        "Weather": rng.choice(np.array(WEATHER, dtype=object), n_rows),
+        "Temperature": rng.normal(15, 8, n_rows).round(2),
+        "Region starting 2016": countries,
+        "Region until 2017": rng.choice(["Europe", "USA", "Asia"], n_rows),
+    })
+
+
+def make_region_mapping() -> pd.DataFrame:
+    return pd.DataFrame(REGION_MAPPING, columns=["Country", "Region starting 2016", "Region until 2017"])
+
+
+def write_region_mapping_xlsx(path: Path) -> Path:
+    """A stand-in for data/region_mapping.xlsx."""
+    make_region_mapping().to_excel(path, index=False)
+    return path
+
+
+def make_customers(n_rows: int, n_cities: int = 1000, start: int = 0, seed: int = 0) -> pd.DataFrame:
+    """
+    Customers shaped like Northwind's Customers table, spread over `n_cities` distinct cities in the
+    mapped countries (plus ~1% in a country the mapping lacks). IDs run from `start`, so chunks can be
+    generated independently.
+    """
+    rng = np.random.default_rng((seed, start))
+    # City k is a fixed (name, country) pair, whichever chunk it appears in
+    countries = np.array([c for c, _, _ in REGION_MAPPING] + ["Japan"], dtype=object)
+    city_country = countries[np.arange(n_cities) % (len(countries) - 1)]
+    city_country[::100] = "Japan"
+    city_idx = rng.integers(0, n_cities, n_rows)
+    ids = np.arange(start, start + n_rows)
+    return pd.DataFrame({
+        "CustomerID": [f"C{i:08d}" for i in ids],
+        "CompanyName": [f"Company {i}" for i in ids],
+        "ContactName": [f"Contact {i % 5003}" for i in ids],
+        "ContactTitle": rng.choice(["Owner", "Sales Representative", "Marketing Manager"], n_rows),
+        "Address": [f"Street {i % 9973} {i % 97}" for i in ids],
+        "City": [f"City {k}" for k in city_idx],
+        "Region": rng.choice(np.array(REGIONS, dtype=object), n_rows),
+        "PostalCode": [f"{i % 99999:05d}" for i in ids],
+        "Country": city_country[city_idx],
+        "Phone": [f"030-{i % 10_000_000:07d}" for i in ids],
+        "Fax": None,
+    })
+
+
+def write_northwind(path: Path, n_customers: int, n_orders: int, n_cities: int = 1000,
+                    chunk_size: int = 500_000, seed: int = 0) -> Path:
+    """A synthetic northwind.db with Customers and Orders, generated and written chunk by chunk."""
+    customer_ids = np.array([f"C{i:08d}" for i in range(n_customers)], dtype=object)
+    with sqlite3.connect(path) as conn:
+        for table in ("Customers", "Orders"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        for start in range(0, n_customers, chunk_size):
+            chunk = make_customers(min(chunk_size, n_customers - start), n_cities, start=start, seed=seed)
+            chunk.to_sql("Customers", conn, if_exists="append", index=False)
+        for start in range(0, n_orders, chunk_size):
+            chunk = make_orders(min(chunk_size, n_orders - start), customer_ids, seed=seed + start, start=start)
+            chunk.to_sql("Orders", conn, if_exists="append", index=False)
+    conn.close()
+    return path
+
+
+def make_orders(n_orders: int, customer_ids, seed: int = 0, start: int = 0) -> pd.DataFrame:
+    """Orders shaped like Northwind's Orders table, placed by the given customers; OrderIDs from 10248 + start."""
+    rng = np.random.default_rng(seed)
+    customer_ids = np.asarray(customer_ids, dtype=object)
+    order_dates = np.datetime64("1996-07-04") + rng.integers(0, 670, n_orders).astype("timedelta64[D]")
+    shipped = order_dates + rng.integers(1, 30, n_orders).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "OrderID": np.arange(10248 + start, 10248 + start + n_orders),
+        "CustomerID": customer_ids[rng.integers(0, len(customer_ids), n_orders)],
+        "EmployeeID": rng.integers(1, 10, n_orders),
+        "OrderDate": order_dates.astype(str),
+        "RequiredDate": (order_dates + np.timedelta64(28, "D")).astype(str),
+        "ShippedDate": np.where(rng.random(n_orders) < 0.97, shipped.astype(str), None),
+        "ShipVia": rng.integers(1, 4, n_orders),
+        "Freight": rng.gamma(1.2, 65, n_orders).round(2),
+        "ShipName": [f"Ship {i % 89}" for i in range(start, start + n_orders)],
+        "ShipCountry": rng.choice([c for _, c in CITIES], n_orders),
+    })
@@ -10,22 +10,138 @@ OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", PROJECT_ROOT / "output"))
 CONFIG_DIR = Path(os.getenv("CONFIG_DIR", PROJECT_ROOT / "config"))
 STAGING_DIR = OUTPUT_DIR / "staging"
 
-# Ensure output directories exist
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-STAGING_DIR.mkdir(parents=True, exist_ok=True)
+
+def ensure_dirs():
+    """Create the output directories; done by the pipeline's first stage rather than on import."""
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
 
 # ---------------- Data/DB Files ---------------
 NORTHWIND_DB = DATA_DIR / "northwind.db"
 REGION_MAPPING_XLSX = DATA_DIR / "region_mapping.xlsx"
 TARGET_DB = OUTPUT_DIR / "target.db"
+# Seconds a TARGET_DB writer waits for another writer's lock before failing with "database is locked".
+# Every writer (loads, summary fold, serving refresh, run state) uses the same timeout.
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 60))
+# Parquet copy of the region mapping workbook, rebuilt only when the workbook changes
+REGION_MAPPING_CACHE = STAGING_DIR / "region_mapping.cache.parquet"
 
 # ---------------- Config Files -----------------
 COUNTRY_MAPPING_YAML = CONFIG_DIR / "country_code_mapping.yaml"
 CITY_MAPPING_YAML = CONFIG_DIR / "city_name_mapping.yaml"
+CITY_ID_INDEX_YAML = CONFIG_DIR / "city_id_index.yaml"
+SCHEMA_CONFIG_YAML = CONFIG_DIR / "schema_config.yaml"
 
 # ---------------- ETL/Output Files -------------
-ENRICHED_CSV = OUTPUT_DIR / "enriched.csv"
-CUSTOMERS_CSV = STAGING_DIR / "customers.csv"
-ORDERS_CSV = STAGING_DIR / "orders.csv"
-CUSTOMERS_WEATHER_CSV = STAGING_DIR / "customers_weather.csv"
-REGION_WEATHER_SUMMARY_CSV = OUTPUT_DIR / "region_weather_summary.csv"
\ No newline at end of file
+ENRICHED_CSV = OUTPUT_DIR / "enriched.csv"  # CSV export of the enriched dataset
+REGION_WEATHER_SUMMARY_CSV = OUTPUT_DIR / "region_weather_summary.csv"
+SALES_WEATHER_SUMMARY_CSV = OUTPUT_DIR / "sales_weather_summary.csv"
+# Weather observations kept across runs, as a Parquet dataset partitioned by observation date
+WEATHER_HISTORY_DIR = Path(os.getenv("WEATHER_HISTORY_DIR", OUTPUT_DIR / "weather_history"))
+DATA_QUALITY_LOG = OUTPUT_DIR / "data_quality_report.log"
+DATA_QUALITY_JSON = OUTPUT_DIR / "data_quality_report.json"  # structured report from etl/quality.py
+
+# ---------------- Staging ----------------------
+# Format of the intermediate files handed between DAG tasks under STAGING_DIR:
+# parquet (default) or feather (Arrow IPC, memory-mapped reads)
+STAGING_FORMAT = os.getenv("STAGING_FORMAT", "parquet")
+
+# ---------------- Extraction -------------------
+# "full" re-reads the source tables each run; "incremental" pulls rows past the stored watermarks
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "full")
+EXTRACT_FULL_REFRESH = os.getenv("EXTRACT_FULL_REFRESH", "false").lower() in ("1", "true", "yes")
+# Source tables are read on read-only connections with memory-mapped I/O, EXTRACT_WORKERS tables at a time.
+# "immutable" also skips SQLite's file locking; turn it off if something writes northwind.db during a run.
+EXTRACT_IMMUTABLE = os.getenv("EXTRACT_IMMUTABLE", "true").lower() in ("1", "true", "yes")
+EXTRACT_MMAP_SIZE = int(os.getenv("EXTRACT_MMAP_SIZE", 256 * 1024 * 1024))  # bytes
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", min(2, os.cpu_count() or 1)))
+# Tables spanning more rowids than this are read in rowid-range shards on up to EXTRACT_SHARD_WORKERS processes
+EXTRACT_SHARD_ROWS = int(os.getenv("EXTRACT_SHARD_ROWS", 1_000_000))
+EXTRACT_SHARD_WORKERS = int(os.getenv("EXTRACT_SHARD_WORKERS", min(4, os.cpu_count() or 1)))
+
+# ---------------- Streaming --------------------
+# Process staging data in fixed-size chunks so peak memory doesn't grow with the dataset
+STREAMING = os.getenv("STREAMING", "false").lower() in ("1", "true", "yes")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 50_000))
+# Compact in-memory dtypes (categoricals, Arrow strings, float32, nullable ints) from the `dtypes` policy
+# in SCHEMA_CONFIG_YAML, applied at extract, staging reads and the weather merge; see etl/dtypes.py
+MEMORY_DTYPES = os.getenv("MEMORY_DTYPES", "true").lower() in ("1", "true", "yes")
+
+# ---------------- Loading ----------------------
+# "replace" is the plain pandas to_sql path, "bulk" rebuilds target tables from the declared schema
+# (typed, keyed and indexed) and swaps them in atomically, "merge" upserts rows on the table's primary key.
+# bulk costs more than an unindexed to_sql (python -m benchmarks.bench_load), so it isn't the default.
+LOAD_MODE = os.getenv("LOAD_MODE", "replace")
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", 10_000))
+
+# ---------------- Analysis -------------------
+# "full" recomputes the region summary from the enriched data; "incremental" folds each run's rows
+# into mergeable per-rollup state in TARGET_DB and reads the summary back from it
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "full")
+# Distinct customers per "day" key: "exact" (stored customer sets) or "hll" (HyperLogLog sketches).
+# The snapshot rollups keep each customer's folded row, so their counts are always exact.
+SUMMARY_DISTINCT = os.getenv("SUMMARY_DISTINCT", "exact")
+SUMMARY_ROLLUPS = os.getenv("SUMMARY_ROLLUPS", "region,country,day,temp_histogram").split(",")
+SUMMARY_TEMP_BIN_WIDTH = float(os.getenv("SUMMARY_TEMP_BIN_WIDTH", 5))  # degrees C per histogram bin
+
+# ---------------- Serving --------------------
+# Read-only connections per etl.serving.ReadPool, for consumers querying the serving tables in TARGET_DB
+SERVING_POOL_SIZE = int(os.getenv("SERVING_POOL_SIZE", 4))
+
+# ---------------- Local runner -----------------
+# `python -m etl.pipeline` runs the DAG's stages in one process, independent stages on PIPELINE_WORKERS threads;
+# backfills process order-date partitions on BACKFILL_WORKERS processes into ORDERS_WEATHER_DIR
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 4))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", os.cpu_count() or 1))
+ORDERS_WEATHER_DIR = Path(os.getenv("ORDERS_WEATHER_DIR", OUTPUT_DIR / "orders_weather"))
+
+# ---------------- Change detection -------------
+# Pipeline stages are skipped when the fingerprint of their inputs (source tables, mapping files,
+# config and code, weather) matches their last successful run; see etl/fingerprints.py
+SKIP_UNCHANGED = os.getenv("SKIP_UNCHANGED", "true").lower() in ("1", "true", "yes")
+
+# ---------------- Instrumentation --------------
+# Per-stage wall/CPU time, peak RSS, rows, bytes and API counters, stored per run in TARGET_DB and as JSON
+ETL_METRICS = os.getenv("ETL_METRICS", "true").lower() in ("1", "true", "yes")
+ETL_METRICS_JSON = OUTPUT_DIR / "etl_metrics.json"
+# Profile instrumented stages: "cprofile" or "pyinstrument" (if installed); empty disables.
+# ETL_PROFILE_STAGES limits it to a comma-separated list of stage names.
+ETL_PROFILE = os.getenv("ETL_PROFILE", "").lower()
+ETL_PROFILE_STAGES = [s for s in os.getenv("ETL_PROFILE_STAGES", "").split(",") if s]
+PROFILE_DIR = OUTPUT_DIR / "profiles"
+
+# ---------------- OpenWeather API --------------
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org/data/2.5")
+
+# Subscription plans: (calls per minute, calls per month)
+OPENWEATHER_PLANS = {
+    "free": (60, 1_000_000),
+    "startup": (600, 10_000_000),
+    "developer": (3_000, 100_000_000),
+    "professional": (30_000, 1_000_000_000),
+}
+OPENWEATHER_PLAN = os.getenv("OPENWEATHER_PLAN", "free")
+_plan_per_minute, _plan_per_month = OPENWEATHER_PLANS.get(OPENWEATHER_PLAN, OPENWEATHER_PLANS["free"])
+OPENWEATHER_CALLS_PER_MINUTE = int(os.getenv("OPENWEATHER_CALLS_PER_MINUTE", _plan_per_minute))
+OPENWEATHER_CALLS_PER_MONTH = int(os.getenv("OPENWEATHER_CALLS_PER_MONTH", _plan_per_month))
+OPENWEATHER_MAX_WORKERS = int(os.getenv("OPENWEATHER_MAX_WORKERS", 8))
+OPENWEATHER_MAX_RETRIES = int(os.getenv("OPENWEATHER_MAX_RETRIES", 3))
+OPENWEATHER_TIMEOUT = float(os.getenv("OPENWEATHER_TIMEOUT", 10))
+# Fetch cities with a known OpenWeather id through the multi-city "group" endpoint
+OPENWEATHER_GROUP_MODE = os.getenv("OPENWEATHER_GROUP_MODE", "true").lower() in ("1", "true", "yes")
+OPENWEATHER_GROUP_SIZE = int(os.getenv("OPENWEATHER_GROUP_SIZE", 20))  # API maximum is 20 ids per call
+# The DAG fans weather fetching out over up to this many mapped tasks, splitting the plan's quota between them
+WEATHER_SHARDS = int(os.getenv("WEATHER_SHARDS", 4))
+WEATHER_MIN_CITIES_PER_SHARD = int(os.getenv("WEATHER_MIN_CITIES_PER_SHARD", 50))
+
+# ---------------- Weather Cache ----------------
+WEATHER_CACHE_DB = STAGING_DIR / "weather_cache.db"
+WEATHER_CACHE_TTL_MINUTES = float(os.getenv("WEATHER_CACHE_TTL_MINUTES", 180))  # 0 disables the cache
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", 100_000))
+
+# ---------------- Weather Checkpoint -----------
+# Journal of the cities a run has fetched, committed every WEATHER_CHECKPOINT_EVERY cities,
+# so a retried fetch only spends the rate limit on the cities still missing
+WEATHER_CHECKPOINT_DB = STAGING_DIR / "weather_checkpoint.db"
+WEATHER_CHECKPOINT_EVERY = int(os.getenv("WEATHER_CHECKPOINT_EVERY", 20))
+WEATHER_CHECKPOINT_MAX_AGE_HOURS = float(os.getenv("WEATHER_CHECKPOINT_MAX_AGE_HOURS", 24))
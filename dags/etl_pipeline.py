@@ -1,103 +1,260 @@
 from __future__ import annotations
 
 import os
+import inspect
+import logging
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import TYPE_CHECKING
 import sys
 
 from airflow import DAG
 from airflow.operators.python import PythonOperator, ShortCircuitOperator
-from airflow.operators.bash import BashOperator
 
 from dotenv import load_dotenv
 load_dotenv()
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 # --- Make project code importable ---
 DAGS_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = DAGS_DIR.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-# --- Project ETL modules ---
-from etl.extract import extract_orders_customers
-from etl.api_integration import enrich_with_weather
-from etl.region_mapping import load_region_mapping
-from etl.transform import enrich_with_region
-from etl.load import load_to_db
-from etl.analysis import region_weather_summary
+# --- Project config ---
+# The scheduler re-parses this file every few seconds: only light modules are imported here. The etl
+# modules (pandas, pyarrow, requests, ...) are imported by the task functions, in the worker running them.
 from config.config import (
-    DATA_DIR,
-    OUTPUT_DIR,
-    STAGING_DIR,
-    TARGET_DB,
-    NORTHWIND_DB,
-    REGION_MAPPING_XLSX,
     ENRICHED_CSV,
-    CUSTOMERS_CSV,
-    ORDERS_CSV,
-    CUSTOMERS_WEATHER_CSV,
-    REGION_WEATHER_SUMMARY_CSV
+    EXTRACT_MODE,
+    SUMMARY_MODE,
+    STREAMING,
+    CHUNK_SIZE,
+    OPENWEATHER_CALLS_PER_MINUTE,
+    OPENWEATHER_CALLS_PER_MONTH,
+    WEATHER_SHARDS,
+    WEATHER_MIN_CITIES_PER_SHARD,
 )
 
 # ------------------- DAG constants -------------------
-STAGING = STAGING_DIR        # intermediate/temp
-TESTS_DIR = PROJECT_ROOT / "tests"  # dynamic test path
-
 DEFAULT_ARGS = {
     "owner": "airflow",
     "retries": 1,
     "retry_delay": timedelta(minutes=1),
 }
 
+logger = logging.getLogger(__name__)
+
 # ------------------- ETL task functions -------------------
+# Thin wrappers over the stages in etl/pipeline.py: each task reads its inputs from the staging files
+# and writes its outputs back, since tasks run in separate processes. `python -m etl.pipeline run`
+# executes the same stages in one process.
+def _with_metrics(task):
+    """Run a task function as an instrumented stage and store its metrics under the DAG run's id."""
+    params = inspect.signature(task).parameters
+    name = task.__name__.removeprefix("_task_").lstrip("_")
+
+    # Airflow passes the whole context to a **kwargs callable; the task only gets what it asks for
+    def run(**context):
+        from etl import instrumentation
+        run_id = context.get("run_id")
+        map_index = getattr(context.get("ti"), "map_index", -1)
+        stage = f"{name}[{map_index}]" if map_index >= 0 else name  # one row per mapped shard
+        try:
+            with instrumentation.stage(stage, task=stage, run_id=run_id):
+                return task(**{k: v for k, v in context.items() if k in params})
+        finally:
+            instrumentation.flush(run_id)
+    run.__name__ = task.__name__
+    return run
+
 def _ensure_dirs():
-    STAGING.mkdir(parents=True, exist_ok=True)
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    from etl import pipeline
+    pipeline.ensure_dirs()
+
+# Tasks whose inputs (source tables, mapping files, config, fetched weather) match their last successful
+# run are skipped, as long as the staged or exported outputs that run left are still there
+def _fetched_weather() -> pd.DataFrame:
+    """This run's weather shards, in one frame."""
+    import pandas as pd
+    from etl import staging
+    frames = [staging.read_staging(name) for name in staging.shard_names(staging.WEATHER)]
+    # Empty shards carry object dtypes that would leak into the concatenated columns
+    return pd.concat([f for f in frames if not f.empty] or frames, ignore_index=True)
+
+def _inputs(weather: bool = True) -> str | None:
+    from etl import pipeline
+    return pipeline.input_fingerprint(_fetched_weather() if weather else None)
+
+def _skip(stage: str, inputs: str | None, *staged: str) -> bool:
+    from etl import pipeline, staging
+    outputs = pipeline.STAGE_OUTPUTS.get(stage, []) + [staging.staging_path(name) for name in staged]
+    previous = pipeline.unchanged(stage, inputs, outputs)
+    if previous is not None:
+        logger.info("Skipping %s: inputs unchanged since run %s", stage, previous["run_id"])
+    return previous is not None
 
-def _task_extract():
-    customers_df, orders_df = extract_orders_customers()
-    customers_df.to_csv(CUSTOMERS_CSV, index=False)
-    orders_df.to_csv(ORDERS_CSV, index=False)
+def _task_extract(run_id: str | None = None):
+    from etl import pipeline, staging
+    from etl.extract import extract_orders_customers_chunked
+    inputs = _inputs(weather=False)
+    # An incremental delta depends on the committed watermarks, which the fingerprint doesn't cover:
+    # skipping would leave the previous delta staged for the load to apply again
+    if EXTRACT_MODE != "incremental" and _skip("extract", inputs, staging.CUSTOMERS, staging.ORDERS):
+        return
+    if STREAMING and EXTRACT_MODE != "incremental":
+        # Incremental deltas are small enough to extract in one go
+        customers_chunks, orders_chunks = extract_orders_customers_chunked(CHUNK_SIZE)
+        staging.write_staging_chunks(customers_chunks, staging.CUSTOMERS)
+        staging.write_staging_chunks(orders_chunks, staging.ORDERS)
+    else:
+        customers_df, orders_df = pipeline.extract()
+        staging.write_staging(customers_df, staging.CUSTOMERS)
+        staging.write_staging(orders_df, staging.ORDERS)
+    pipeline.succeeded("extract", inputs, run_id=run_id)
+
+def _check_staged(dataset: str, name: str, stage: str | None = None, references: dict | None = None) -> dict:
+    """Run a dataset's quality rules over its staged file, reading only the columns they need."""
+    from etl import pipeline, quality, staging
+    columns = quality.rule_columns(dataset, staging.staged_columns(name))
+    if STREAMING:
+        data = staging.iter_staging(name, columns=columns, chunksize=CHUNK_SIZE)
+    else:
+        data = staging.read_staging(name, columns=columns)
+    return pipeline.check(data, dataset, columns=columns, stage=stage, references=references)
+
+def _task_check_sources(run_id: str | None = None):
+    from etl import pipeline, staging
+    pipeline.run_checks("check_sources", _inputs(weather=False), lambda: [
+        _check_staged("customers", staging.CUSTOMERS),
+        _check_staged("orders", staging.ORDERS),
+        _check_staged("region_mapping", staging.REGION_MAPPING),
+    ], run_id)
 
 def _weather_gate() -> bool:
-    return bool(os.getenv("OPENWEATHER_API_KEY"))
+    from etl import pipeline
+    return pipeline.weather_enabled()
 
-def _task_api():
-    import pandas as pd
-    customers = pd.read_csv(CUSTOMERS_CSV)
-    api_key = os.getenv("OPENWEATHER_API_KEY")
+def _unique_locations() -> pd.DataFrame:
+    from etl import pipeline, staging
+    return pipeline.unique_locations(staging.read_staging(staging.CUSTOMERS, columns=pipeline.LOCATION_COLUMNS))
+
+def _task_plan_weather_shards() -> list[dict]:
+    """One mapped fetch task per shard; small city lists aren't worth splitting."""
+    from etl import staging
+    staging.clear_shards(staging.WEATHER)
+    n_cities = len(_unique_locations())
+    n_shards = max(1, min(WEATHER_SHARDS, -(-n_cities // WEATHER_MIN_CITIES_PER_SHARD)))
+    logger.info("Fetching weather for %d cities in %d shards", n_cities, n_shards)
+    return [{"shard": i, "n_shards": n_shards} for i in range(n_shards)]
 
-    if not api_key:
-        import logging
-        logging.warning("OPENWEATHER_API_KEY not set, skipping API enrichment")
-        customers.to_csv(CUSTOMERS_WEATHER_CSV, index=False)
+def _task_weather_shard(shard: int, n_shards: int, run_id: str | None = None):
+    from etl import pipeline, staging
+    from etl.weather_client import TokenBucket, WeatherClient
+    locations = pipeline.weather_shard(_unique_locations(), shard, n_shards)
+    # Shards run in separate processes: each gets an equal slice of the plan's rate limit
+    limiter = TokenBucket(max(1, OPENWEATHER_CALLS_PER_MINUTE // n_shards),
+                          OPENWEATHER_CALLS_PER_MONTH // n_shards if OPENWEATHER_CALLS_PER_MONTH else None)
+    with WeatherClient(os.getenv("OPENWEATHER_API_KEY"), limiter=limiter) as client:
+        # A retried shard resumes from the cities its failed attempt journaled
+        weather = pipeline.fetch_weather(locations, client=client, run_id=run_id)
+    staging.write_staging(weather, f"{staging.WEATHER}_{shard}")
+
+def _task_merge_weather(run_id: str | None = None):
+    from etl import pipeline, staging
+    fetched = _fetched_weather()
+    weather = pipeline.record_weather(fetched, run_id)
+    inputs = pipeline.input_fingerprint(fetched)
+    if _skip("merge_weather", inputs, staging.CUSTOMERS_WEATHER):
         return
 
-    customers_weather = enrich_with_weather(customers, api_key=api_key)
-    customers_weather.to_csv(CUSTOMERS_WEATHER_CSV, index=False)
+    if STREAMING:
+        chunks = staging.iter_staging(staging.CUSTOMERS, chunksize=CHUNK_SIZE)
+        staging.write_staging_chunks((pipeline.merge_weather(chunk, weather) for chunk in chunks),
+                                     staging.CUSTOMERS_WEATHER)
+    else:
+        customers = staging.read_staging(staging.CUSTOMERS)
+        staging.write_staging(pipeline.merge_weather(customers, weather), staging.CUSTOMERS_WEATHER)
+    pipeline.succeeded("merge_weather", inputs, run_id=run_id)
 
 def _task_region_mapping():
-    mapping_df = load_region_mapping()
-    mapping_df.to_csv(STAGING_DIR / "region_mapping.csv", index=False)
-    load_to_db(mapping_df, table_name="region_mapping")
+    from etl import pipeline, staging
+    staging.write_staging(pipeline.region_mapping(), staging.REGION_MAPPING)
 
-def _task_transform():
-    import pandas as pd
-    customers_weather = pd.read_csv(CUSTOMERS_WEATHER_CSV)
-    mapping_df = pd.read_csv(STAGING_DIR / "region_mapping.csv")
-    enriched = enrich_with_region(customers_weather, mapping_df)
-    enriched.to_csv(ENRICHED_CSV, index=False)
+def _task_transform(run_id: str | None = None):
+    from etl import pipeline, staging
+    from etl.transform import enrich_with_region_chunks
+    from etl.load import write_csv_chunks
+    inputs = _inputs()
+    if _skip("transform", inputs, staging.ENRICHED):
+        return
+    mapping_df = staging.read_staging(staging.REGION_MAPPING)
+    if STREAMING:
+        chunks = staging.iter_staging(staging.CUSTOMERS_WEATHER, chunksize=CHUNK_SIZE)
+        staging.write_staging_chunks(enrich_with_region_chunks(chunks, mapping_df), staging.ENRICHED)
+        if not pipeline.FROM_TARGET:
+            write_csv_chunks(staging.iter_staging(staging.ENRICHED, chunksize=CHUNK_SIZE), ENRICHED_CSV)
+    else:
+        customers_weather = staging.read_staging(staging.CUSTOMERS_WEATHER)
+        staging.write_staging(pipeline.transform(customers_weather, mapping_df), staging.ENRICHED)
+    pipeline.succeeded("transform", inputs, run_id=run_id)
 
-def _task_load():
-    import pandas as pd
-    enriched = pd.read_csv(ENRICHED_CSV)
-    load_to_db(enriched, table_name="enriched_customers")
+def _task_check_enriched(run_id: str | None = None):
+    from etl import pipeline, staging
 
-def _task_region_analysis():
-    import pandas as pd
-    enriched = pd.read_csv(ENRICHED_CSV)
-    summary = region_weather_summary(enriched)
-    summary.to_csv(REGION_WEATHER_SUMMARY_CSV, index=False)
+    def checks():
+        mapping_df = staging.read_staging(staging.REGION_MAPPING)
+        return [_check_staged("enriched", staging.ENRICHED, references={"region_mapping": mapping_df})]
+    pipeline.run_checks("check_enriched", _inputs(), checks, run_id)
+
+def _staged(name: str):
+    """A staged dataset, whole or as a chunk stream when STREAMING."""
+    from etl import staging
+    if STREAMING:
+        return staging.iter_staging(name, chunksize=CHUNK_SIZE)
+    return staging.read_staging(name)
+
+def _task_load(run_id: str | None = None):
+    from etl import pipeline, staging
+    inputs = _inputs()
+    if _skip("load", inputs):
+        return
+    pipeline.load(_staged(staging.ENRICHED), _staged(staging.ORDERS), _fetched_weather())
+    pipeline.succeeded("load", inputs, run_id=run_id)
+
+def _task_check_load(run_id: str | None = None):
+    from etl import pipeline
+    pipeline.run_checks("check_load", _inputs(), pipeline.check_load, run_id)
+
+def _task_data_quality_summary():
+    from etl import pipeline
+    pipeline.data_quality_summary()
+
+def _task_region_analysis(run_id: str | None = None):
+    from etl import pipeline, staging
+    inputs = _inputs()
+    if _skip("region_weather_analysis", inputs):
+        return
+    # Only the columns the summary aggregates; the incremental fold can take them chunk by chunk
+    columns = pipeline.SUMMARY_COLUMNS
+    if pipeline.FROM_TARGET:
+        enriched = None  # a delta: the summary reads every customer back from target.db
+    elif STREAMING and SUMMARY_MODE == "incremental":
+        enriched = staging.iter_staging(staging.ENRICHED, columns=columns, chunksize=CHUNK_SIZE)
+    else:
+        enriched = staging.read_staging(staging.ENRICHED, columns=columns)
+    pipeline.region_analysis(enriched, run_id)
+    pipeline.succeeded("region_weather_analysis", inputs, run_id=run_id)
+
+def _task_sales_analysis(run_id: str | None = None):
+    from etl import pipeline
+    inputs = _inputs()
+    if _skip("sales_weather_analysis", inputs):
+        return
+    pipeline.sales_analysis()
+    pipeline.succeeded("sales_weather_analysis", inputs, run_id=run_id)
 
 # ------------------- DAG definition -------------------
 with DAG(
@@ -111,85 +268,88 @@ with DAG(
 
     ensure_dirs = PythonOperator(
         task_id="ensure_dirs",
-        python_callable=_ensure_dirs,
+        python_callable=_with_metrics(_ensure_dirs),
     )
 
     extract = PythonOperator(
         task_id="extract",
-        python_callable=_task_extract,
+        python_callable=_with_metrics(_task_extract),
+    )
+
+    region_map = PythonOperator(
+        task_id="region_mapping",
+        python_callable=_with_metrics(_task_region_mapping),
     )
 
-    run_extract_tests = BashOperator(
-        task_id="test_extract",
-        bash_command=(
-            f"export PYTHONPATH={PROJECT_ROOT}/dags:{PROJECT_ROOT}/etl && "
-            f"pytest -v -s --tb=short {TESTS_DIR}/test_extract.py --cache-clear "
-            f"| tee {OUTPUT_DIR}/data_quality_report.log"
-        ),
+    check_sources = PythonOperator(
+        task_id="check_sources",
+        python_callable=_with_metrics(_task_check_sources),
     )
 
     weather_key_present = ShortCircuitOperator(
         task_id="weather_key_present",
-        python_callable=_weather_gate,
+        python_callable=_with_metrics(_weather_gate),
     )
 
-    api_integration = PythonOperator(
-        task_id="api_integration",
-        python_callable=_task_api,
+    plan_weather_shards = PythonOperator(
+        task_id="plan_weather_shards",
+        python_callable=_with_metrics(_task_plan_weather_shards),
     )
 
-    region_map = PythonOperator(
-        task_id="region_mapping",
-        python_callable=_task_region_mapping,
+    # One task instance per shard, so the shards fetch in parallel across workers
+    fetch_weather = PythonOperator.partial(
+        task_id="fetch_weather",
+        python_callable=_with_metrics(_task_weather_shard),
+    ).expand(op_kwargs=plan_weather_shards.output)
+
+    merge_weather = PythonOperator(
+        task_id="merge_weather",
+        python_callable=_with_metrics(_task_merge_weather),
     )
 
     transform = PythonOperator(
         task_id="transform",
-        python_callable=_task_transform,
+        python_callable=_with_metrics(_task_transform),
     )
 
-    run_transform_tests = BashOperator(
-        task_id="test_transform",
-        bash_command=(
-            f"export PYTHONPATH={PROJECT_ROOT}/dags:{PROJECT_ROOT}/etl && "
-            f"pytest -v -s --tb=short {TESTS_DIR}/test_transform.py --cache-clear "
-            f"| tee {OUTPUT_DIR}/data_quality_report.log"
-        ),
+    check_enriched = PythonOperator(
+        task_id="check_enriched",
+        python_callable=_with_metrics(_task_check_enriched),
     )
 
     analysis = PythonOperator(
         task_id="region_weather_analysis",
-        python_callable=_task_region_analysis,
+        python_callable=_with_metrics(_task_region_analysis),
     )
 
     load = PythonOperator(
         task_id="load",
-        python_callable=_task_load,
+        python_callable=_with_metrics(_task_load),
+    )
+
+    sales_analysis = PythonOperator(
+        task_id="sales_weather_analysis",
+        python_callable=_with_metrics(_task_sales_analysis),
     )
 
-    run_load_tests = BashOperator(
-        task_id="test_load",
-        bash_command=(
-            f"export PYTHONPATH={PROJECT_ROOT}/dags:{PROJECT_ROOT}/etl && "
-            f"pytest -v -s --tb=short {TESTS_DIR}/test_load.py --cache-clear "
-            f"| tee {OUTPUT_DIR}/data_quality_report.log"
-        ),
+    check_load = PythonOperator(
+        task_id="check_load",
+        python_callable=_with_metrics(_task_check_load),
     )
 
-    run_data_quality = BashOperator(
+    data_quality_summary = PythonOperator(
         task_id="data_quality_summary",
-        bash_command=(
-            f"export PYTHONPATH={PROJECT_ROOT}/dags:{PROJECT_ROOT}/etl && "
-            f"pytest -v -s --tb=short -q {TESTS_DIR} --cache-clear "
-            f"| tee {OUTPUT_DIR}/data_quality_report.log"
-        ),
-)
+        python_callable=_with_metrics(_task_data_quality_summary),
+    )
 
     # ---------------- Dependencies ----------------
-    ensure_dirs >> extract >> run_extract_tests
-    run_extract_tests >> region_map
-    run_extract_tests >> weather_key_present >> api_integration
-    [region_map, api_integration] >> transform >> run_transform_tests
-    run_transform_tests >> analysis
-    run_transform_tests >> load >> run_load_tests
-    run_load_tests >> run_data_quality
\ No newline at end of file
+    # Region mapping and the weather fetch don't wait on each other or on the source checks
+    ensure_dirs >> [extract, region_map]
+    [extract, region_map] >> check_sources
+    extract >> weather_key_present >> plan_weather_shards >> fetch_weather >> merge_weather
+    [merge_weather, check_sources] >> transform >> check_enriched >> [analysis, load]
+    load >> [check_load, sales_analysis]
+    if SUMMARY_MODE == "incremental" or EXTRACT_MODE == "incremental":
+        # The fold writes target.db, and after a delta the summary reads it: after the load, not alongside it
+        load >> analysis
+    [analysis, check_load] >> data_quality_summary
@@ -1,22 +1,389 @@
+import json
+import sqlite3
+import logging
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
 import pandas as pd
 
+from etl.load import tune_connection
+from etl.instrumentation import instrumented
+from config.config import TARGET_DB, SQLITE_BUSY_TIMEOUT, SUMMARY_DISTINCT, SUMMARY_ROLLUPS, SUMMARY_TEMP_BIN_WIDTH
+
+logger = logging.getLogger(__name__)
+
+# Rollup -> key columns. "day" is history (one key per fold date); the others describe the current data.
+ROLLUPS = {
+    "region": ("region",),
+    "country": ("country",),
+    "day": ("day",),
+    "temp_histogram": ("region", "temp_bin"),
+}
+SNAPSHOT_ROLLUPS = ("region", "country", "temp_histogram")
+# What the snapshot rollups keep of each customer: a customer whose values differ is folded again
+SUMMARY_STATE_COLUMNS = ("region", "country", "temperature", "temp_bin")
+
+HLL_PRECISION = 14  # 16384 one-byte registers per key, ~0.8% standard error
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+def _summary_columns(enriched: pd.DataFrame) -> pd.DataFrame:
+    """The columns the summaries read, lowercased; a new frame over the same column data, not a copy."""
+    names = {c.lower(): c for c in reversed(enriched.columns)}
+    return pd.DataFrame({c: enriched[names[c]] for c in ("region", "country", "customerid", "temperature")
+                         if c in names}, copy=False)
+
+@instrumented()
 def region_weather_summary(enriched: pd.DataFrame) -> pd.DataFrame:
     """
     Summary by region:
       - unique customers
       - avg/min/max temperature
     """
-    df = enriched.copy()
-    df.columns = [c.lower() for c in df.columns]  # normalize just in case
+    df = _summary_columns(enriched)
+    return df.groupby("region", dropna=False, observed=True).agg(
+        customers=("customerid", "nunique"),
+        avg_temp_c=("temperature", "mean"),
+        min_temp_c=("temperature", "min"),
+        max_temp_c=("temperature", "max"),
+    ).reset_index()
+
+# ------------------- Incremental summary state -------------------
+def _ensure_state_tables(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather_summary_state (
+            rollup TEXT NOT NULL,
+            key TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            temp_count INTEGER NOT NULL,
+            temp_sum REAL NOT NULL,
+            temp_min REAL,
+            temp_max REAL,
+            customers INTEGER NOT NULL,
+            sketch BLOB,
+            PRIMARY KEY (rollup, key)
+        )
+    """)
+    # Each customer's row as last folded, so a changed customer's old contribution can be taken back out
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather_summary_customers (
+            customer_id TEXT PRIMARY KEY,
+            region TEXT,
+            country TEXT,
+            temperature REAL,
+            temp_bin REAL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_weather_summary_customers_region "
+                 "ON weather_summary_customers (region, temp_bin)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_weather_summary_customers_country "
+                 "ON weather_summary_customers (country)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather_summary_members (
+            rollup TEXT NOT NULL,
+            key TEXT NOT NULL,
+            customer_id TEXT NOT NULL,
+            PRIMARY KEY (rollup, key, customer_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather_summary_batches (
+            batch_id TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            folded_at TEXT NOT NULL
+        )
+    """)
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    n = np.zeros(len(x), dtype=np.uint8)
+    x = x.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+def _hll_sketches(codes: np.ndarray, customer_ids: pd.Series, n_keys: int) -> np.ndarray:
+    """One HyperLogLog register array per key code."""
+    hashes = pd.util.hash_pandas_object(customer_ids, index=False).to_numpy()
+    registers = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.intp)
+    rest_bits = 64 - HLL_PRECISION
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    ranks = (rest_bits - _bit_length(rest) + 1).astype(np.uint8)
+    sketches = np.zeros((n_keys, HLL_REGISTERS), dtype=np.uint8)
+    np.maximum.at(sketches, (codes, registers), ranks)
+    return sketches
+
+def hll_estimate(sketch: np.ndarray) -> int:
+    """Cardinality estimate of one sketch, with the small-range (linear counting) correction."""
+    m = HLL_REGISTERS
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.power(2.0, -sketch.astype(np.float64)))
+    zeros = int(np.count_nonzero(sketch == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+def _text(values: pd.Series) -> list:
+    return values.astype(object).where(values.notna(), None).tolist()
+
+def _stage_incoming(conn: sqlite3.Connection, chunks: Iterable[pd.DataFrame], bin_width: float) -> int:
+    """Copy the rows to fold into a temp table, one per customer (the last one wins); return the row count."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS summary_incoming (customer_id TEXT PRIMARY KEY, "
+                 "region TEXT, country TEXT, temperature REAL, temp_bin REAL)")
+    conn.execute("DELETE FROM summary_incoming")
+    total = 0
+    for chunk in chunks:
+        df = _summary_columns(chunk).reindex(columns=["customerid", "region", "country", "temperature"])
+        null_ids = df["customerid"].isna()
+        if null_ids.any():
+            logger.warning("Skipping %d rows without a customer id in the summary fold", int(null_ids.sum()))
+            df = df[~null_ids]
+        # Sums over many float32 readings are accumulated in float64
+        temperature = df["temperature"].to_numpy(dtype=np.float64)
+        conn.executemany("INSERT OR REPLACE INTO summary_incoming VALUES (?, ?, ?, ?, ?)", zip(
+            df["customerid"].astype(str).tolist(), _text(df["region"]), _text(df["country"]),
+            temperature.tolist(), (np.floor(temperature / bin_width) * bin_width).tolist()))
+        total += len(df)
+    return total
+
+def _changes(conn: sqlite3.Connection, complete: bool) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The staged rows of new or changed customers (added), and the stored rows they replace (removed).
+    With `complete`, stored customers missing from the staged rows are removed too.
+    """
+    columns = SUMMARY_STATE_COLUMNS
+    changed = pd.read_sql(f"""
+        SELECT i.customer_id AS customerid, {', '.join(f'i.{c}' for c in columns)},
+               c.customer_id IS NOT NULL AS stored, {', '.join(f'c.{c} AS old_{c}' for c in columns)}
+        FROM summary_incoming i LEFT JOIN weather_summary_customers c ON c.customer_id = i.customer_id
+        WHERE c.customer_id IS NULL OR {' OR '.join(f'c.{c} IS NOT i.{c}' for c in columns)}
+    """, conn)
+    added = changed[["customerid", *columns]]
+    removed = changed.loc[changed["stored"].astype(bool), ["customerid", *(f"old_{c}" for c in columns)]]
+    removed.columns = ["customerid", *columns]
+    if complete:
+        gone = pd.read_sql(f"""
+            SELECT customer_id AS customerid, {', '.join(columns)} FROM weather_summary_customers c
+            WHERE NOT EXISTS (SELECT 1 FROM summary_incoming i WHERE i.customer_id = c.customer_id)
+        """, conn)
+        removed = pd.concat([removed, gone], ignore_index=True) if len(gone) else removed
+    return added, removed
+
+def _store_customers(conn: sqlite3.Connection, complete: bool):
+    """Bring the stored customer rows in line with the staged ones (see _changes)."""
+    conn.execute(f"""
+        INSERT OR REPLACE INTO weather_summary_customers
+        SELECT * FROM summary_incoming i WHERE NOT EXISTS (
+            SELECT 1 FROM weather_summary_customers c WHERE c.customer_id = i.customer_id
+            AND {' AND '.join(f'c.{c} IS i.{c}' for c in SUMMARY_STATE_COLUMNS)})
+    """)
+    if complete:
+        conn.execute("DELETE FROM weather_summary_customers WHERE customer_id NOT IN "
+                     "(SELECT customer_id FROM summary_incoming)")
+
+def _encode_keys(values: pd.DataFrame) -> list[str]:
+    # JSON arrays keep multi-column keys and missing values (null) unambiguous
+    return [json.dumps([None if pd.isna(v) else (v.item() if hasattr(v, "item") else v) for v in row])
+            for row in values.itertuples(index=False)]
+
+def _aggregate(rows: pd.DataFrame, columns: list[str]) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """Key strings, each row's key code, and per key code: rows, temperature count/sum/min/max."""
+    codes = rows.groupby(columns, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    _, first = np.unique(codes, return_index=True)
+    key_strings = _encode_keys(rows[columns].iloc[first])
+    temperature = pd.Series(rows["temperature"].to_numpy(dtype=np.float64), name="t")
+    agg = temperature.groupby(codes).agg(["size", "count", "sum", "min", "max"]).reindex(range(len(key_strings)))
+    return key_strings, codes, agg.to_numpy(dtype=np.float64)
+
+NO_ROWS = np.array([0, 0, 0, np.nan, np.nan])
+
+def _fold_rollup(conn: sqlite3.Connection, added: pd.DataFrame, removed: pd.DataFrame, rollup: str,
+                 distinct: str) -> set[str]:
+    """
+    Add one rollup's aggregates over the added rows to the stored state of the touched keys, less those over
+    the removed rows. Returns the keys whose min or max a removed reading may have held; see _refresh_extremes.
+    """
+    columns = list(ROLLUPS[rollup])
+    keys_in, codes_in, agg_in = _aggregate(added, columns)
+    keys_out, _, agg_out = _aggregate(removed, columns)
+    incoming, outgoing = dict(zip(keys_in, agg_in)), dict(zip(keys_out, agg_out))
+    touched = list(dict.fromkeys(keys_in + keys_out))
+    stored = _stored_state(conn, rollup, touched)
+
+    # Snapshot rollups hold one row per customer, so their row count is the customer count
+    snapshot = rollup in SNAPSHOT_ROLLUPS
+    if not snapshot and distinct == "hll":
+        sketches = dict(zip(keys_in, _hll_sketches(codes_in, added["customerid"], len(keys_in))))
+    elif not snapshot:
+        members = pd.DataFrame({"key": np.asarray(keys_in, dtype=object)[codes_in],
+                                "customer_id": added["customerid"].astype(str).to_numpy()}).drop_duplicates()
+        new_members = _add_members(conn, rollup, members)
+
+    upserts, deletes, extremes = [], [], set()
+    for key in touched:
+        old = stored.get(key)
+        if old is not None and not snapshot and (old["sketch"] is None) != (distinct == "exact"):
+            raise ValueError(f"Summary state for '{rollup}' was built with another SUMMARY_DISTINCT mode; "
+                             "rebuild it")
+        old_min = np.nan if old is None or old["temp_min"] is None else old["temp_min"]
+        old_max = np.nan if old is None or old["temp_max"] is None else old["temp_max"]
+        plus, minus = incoming.get(key, NO_ROWS), outgoing.get(key, NO_ROWS)
+        rows = (old["rows"] if old else 0) + int(plus[0]) - int(minus[0])
+        if rows <= 0:
+            deletes.append((rollup, key))
+            continue
+        temp_count = (old["temp_count"] if old else 0) + int(plus[1]) - int(minus[1])
+        temp_sum = (old["temp_sum"] if old else 0.0) + np.nan_to_num(plus[2]) - np.nan_to_num(minus[2])
+        temp_min, temp_max = np.fmin(old_min, plus[3]), np.fmax(old_max, plus[4])
+        if minus[3] <= old_min or minus[4] >= old_max:
+            extremes.add(key)
+        if temp_count == 0:
+            temp_sum, temp_min, temp_max = 0.0, np.nan, np.nan
+
+        sketch = None
+        if snapshot:
+            customers = rows
+        elif distinct == "hll":
+            merged = sketches[key].copy()
+            if old is not None:
+                np.maximum(merged, np.frombuffer(old["sketch"], dtype=np.uint8), out=merged)
+            sketch, customers = merged.tobytes(), hll_estimate(merged)
+        else:
+            customers = (old["customers"] if old else 0) + new_members.get(key, 0)
+        upserts.append((rollup, key, rows, temp_count, float(temp_sum),
+                        None if np.isnan(temp_min) else float(temp_min),
+                        None if np.isnan(temp_max) else float(temp_max), customers, sketch))
+
+    conn.executemany("INSERT OR REPLACE INTO weather_summary_state (rollup, key, rows, temp_count, temp_sum, "
+                     "temp_min, temp_max, customers, sketch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+    conn.executemany("DELETE FROM weather_summary_state WHERE rollup = ? AND key = ?", deletes)
+    return extremes - {key for _, key in deletes}
+
+def _refresh_extremes(conn: sqlite3.Connection, rollup: str, keys: set[str]):
+    """Recompute min/max of snapshot keys from the stored customer rows, after a removal at an extreme."""
+    where = " AND ".join(f"{c} IS ?" for c in ROLLUPS[rollup])
+    for key in keys:
+        low, high = conn.execute(f"SELECT MIN(temperature), MAX(temperature) FROM weather_summary_customers "
+                                 f"WHERE {where}", json.loads(key)).fetchone()
+        conn.execute("UPDATE weather_summary_state SET temp_min = ?, temp_max = ? WHERE rollup = ? AND key = ?",
+                     (low, high, rollup, key))
+
+def _stored_state(conn: sqlite3.Connection, rollup: str, key_strings: list[str]) -> dict[str, dict]:
+    stored = {}
+    # SQLite caps the number of bound parameters, so look keys up in chunks
+    for start in range(0, len(key_strings), 400):
+        chunk = key_strings[start:start + 400]
+        cursor = conn.execute(
+            "SELECT key, rows, temp_count, temp_sum, temp_min, temp_max, customers, sketch "
+            f"FROM weather_summary_state WHERE rollup = ? AND key IN ({', '.join('?' * len(chunk))})",
+            [rollup, *chunk],
+        )
+        names = [d[0] for d in cursor.description]
+        stored.update({row[0]: dict(zip(names, row)) for row in cursor})
+    return stored
+
+def _add_members(conn: sqlite3.Connection, rollup: str, members: pd.DataFrame) -> dict[str, int]:
+    """Record (key, customer) pairs; return how many were new per key."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS summary_delta (key TEXT, customer_id TEXT, "
+                 "PRIMARY KEY (key, customer_id))")
+    conn.execute("DELETE FROM summary_delta")
+    conn.executemany("INSERT OR IGNORE INTO summary_delta VALUES (?, ?)",
+                     zip(members["key"], members["customer_id"]))
+    new = dict(conn.execute("""
+        SELECT d.key, COUNT(*) FROM summary_delta d
+        WHERE NOT EXISTS (SELECT 1 FROM weather_summary_members m
+                          WHERE m.rollup = ? AND m.key = d.key AND m.customer_id = d.customer_id)
+        GROUP BY d.key
+    """, (rollup,)).fetchall())
+    conn.execute("INSERT OR IGNORE INTO weather_summary_members SELECT ?, key, customer_id FROM summary_delta",
+                 (rollup,))
+    return new
+
+def _drop_state(conn: sqlite3.Connection, as_of: date | None = None):
+    """Drop the snapshot rollups and the stored customer rows, and the `as_of` day key if given."""
+    snapshot = ", ".join("?" * len(SNAPSHOT_ROLLUPS))
+    for table in ("weather_summary_state", "weather_summary_members"):
+        conn.execute(f"DELETE FROM {table} WHERE rollup IN ({snapshot}) OR (rollup = 'day' AND key = ?)",
+                     (*SNAPSHOT_ROLLUPS, json.dumps([as_of.isoformat()]) if as_of else None))
+    conn.execute("DELETE FROM weather_summary_customers")
+
+def fold_weather_summary(enriched: pd.DataFrame | Iterable[pd.DataFrame], db_path: Path = TARGET_DB,
+                         complete: bool = False, rebuild: bool = False, batch_id: str | None = None,
+                         as_of: date | None = None, rollups: list[str] = SUMMARY_ROLLUPS,
+                         distinct: str = SUMMARY_DISTINCT, bin_width: float = SUMMARY_TEMP_BIN_WIDTH) -> bool:
+    """
+    Fold enriched rows (a DataFrame or a chunk stream) into the stored per-rollup summary state.
+    The state keeps every customer's last folded row: only new and changed customers are folded, and a changed
+    customer's old row is taken back out first. `complete` says the rows are all current customers, so stored
+    customers missing from them are taken out too (a full extract). "day" keys count the rows folded that day.
+    `rebuild` first drops the snapshot rollups and today's day key. A `batch_id` that was already folded is
+    skipped. Returns whether the batch was folded.
+    """
+    unknown = set(rollups) - set(ROLLUPS)
+    if unknown:
+        raise ValueError(f"Unknown summary rollups {sorted(unknown)}, expected some of {list(ROLLUPS)}")
+    if distinct not in ("exact", "hll"):
+        raise ValueError(f"Unsupported SUMMARY_DISTINCT '{distinct}', expected 'exact' or 'hll'")
+    as_of = as_of or datetime.now(timezone.utc).date()
+    chunks = [enriched] if isinstance(enriched, pd.DataFrame) else enriched
 
-    grouped = df.groupby("region", dropna=False)
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        tune_connection(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        _ensure_state_tables(conn)
+        if batch_id is not None and conn.execute("SELECT 1 FROM weather_summary_batches WHERE batch_id = ?",
+                                                 (batch_id,)).fetchone():
+            logger.info("Summary batch %s was already folded, skipping", batch_id)
+            conn.execute("ROLLBACK")
+            return False
+        if rebuild:
+            _drop_state(conn, as_of)
+            conn.execute("DELETE FROM weather_summary_batches")
+        elif (conn.execute("SELECT 1 FROM weather_summary_state WHERE rollup != 'day' LIMIT 1").fetchone()
+              and not conn.execute("SELECT 1 FROM weather_summary_customers LIMIT 1").fetchone()):
+            logger.warning("Summary state has no customer rows to correct changes against, rebuilding it")
+            _drop_state(conn)
 
-    summary = pd.DataFrame({
-        "region": grouped.size().index,
-        "customers": grouped["customerid"].nunique().values,
-        "avg_temp_c": grouped["temperature"].mean().values,
-        "min_temp_c": grouped["temperature"].min().values,
-        "max_temp_c": grouped["temperature"].max().values,
-    })
+        staged = _stage_incoming(conn, chunks, bin_width)
+        added, removed = _changes(conn, complete)
+        if len(added) or len(removed):
+            added = added.assign(day=as_of.isoformat())
+            # "day" is history: nothing is taken back out of it
+            extremes = {rollup: _fold_rollup(conn, added, removed if rollup in SNAPSHOT_ROLLUPS else added.iloc[:0],
+                                             rollup, distinct) for rollup in rollups}
+            _store_customers(conn, complete)
+            for rollup, keys in extremes.items():
+                _refresh_extremes(conn, rollup, keys)
+        if batch_id is not None:
+            conn.execute("INSERT INTO weather_summary_batches VALUES (?, ?, ?)",
+                         (batch_id, staged, datetime.now(timezone.utc).isoformat()))
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info("Folded %d changed and %d removed customers (of %d rows) into %d summary rollups",
+                len(added), len(removed), staged, len(rollups))
+    return True
 
-    return summary
\ No newline at end of file
+def read_weather_summary(rollup: str = "region", db_path: Path = TARGET_DB) -> pd.DataFrame:
+    """Summary of one rollup from the stored state, shaped like region_weather_summary."""
+    columns = list(ROLLUPS[rollup])
+    with sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT) as conn:
+        _ensure_state_tables(conn)
+        state = pd.read_sql(
+            "SELECT key, customers, temp_count, temp_sum, temp_min, temp_max FROM weather_summary_state "
+            "WHERE rollup = ?", conn, params=(rollup,))
+    keys = pd.DataFrame([json.loads(k) for k in state["key"]], columns=columns)
+    keys = keys.where(keys.notna(), np.nan)  # null keys read back as NaN, as groupby reports them
+    summary = pd.concat([keys, pd.DataFrame({
+        "customers": state["customers"].astype("int64"),
+        "avg_temp_c": state["temp_sum"].where(state["temp_count"] > 0) / state["temp_count"],
+        "min_temp_c": state["temp_min"].astype("float64"),
+        "max_temp_c": state["temp_max"].astype("float64"),
+    })], axis=1)
+    return summary.sort_values(columns, na_position="last", kind="stable", ignore_index=True)
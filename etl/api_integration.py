@@ -1,58 +1,72 @@
 import os
-import time
 import logging
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-import requests
 import yaml
 from unidecode import unidecode
-from config.config import CONFIG_DIR
+from config.config import COUNTRY_MAPPING_YAML, CITY_MAPPING_YAML, WEATHER_CACHE_TTL_MINUTES, OPENWEATHER_GROUP_MODE
+from etl.weather_client import WeatherClient
+from etl.weather_cache import WeatherCache
+from etl.weather_checkpoint import WeatherCheckpoint
+from etl.city_index import CityIdIndex
+from etl.instrumentation import instrumented
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# ---------------- Paths ----------------
-COUNTRY_MAPPING_PATH = CONFIG_DIR / "country_code_mapping.yaml"
-CITY_MAPPING_PATH = CONFIG_DIR / "city_name_mapping.yaml"
+# ---------------- Mappings ----------------
+# Loaded on first use rather than at import, so importing this module stays cheap and can't fail
+@lru_cache(maxsize=None)
+def country_lookup() -> dict[str, str]:
+    """Lowercased country name -> code, plus accent-folded names where they don't collide."""
+    if not COUNTRY_MAPPING_YAML.exists():
+        raise FileNotFoundError(f"Country mapping file not found at {COUNTRY_MAPPING_YAML}")
+    with open(COUNTRY_MAPPING_YAML, "r") as f:
+        country_mapping_raw = yaml.safe_load(f) or {}
+    country_mapping = {k.strip().lower(): v for k, v in country_mapping_raw.items()}
+    logger.info(f"Loaded country codes for {len(country_mapping)} countries")
 
-# ---------------- Load country mapping ----------------
-if not COUNTRY_MAPPING_PATH.exists():
-    raise FileNotFoundError(f"Country mapping file not found at {COUNTRY_MAPPING_PATH}")
+    lookup = dict(country_mapping)
+    for key, code in country_mapping.items():
+        lookup.setdefault(unidecode(key), code)
+    return lookup
 
-with open(COUNTRY_MAPPING_PATH, "r") as f:
-    country_mapping_raw = yaml.safe_load(f) or {}
-
-# Normalize country keys
-country_mapping = {k.strip().lower(): v for k, v in country_mapping_raw.items()}
-logger.info(f"Loaded country codes for {len(country_mapping)} countries")
-
-# ---------------- Load city mapping ----------------
-if not CITY_MAPPING_PATH.exists():
-    logger.warning(f"City mapping file not found at {CITY_MAPPING_PATH}, proceeding without it.")
-    city_name_mapping = {}
-else:
-    with open(CITY_MAPPING_PATH, "r") as f:
+@lru_cache(maxsize=None)
+def city_name_mapping() -> dict[str, str]:
+    """Lowercased city name -> the name OpenWeather knows it by."""
+    if not CITY_MAPPING_YAML.exists():
+        logger.warning(f"City mapping file not found at {CITY_MAPPING_YAML}, proceeding without it.")
+        return {}
+    with open(CITY_MAPPING_YAML, "r") as f:
         city_mapping_yaml = yaml.safe_load(f) or {}
     # Keep keys lowercase for matching
-    city_name_mapping = {k.strip().lower(): v for k, v in city_mapping_yaml.get("city_name_mapping", {}).items()}
-    logger.info(f"Loaded city mappings for {len(city_name_mapping)} cities")
+    mapping = {k.strip().lower(): v for k, v in city_mapping_yaml.get("city_name_mapping", {}).items()}
+    logger.info(f"Loaded city mappings for {len(mapping)} cities")
+    return mapping
 
 # ---------------- Functions ----------------
+@lru_cache(maxsize=None)
+def _transliterate(text: str) -> str:
+    """Memoized unidecode; the same few hundred names repeat across millions of rows."""
+    return unidecode(text)
+
+def _lookup_country_code(country_name) -> str | None:
+    """Country code for a name, without logging; None for invalid or unknown names."""
+    if not isinstance(country_name, str) or not country_name.strip():
+        return None
+    key = country_name.strip().lower()
+    lookup = country_lookup()
+    return lookup.get(key) or lookup.get(_transliterate(key))
+
 def get_country_code(country_name: str):
     """Return 2-letter country code from full country name, case-insensitive."""
     if not isinstance(country_name, str) or not country_name.strip():
         logger.warning(f"Invalid or missing country name: {country_name}")
         return None
 
-    key = country_name.strip().lower()
-    code = country_mapping.get(key)
-
-    if not code:
-        # Try ASCII normalization
-        code = country_mapping.get(unidecode(key))
+    code = _lookup_country_code(country_name)
     if not code:
         logger.warning(f"Unknown country: '{country_name}' — please update country_code_mapping.yaml")
-        logger.debug(f"Available keys: {list(country_mapping.keys())}")
     return code
 
 def normalize_city_name(city: str) -> str:
@@ -60,91 +74,220 @@ def normalize_city_name(city: str) -> str:
     if not city or not isinstance(city, str):
         return city
     city_key = city.strip().lower()
-    if city_key in city_name_mapping:
-        return city_name_mapping[city_key]
-    return unidecode(city.strip())
+    mapping = city_name_mapping()
+    if city_key in mapping:
+        return mapping[city_key]
+    return _transliterate(city.strip())
+
+def _take(values: list, codes: np.ndarray) -> np.ndarray:
+    """Map per-unique results back to rows; factorize's -1 (missing) code picks the trailing None."""
+    return np.array(values + [None], dtype=object).take(codes)
+
+def normalize_locations(cities: pd.Series, countries: pd.Series) -> pd.DataFrame:
+    """
+    Column-level normalize_city_name/get_country_code.
+    Each distinct City/Country is resolved once and mapped back to the rows with a single take;
+    unknown countries are reported in one aggregated warning.
+    """
+    city_codes, city_uniques = pd.factorize(cities)
+    country_codes, country_uniques = pd.factorize(countries)
+    resolved = [_lookup_country_code(c) for c in country_uniques]
+
+    rows_per_country = np.bincount(country_codes[country_codes >= 0], minlength=len(country_uniques))
+    unknown = {name: int(n) for name, code, n in zip(country_uniques, resolved, rows_per_country)
+               if code is None}
+    n_missing = int((country_codes == -1).sum())
+    if n_missing:
+        unknown["<missing>"] = n_missing
+    if unknown:
+        logger.warning(f"Unknown or invalid countries in {sum(unknown.values())} rows "
+                       f"— please update country_code_mapping.yaml: {unknown}")
+
+    return pd.DataFrame({
+        "CityAPI": _take([normalize_city_name(c) for c in city_uniques], city_codes),
+        "CountryCode": _take(resolved, country_codes),
+    }, index=cities.index)
 
-def fetch_weather(city: str, country_code: str):
-    """Call OpenWeather API for a given city and country code."""
+def _strip_column(values: pd.Series) -> pd.Series:
+    """Equivalent of values.astype(str).str.strip(), computed on the unique values only."""
+    codes, uniques = pd.factorize(values)
+    stripped = _take([str(v).strip() for v in uniques], codes)
+    missing = codes == -1
+    if missing.any():
+        # None and NaN stringify differently, so missing values are converted row by row
+        stripped[missing] = [str(v) for v in values[missing]]
+    return pd.Series(stripped, index=values.index, name=values.name)
+
+def _open_cache() -> WeatherCache | None:
+    """Open the default on-disk weather cache, unless it is disabled by a zero TTL."""
+    return WeatherCache() if WEATHER_CACHE_TTL_MINUTES > 0 else None
+
+def _fetch_missing(client: WeatherClient, keys: list[tuple[str, str]], index: CityIdIndex | None,
+                   checkpoint: WeatherCheckpoint | None = None) -> dict:
+    """Fetch cities with a known OpenWeather id in group calls, the rest one by one, journaling each as it lands."""
+    fetched = {}
+    if index is not None:
+        by_id = {}
+        for key in keys:
+            city_id = index.get(*key)
+            if city_id is not None:
+                by_id.setdefault(city_id, []).append(key)
+
+        def record_group(city_id, payload):
+            for key in by_id.get(city_id, []):
+                checkpoint.record(key, payload)
+
+        on_group = record_group if checkpoint is not None else None
+        for city_id, payload in client.fetch_group(list(by_id), on_result=on_group).items():
+            for key in by_id.get(city_id, []):
+                fetched[key] = payload
+
+    # Per-city fallback for unresolved ids; the responses resolve them for the next run
+    remaining = [key for key in keys if key not in fetched]
+    record = checkpoint.record if checkpoint is not None else None
+    for key, payload in zip(remaining, client.fetch_many(remaining, on_result=record)):
+        fetched[key] = payload
+        if index is not None and payload and payload.get("id") is not None:
+            index.add(*key, payload["id"])
+    if index is not None:
+        index.save()
+    return fetched
+
+def fetch_weather(city: str, country_code: str, cache: WeatherCache | None = None):
+    """Call OpenWeather API for a given city and country code, consulting the weather cache first."""
     if not city or not country_code:
         return None
 
     city_api = normalize_city_name(city)
-    api_key = os.getenv("OPENWEATHER_API_KEY")
-    if not api_key:
-        raise EnvironmentError("OPENWEATHER_API_KEY not found in environment variables.")
-    
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city_api},{country_code}&appid={api_key}&units=metric"
+    own_cache = cache is None
+    cache = _open_cache() if own_cache else cache
     try:
-        resp = requests.get(url)
-        resp.raise_for_status()
-        return resp.json()
-    except requests.RequestException as e:
-        logger.error(f"Error fetching weather for '{city}' ({country_code}): {e}")
-        return None
-
-def enrich_with_weather(customers_df: pd.DataFrame, api_key: str | None = None) -> pd.DataFrame:
-    """Enrich customers_df with weather data from OpenWeather."""
-    if customers_df is None or customers_df.empty:
-        logger.warning("Input DataFrame is empty or None, skipping weather enrichment.")
-        return customers_df
+        if cache is not None:
+            cached = cache.get(city_api, country_code)
+            if cached is not None:
+                return cached
 
-    if "City" not in customers_df.columns or "Country" not in customers_df.columns:
-        raise ValueError("Input DataFrame must contain 'City' and 'Country' columns")
-
-    # Use provided api_key or fallback to environment variable
-    if api_key is None:
         api_key = os.getenv("OPENWEATHER_API_KEY")
-    if not api_key:
-        raise EnvironmentError("OPENWEATHER_API_KEY not found in environment variables.")
+        if not api_key:
+            raise EnvironmentError("OPENWEATHER_API_KEY not found in environment variables.")
+        with WeatherClient(api_key) as client:
+            weather_json = client.current_weather(city_api, country_code)
+        if weather_json is not None and cache is not None:
+            cache.put(city_api, country_code, weather_json)
+        return weather_json
+    finally:
+        if own_cache and cache is not None:
+            cache.close()
 
-    # Trim whitespace
-    customers_df["City"] = customers_df["City"].astype(str).str.strip()
-    customers_df["Country"] = customers_df["Country"].astype(str).str.strip()
+def strip_locations(customers_df: pd.DataFrame) -> pd.DataFrame:
+    """Trim whitespace from City/Country in place, once per distinct value."""
+    customers_df["City"] = _strip_column(customers_df["City"])
+    customers_df["Country"] = _strip_column(customers_df["Country"])
+    return customers_df
 
-    unique_cities = customers_df[["City", "Country"]].drop_duplicates()
+@instrumented()
+def weather_for_locations(unique_cities: pd.DataFrame, api_key: str | None = None,
+                          client: WeatherClient | None = None,
+                          cache: WeatherCache | None = None,
+                          index: CityIdIndex | None = None, observations: bool = False,
+                          checkpoint: WeatherCheckpoint | None = None) -> pd.DataFrame:
+    """
+    Weather for distinct, stripped (City, Country) pairs as City, Country, Weather, Temperature.
+    With `observations`, also the CityID and ObservedAt (UTC) of each reading, for the weather history.
+    With a `checkpoint`, cities an earlier attempt already fetched are taken from it, and new ones are journaled.
+    """
+    locations = normalize_locations(unique_cities["City"], unique_cities["Country"])
+    requested = []
     weather_data = []
     skipped_rows = []
 
-    calls_made = 0
-    for _, row in unique_cities.iterrows():
-        city = row["City"]
-        country_name = row["Country"]
-
-        country_code = get_country_code(country_name)
+    for city, country_name, city_api, country_code in zip(
+            unique_cities["City"], unique_cities["Country"], locations["CityAPI"], locations["CountryCode"]):
         if not country_code or not city:
             skipped_rows.append((city, country_name))
             continue
+        requested.append((city, country_name, city_api, country_code))
 
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={normalize_city_name(city)},{country_code}&appid={api_key}&units=metric"
-        try:
-            resp = requests.get(url)
-            resp.raise_for_status()
-            weather_json = resp.json()
-        except requests.RequestException as e:
-            logger.error(f"Error fetching weather for '{city}' ({country_name}): {e}")
-            continue
+    # Serve fresh cities from the cache; only the misses go to the API
+    own_cache = cache is None
+    cache = _open_cache() if own_cache else cache
+    keys = list(dict.fromkeys((city_api, code) for _, _, city_api, code in requested))
+    found = cache.get_many(keys) if cache is not None else {}
+    missing = [key for key in keys if key not in found]
+    resumed = checkpoint.done(missing) if checkpoint is not None and missing else {}
+    missing = [key for key in missing if key not in resumed]
+
+    # Fetch concurrently; the client's token bucket keeps us at the plan's quota ceiling
+    own_client = client is None
+    if missing:
+        client = client or WeatherClient(api_key)
+        if index is None and OPENWEATHER_GROUP_MODE:
+            index = CityIdIndex()
+    try:
+        fetched = _fetch_missing(client, missing, index, checkpoint) if missing else {}
+        if cache is not None:
+            # Only this attempt's readings: replayed ones would be cached as fresh and outlive their TTL
+            cache.put_many({key: payload for key, payload in fetched.items() if payload is not None})
+            cache.log_stats()
+        fetched.update(resumed)
+    finally:
+        if own_client and client is not None:
+            client.close()
+        if own_cache and cache is not None:
+            cache.close()
+    results = {**fetched, **found}
+    fetched_at = pd.Timestamp.now(tz="UTC").floor("s")
 
-        weather_data.append({
+    for city, country_name, city_api, country_code in requested:
+        weather_json = results.get((city_api, country_code))
+        if weather_json is None:
+            continue
+        record = {
             "City": city,
             "Country": country_name,
             "Weather": weather_json.get("weather", [{}])[0].get("description"),
             "Temperature": weather_json.get("main", {}).get("temp")
-        })
-
-        calls_made += 1
-        if calls_made % 60 == 0:
-            logger.info("API rate limit reached — waiting 60 seconds...")
-            time.sleep(60)
+        }
+        if observations:
+            record["CityID"] = weather_json.get("id")
+            # "dt" is when OpenWeather took the reading; cached payloads keep their original time
+            observed = weather_json.get("dt")
+            record["ObservedAt"] = pd.Timestamp(observed, unit="s", tz="UTC") if observed else fetched_at
+        weather_data.append(record)
 
     if skipped_rows:
         logger.warning(f"Skipped {len(skipped_rows)} cities due to missing or invalid data: {skipped_rows}")
 
     if not weather_data:
         logger.warning("No weather data collected — check mappings and API responses.")
-        weather_df = pd.DataFrame(columns=["City", "Country", "Weather", "Temperature"])
-    else:
-        weather_df = pd.DataFrame(weather_data)
+        columns = ["City", "Country", "Weather", "Temperature"]
+        return pd.DataFrame(columns=columns + (["CityID", "ObservedAt"] if observations else []))
+    return pd.DataFrame(weather_data)
+
+@instrumented()
+def enrich_with_weather(customers_df: pd.DataFrame, api_key: str | None = None,
+                        client: WeatherClient | None = None,
+                        cache: WeatherCache | None = None,
+                        index: CityIdIndex | None = None,
+                        checkpoint: WeatherCheckpoint | None = None) -> pd.DataFrame:
+    """Enrich customers_df with weather data from OpenWeather; a `checkpoint` makes retries resume."""
+    if customers_df is None or customers_df.empty:
+        logger.warning("Input DataFrame is empty or None, skipping weather enrichment.")
+        return customers_df
+
+    if "City" not in customers_df.columns or "Country" not in customers_df.columns:
+        raise ValueError("Input DataFrame must contain 'City' and 'Country' columns")
+
+    # Use provided api_key or fallback to environment variable
+    if api_key is None:
+        api_key = os.getenv("OPENWEATHER_API_KEY")
+    if not api_key and client is None:
+        raise EnvironmentError("OPENWEATHER_API_KEY not found in environment variables.")
+
+    strip_locations(customers_df)
+    unique_cities = customers_df[["City", "Country"]].drop_duplicates()
+    weather_df = weather_for_locations(unique_cities, api_key, client=client, cache=cache, index=index,
+                                       checkpoint=checkpoint)
 
     merged_df = customers_df.merge(weather_df, on=["City", "Country"], how="left")
-    return merged_df
\ No newline at end of file
+    return merged_df
@@ -0,0 +1,58 @@
+import os
+import logging
+from pathlib import Path
+
+import yaml
+
+from config.config import CITY_ID_INDEX_YAML
+
+logger = logging.getLogger(__name__)
+
+
+class CityIdIndex:
+    """(normalized city, country code) -> OpenWeather city id, persisted as YAML next to the city mapping."""
+
+    def __init__(self, path: Path = CITY_ID_INDEX_YAML):
+        self.path = Path(path)
+        self._ids: dict[str, int] = self._read()
+        self._added: dict[str, int] = {}
+        if self._ids:
+            logger.info(f"Loaded OpenWeather ids for {len(self._ids)} cities")
+
+    def _read(self) -> dict[str, int]:
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r") as f:
+            return (yaml.safe_load(f) or {}).get("city_id_index", {}) or {}
+
+    @staticmethod
+    def _key(city: str, country_code: str) -> str:
+        return f"{city},{country_code}"
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, city: str, country_code: str) -> int | None:
+        return self._ids.get(self._key(city, country_code))
+
+    def add(self, city: str, country_code: str, city_id: int):
+        key = self._key(city, country_code)
+        if self._ids.get(key) != city_id:
+            self._ids[key] = self._added[key] = int(city_id)
+
+    def save(self):
+        """
+        Write ids resolved since loading back to disk.
+        The file is re-read and merged first, so parallel weather shards don't drop each other's ids.
+        """
+        if not self._added:
+            return
+        self._ids = {**self._read(), **self._added}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write("# Generated by etl/city_index.py: resolved OpenWeather city ids for the group endpoint.\n")
+            yaml.safe_dump({"city_id_index": dict(sorted(self._ids.items()))}, f, allow_unicode=True)
+        os.replace(tmp_path, self.path)
+        self._added = {}
+        logger.info(f"Saved OpenWeather ids for {len(self._ids)} cities to {self.path}")
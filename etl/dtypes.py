@@ -0,0 +1,57 @@
+"""
+Compact in-memory dtypes for the pipeline's DataFrames, from the `dtypes` policy in schema_config.yaml.
+A Python string costs ~50 bytes plus a pointer per value; an Arrow string its UTF-8 bytes plus a 4-byte
+offset, a categorical code 1-2 bytes.
+"""
+from functools import lru_cache
+
+import pandas as pd
+import pyarrow as pa
+import yaml
+
+from config.config import SCHEMA_CONFIG_YAML, MEMORY_DTYPES
+
+STRING_DTYPE = pd.StringDtype("pyarrow")
+# Arrow -> pandas conversion of staged text straight into Arrow-backed strings, without Python objects
+ARROW_TYPES = {pa.string(): STRING_DTYPE, pa.large_string(): STRING_DTYPE}
+
+
+@lru_cache(maxsize=None)
+def dtype_policy() -> dict[str, str]:
+    """Column name -> declared dtype."""
+    with open(SCHEMA_CONFIG_YAML, "r") as f:
+        declared = (yaml.safe_load(f) or {}).get("dtypes", {})
+    return {column: dtype for dtype, columns in declared.items() for column in columns}
+
+def _matches(dtype, target: str) -> bool:
+    if target == "category":
+        return isinstance(dtype, pd.CategoricalDtype)
+    return dtype == pd.api.types.pandas_dtype(target)
+
+def target_dtypes(df: pd.DataFrame) -> dict[str, str]:
+    """The conversions the policy asks for, for the columns of df not already of their dtype."""
+    policy = dtype_policy()
+    targets = {}
+    for column, dtype in df.dtypes.items():
+        target = policy.get(column)
+        if target is None and (dtype == object or isinstance(dtype, pd.StringDtype)):
+            target = "string[pyarrow]"
+        if target is not None and not _matches(dtype, target):
+            targets[column] = target
+    return targets
+
+def apply_dtypes(df: pd.DataFrame, enabled: bool = MEMORY_DTYPES) -> pd.DataFrame:
+    """df with the policy's dtypes; the columns that already have theirs are shared, not copied."""
+    targets = target_dtypes(df) if enabled else {}
+    if not targets:
+        return df
+    converted = df.copy(deep=False)
+    for column, dtype in targets.items():
+        converted[column] = df[column].astype(dtype)
+    return converted
+
+def arrow_to_pandas(table: pa.Table, enabled: bool = MEMORY_DTYPES) -> pd.DataFrame:
+    """A staged Arrow table or batch as a DataFrame with the policy's dtypes."""
+    if not enabled:
+        return table.to_pandas()
+    return apply_dtypes(table.to_pandas(types_mapper=ARROW_TYPES.get))
@@ -0,0 +1,145 @@
+import json
+import hashlib
+import sqlite3
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+from config import config
+from config.config import (
+    TARGET_DB,
+    SQLITE_BUSY_TIMEOUT,
+    NORTHWIND_DB,
+    REGION_MAPPING_XLSX,
+    COUNTRY_MAPPING_YAML,
+    CITY_MAPPING_YAML,
+    SCHEMA_CONFIG_YAML,
+)
+from etl.extract import connect_source, source_tables
+
+logger = logging.getLogger(__name__)
+
+# Files the pipeline's outputs depend on besides the source tables and the weather.
+# city_id_index.yaml is left out: it caches OpenWeather's city ids, which change how weather is fetched, not what.
+INPUT_FILES = [REGION_MAPPING_XLSX, COUNTRY_MAPPING_YAML, CITY_MAPPING_YAML, SCHEMA_CONFIG_YAML]
+# The weather is fingerprinted by content, so the settings for fetching it are left out of the config's hash
+WEATHER_SETTINGS = ("OPENWEATHER_", "WEATHER_")
+CODE_DIR = Path(__file__).parent
+
+def digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+def _connect(state_db: Path) -> sqlite3.Connection:
+    Path(state_db).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(state_db, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS etl_file_hashes (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS etl_stage_fingerprints (
+            stage TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            result TEXT,
+            run_id TEXT,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    return conn
+
+# ------------------- Inputs -------------------
+def file_hash(path: Path, state_db: Path = TARGET_DB) -> str | None:
+    """SHA-256 of a file's content, re-read only when its mtime or size changed since it was last hashed."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    conn = _connect(state_db)
+    try:
+        row = conn.execute("SELECT mtime_ns, size, sha256 FROM etl_file_hashes WHERE path = ?",
+                           (str(path.resolve()),)).fetchone()
+        if row is not None and row[:2] == (stat.st_mtime_ns, stat.st_size):
+            return row[2]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO etl_file_hashes VALUES (?, ?, ?, ?)",
+                         (str(path.resolve()), stat.st_mtime_ns, stat.st_size, sha.hexdigest()))
+        return sha.hexdigest()
+    finally:
+        conn.close()
+
+def source_fingerprint(source_db: Path = NORTHWIND_DB, state_db: Path = TARGET_DB) -> dict:
+    """Row count and last rowid of each declared source table, with a content hash of the database file."""
+    conn = connect_source(source_db, immutable=False)
+    try:
+        tables = {table: list(conn.execute(f'SELECT COUNT(*), MAX(rowid) FROM "{table}"').fetchone())
+                  for table in source_tables()}
+    finally:
+        conn.close()
+    # The counts alone would miss rows edited in place
+    return {"tables": tables, "sha256": file_hash(source_db, state_db)}
+
+def config_fingerprint() -> str:
+    """Hash of the settings in config/config.py (environment overrides included) and of the etl code."""
+    settings = {name: value for name, value in vars(config).items()
+                if name.isupper() and not callable(value) and not name.startswith(WEATHER_SETTINGS)}
+    code = {p.name: hashlib.sha256(p.read_bytes()).hexdigest() for p in sorted(CODE_DIR.glob("*.py"))}
+    return digest({"settings": settings, "code": code})
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash of a DataFrame's columns and rows, whatever order the rows are in."""
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    rows.sort()
+    return hashlib.sha256(json.dumps(list(df.columns)).encode() + rows.tobytes()).hexdigest()
+
+def inputs_fingerprint(weather: pd.DataFrame | None = None, source_db: Path = NORTHWIND_DB,
+                       state_db: Path = TARGET_DB) -> str:
+    """Fingerprint of everything a run's outputs depend on: source tables, mapping files, config and weather."""
+    parts = {
+        "source": source_fingerprint(source_db, state_db),
+        "files": {path.name: file_hash(path, state_db) for path in INPUT_FILES},
+        "config": config_fingerprint(),
+    }
+    if weather is not None:
+        parts["weather"] = frame_fingerprint(weather)
+    return digest(parts)
+
+# ------------------- Stages -------------------
+def previous_run(stage: str, fingerprint: str, outputs: Iterable[Path] = (),
+                 state_db: Path = TARGET_DB) -> dict | None:
+    """
+    The stage's last successful run ({run_id, updated_at, result}) if it had the same input fingerprint
+    and its outputs are still there; None if it has to run.
+    """
+    if not Path(state_db).exists() or not all(Path(p).exists() for p in outputs):
+        return None
+    conn = _connect(state_db)
+    try:
+        row = conn.execute("SELECT run_id, updated_at, result FROM etl_stage_fingerprints "
+                           "WHERE stage = ? AND fingerprint = ?", (stage, fingerprint)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"run_id": row[0], "updated_at": row[1], "result": json.loads(row[2]) if row[2] else None}
+
+def record(stage: str, fingerprint: str, result=None, run_id: str | None = None, state_db: Path = TARGET_DB):
+    """Remember that the stage succeeded on these inputs, with a result to replay when it is skipped."""
+    conn = _connect(state_db)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO etl_stage_fingerprints VALUES (?, ?, ?, ?, ?)",
+                         (stage, fingerprint, json.dumps(result, default=str) if result is not None else None,
+                          run_id, datetime.now(timezone.utc).isoformat()))
+    finally:
+        conn.close()
@@ -0,0 +1,278 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from config.config import (TARGET_DB, SQLITE_BUSY_TIMEOUT, ETL_METRICS, ETL_METRICS_JSON, ETL_PROFILE,
+                           ETL_PROFILE_STAGES, PROFILE_DIR)
+
+logger = logging.getLogger(__name__)
+
+# Counters other modules add to while a stage is running
+COUNTERS = ("http_calls", "cache_hits", "cache_misses", "rate_limit_sleep_s")
+COLUMNS = ("run_id", "task", "stage", "started_at", "wall_s", "cpu_s", "peak_rss_mb", "rows_in", "rows_out",
+           "bytes_read", "bytes_written", *COUNTERS, "profile")
+
+_lock = threading.Lock()
+# Open stages of the current thread (or of the code that handed its context to it), outermost first
+_stack: contextvars.ContextVar[tuple["StageMetrics", ...]] = contextvars.ContextVar("stages", default=())
+_running = 0  # open stages in all threads
+_finished: deque[dict] = deque(maxlen=10_000)  # until flushed
+_profiling = False
+
+
+def _proc_io() -> tuple[int, int] | tuple[None, None]:
+    """Bytes the process has read and written through syscalls (files, SQLite, sockets); Linux only."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _peak_rss_mb() -> float | None:
+    """Resident set high-water mark since the last reset, in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # No /proc: the process-lifetime peak (kB on Linux, bytes on macOS) is the best we can do
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM so the next reading covers only the stage; needs Linux 4.0+."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageMetrics:
+    """Measurements of one stage; rows and counters may be filled in by the code being measured."""
+
+    def __init__(self, stage: str, task: str | None = None):
+        self.stage = stage
+        self.task = task
+        self.rows_in = None
+        self.rows_out = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.profile = None
+        self.run_id = None
+        self.result = None  # the recorded measurements, once the stage has finished
+        self._peak_children = None
+
+    def _start(self, parent: "StageMetrics | None", reset_peak: bool):
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if reset_peak:
+            if parent is not None:
+                # Resetting the high-water mark hides the parent's peak so far; hand it up first
+                parent._observe_peak(_peak_rss_mb())
+            _reset_peak_rss()
+        self._io = _proc_io()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+
+    def _observe_peak(self, peak: float | None):
+        if peak is not None:
+            self._peak_children = max(peak, self._peak_children or 0.0)
+
+    def _stop(self) -> dict:
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak = _peak_rss_mb()
+        if self._peak_children is not None:
+            peak = max(peak or 0.0, self._peak_children)
+        read, written = _proc_io()
+        return {
+            "task": self.task,
+            "stage": self.stage,
+            "started_at": self.started_at,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "peak_rss_mb": None if peak is None else round(peak, 1),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": None if read is None else read - self._io[0],
+            "bytes_written": None if written is None else written - self._io[1],
+            **{k: round(v, 4) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "profile": self.profile,
+        }
+
+
+def count(counter: str, n: float = 1):
+    """Add to a counter of the running stages this code belongs to."""
+    stack = _stack.get()
+    if not stack:
+        return
+    with _lock:
+        for metrics in stack:
+            metrics.counters[counter] += n
+
+def in_context(fn):
+    """Wrap `fn` for a thread pool so the calls count towards the caller's stages."""
+    context = contextvars.copy_context()
+    # A context can only be entered by one thread at a time: each call runs in its own copy
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+@contextmanager
+def _profiled(stage: str, run_id: str | None):
+    """Profile the stage with ETL_PROFILE when enabled for it; yields the output path or None."""
+    global _profiling
+    wanted = ETL_PROFILE and (not ETL_PROFILE_STAGES or stage in ETL_PROFILE_STAGES)
+    # Profilers don't nest: an enclosing profiled stage already covers this one
+    if not wanted or _profiling:
+        yield None
+        return
+    out_dir = PROFILE_DIR / (run_id or "adhoc")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    _profiling = True
+    try:
+        if ETL_PROFILE == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("ETL_PROFILE=pyinstrument but pyinstrument is not installed; not profiling")
+                yield None
+                return
+            path = out_dir / f"{stage}.html"
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield path
+            finally:
+                profiler.stop()
+                path.write_text(profiler.output_html())
+        else:
+            import cProfile
+            path = out_dir / f"{stage}.prof"
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield path
+            finally:
+                profiler.disable()
+                profiler.dump_stats(path)
+    finally:
+        _profiling = False
+
+@contextmanager
+def stage(name: str, task: str | None = None, run_id: str | None = None):
+    """Measure a block as a stage; the result is kept until flush()."""
+    if not ETL_METRICS:
+        yield StageMetrics(name, task)
+        return
+    global _running
+    stack = _stack.get()
+    parent = stack[-1] if stack else None
+    if stack:
+        # Nested stages belong to the enclosing task and run
+        task, run_id = task or stack[0].task, run_id or stack[0].run_id
+    metrics = StageMetrics(name, task)
+    metrics.run_id = run_id
+    with _lock:
+        # The high-water mark is process-wide: only reset it when no other thread's stage is running,
+        # otherwise the peak is that of the whole process since the last reset
+        reset_peak = _running == len(stack)
+        _running += 1
+    metrics._start(parent, reset_peak)
+    token = _stack.set(stack + (metrics,))
+    try:
+        with _profiled(name, run_id) as profile:
+            metrics.profile = str(profile) if profile else None
+            yield metrics
+    finally:
+        _stack.reset(token)
+        with _lock:
+            _running -= 1
+        result = metrics.result = metrics._stop()
+        if parent is not None:
+            parent._observe_peak(result["peak_rss_mb"])
+        _finished.append(result)
+        logger.info("Stage %s: %.2fs wall, %.2fs CPU, peak RSS %s MB", name, result["wall_s"], result["cpu_s"],
+                    result["peak_rss_mb"])
+
+def _rows(value) -> int | None:
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, tuple) and value and all(isinstance(v, pd.DataFrame) for v in value):
+        return sum(len(v) for v in value)
+    return None
+
+def instrumented(name: str | None = None):
+    """Decorator measuring every call of an ETL function as a stage; rows in are its first DataFrame argument."""
+    def decorate(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ETL_METRICS:
+                return fn(*args, **kwargs)
+            with stage(stage_name) as metrics:
+                metrics.rows_in = next((len(a) for a in (*args, *kwargs.values()) if isinstance(a, pd.DataFrame)),
+                                       None)
+                result = fn(*args, **kwargs)
+                metrics.rows_out = _rows(result)
+            return result
+        return wrapper
+    return decorate
+
+def _sql_type(column: str) -> str:
+    if column.endswith(("_s", "_mb")):
+        return "REAL"
+    return "TEXT" if column in ("run_id", "task", "stage", "started_at", "profile") else "INTEGER"
+
+def _ensure_metrics_table(conn: sqlite3.Connection):
+    columns = ", ".join(f"{c} {_sql_type(c)}" for c in COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS etl_metrics ({columns})")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_etl_metrics_run ON etl_metrics (run_id)")
+
+def flush(run_id: str | None = None, db_path: Path = TARGET_DB, json_path: Path = ETL_METRICS_JSON) -> list[dict]:
+    """
+    Write the stages finished since the last flush to the etl_metrics table and to the run's JSON file
+    (one object per run, replaced when a new run starts). Returns the flushed stages.
+    """
+    with _lock:
+        records = [{"run_id": run_id, **r} for r in _finished]
+        _finished.clear()
+    if not records:
+        return []
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    with sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT) as conn:
+        _ensure_metrics_table(conn)
+        conn.executemany(f"INSERT INTO etl_metrics ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                         [tuple(r[c] for c in COLUMNS) for r in records])
+    conn.close()
+
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    report = json.loads(json_path.read_text()) if json_path.exists() and json_path.stat().st_size else {}
+    if report.get("run_id") != run_id:
+        report = {"run_id": run_id, "stages": []}
+    report["stages"] += records
+    json_path.write_text(json.dumps(report, indent=2))
+    return records
+
+def read_metrics(run_id: str | None = None, db_path: Path = TARGET_DB) -> pd.DataFrame:
+    """Stored stage metrics, of one run or all of them."""
+    with sqlite3.connect(db_path) as conn:
+        _ensure_metrics_table(conn)
+        if run_id is None:
+            return pd.read_sql("SELECT * FROM etl_metrics", conn)
+        return pd.read_sql("SELECT * FROM etl_metrics WHERE run_id = ?", conn, params=(run_id,))
@@ -1,18 +1,319 @@
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable
 import sqlite3
+import numpy as np
 import pandas as pd
 import logging
+import yaml
 
-from config.config import TARGET_DB, STAGING_DIR
+from config.config import TARGET_DB, STAGING_DIR, LOAD_BATCH_SIZE, SCHEMA_CONFIG_YAML, SQLITE_BUSY_TIMEOUT
+from etl.instrumentation import instrumented
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_to_db(df: pd.DataFrame, table_name: str):
-    """Load DataFrame to SQLite table."""
+# Declared column types (config/schema_config.yaml) -> SQLite column types
+SQL_TYPES = {"string": "TEXT", "integer": "INTEGER", "float": "REAL", "date": "TEXT"}
+
+@lru_cache(maxsize=None)
+def _target_tables() -> dict:
+    with open(SCHEMA_CONFIG_YAML, "r") as f:
+        return (yaml.safe_load(f) or {}).get("target_tables", {})
+
+def target_schema(table_name: str) -> dict:
+    """Declared schema of a target table: columns (type, nullable), primary_key and indexes."""
+    schema = _target_tables().get(table_name)
+    if schema is None:
+        raise ValueError(f"No schema declared for table '{table_name}' in {SCHEMA_CONFIG_YAML}")
+    return schema
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _sql_type(dtype) -> str:
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+def tune_connection(conn: sqlite3.Connection):
+    """WAL lets readers keep querying during a load; NORMAL sync is durable enough under WAL."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+
+def _has_unique_key(conn: sqlite3.Connection, table_name: str, keys: list[str]) -> bool:
+    """Whether a primary key or unique index covers exactly the key columns (an ON CONFLICT target)."""
+    table_info = list(conn.execute(f"PRAGMA table_info({_quote(table_name)})"))
+    if {row[1] for row in table_info if row[5]} == set(keys):
+        return True
+    for _, index, unique, _, partial in conn.execute(f"PRAGMA index_list({_quote(table_name)})"):
+        if unique and not partial and {row[2] for row in conn.execute(f"PRAGMA index_info({_quote(index)})")} == set(keys):
+            return True
+    return False
+
+def _prepare_merge_table(conn: sqlite3.Connection, df: pd.DataFrame, table_name: str, keys: list[str]):
+    """Create the table with its primary key, or bring an existing one up to the DataFrame's columns."""
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table_name)})")]
+    if not existing:
+        columns = ", ".join(f"{_quote(c)} {_sql_type(t)}" for c, t in df.dtypes.items())
+        conn.execute(f"CREATE TABLE {_quote(table_name)} ({columns}, "
+                     f"PRIMARY KEY ({', '.join(_quote(k) for k in keys)}))")
+        return
+    for column, dtype in df.dtypes.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(column)} {_sql_type(dtype)}")
+
+    if _has_unique_key(conn, table_name, keys):
+        return
+    # Tables written by to_sql(replace) have no key; keep the latest row per key and index it, once
+    key_list = ", ".join(_quote(k) for k in keys)
+    conn.execute(f"DELETE FROM {_quote(table_name)} WHERE rowid NOT IN "
+                 f"(SELECT MAX(rowid) FROM {_quote(table_name)} GROUP BY {key_list})")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote('ux_' + table_name + '_pk')} "
+                 f"ON {_quote(table_name)} ({key_list})")
+
+def _merge_rows(conn: sqlite3.Connection, df: pd.DataFrame, table_name: str, keys: list[str],
+                batch_size: int) -> int:
+    """Upsert df into table_name inside the caller's transaction; return the number of rows written."""
+    null_keys = df[keys].isna().any(axis=1)
+    if null_keys.any():
+        logger.warning("Skipping %d rows with a null key %s in %s", int(null_keys.sum()), keys, table_name)
+        df = df[~null_keys]
+
+    columns = list(df.columns)
+    updates = [c for c in columns if c not in keys]
+    column_list = ", ".join(_quote(c) for c in columns)
+    sql = (f"INSERT INTO {_quote(table_name)} ({column_list}) VALUES ({', '.join('?' * len(columns))}) "
+           f"ON CONFLICT ({', '.join(_quote(k) for k in keys)}) DO ")
+    if updates:
+        # Unchanged rows match the WHERE clause as false and cost no write
+        target = ", ".join(f"{_quote(table_name)}.{_quote(c)}" for c in updates)
+        incoming = ", ".join(f"excluded.{_quote(c)}" for c in updates)
+        sql += (f"UPDATE SET {', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in updates)} "
+                f"WHERE ({target}) IS NOT ({incoming})" if len(updates) > 1 else
+                f"UPDATE SET {_quote(updates[0])} = excluded.{_quote(updates[0])} "
+                f"WHERE {target} IS NOT {incoming}")
+    else:
+        sql += "NOTHING"
+
+    before = conn.total_changes
+    # Bound as the bulk path binds them, so float32 readings compare equal to the values it stored
+    for start in range(0, len(df), batch_size):
+        conn.executemany(sql, _rows(df.iloc[start:start + batch_size]))
+    return conn.total_changes - before
+
+def merge_to_db(df: pd.DataFrame, table_name: str, key_columns: list[str] | None = None,
+                db_path: Path = TARGET_DB, batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """Upsert a DataFrame on its primary key (INSERT ... ON CONFLICT DO UPDATE) in a single transaction."""
+    return merge_chunks_to_db([df], table_name, key_columns, db_path, batch_size)
+
+def merge_chunks_to_db(chunks: Iterable[pd.DataFrame], table_name: str, key_columns: list[str] | None = None,
+                       db_path: Path = TARGET_DB, batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """Upsert a stream of chunks in a single transaction; return the number of inserted or changed rows."""
+    keys = key_columns or target_schema(table_name)["primary_key"]
+
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        tune_connection(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        changed = total = 0
+        for i, chunk in enumerate(chunks):
+            if i == 0:
+                _prepare_merge_table(conn, chunk, table_name, keys)
+            changed += _merge_rows(conn, chunk, table_name, keys, batch_size)
+            total += len(chunk)
+        _create_declared_indexes(conn, table_name)
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info("Merged %d rows into table %s (%d inserted or changed)", total, table_name, changed)
+    return changed
+
+def update_to_db(df: pd.DataFrame, table_name: str, key_columns: list[str], db_path: Path = TARGET_DB,
+                 batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """
+    Set df's other columns on every row matching its key columns (which needn't be unique) in a single
+    transaction; no rows are inserted. Return the number of rows changed.
+    """
+    updates = [c for c in df.columns if c not in key_columns]
+    # Rows already holding the values match the WHERE clause as false and cost no write
+    sql = (f"UPDATE {_quote(table_name)} SET {', '.join(f'{_quote(c)} = ?' for c in updates)} "
+           f"WHERE {' AND '.join(f'{_quote(k)} = ?' for k in key_columns)} "
+           f"AND ({', '.join(_quote(c) for c in updates)}) IS NOT ({', '.join('?' * len(updates))})")
+    values = df[updates + list(key_columns) + updates]
+
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        tune_connection(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        before = conn.total_changes
+        for start in range(0, len(values), batch_size):
+            conn.executemany(sql, _rows(values.iloc[start:start + batch_size]))
+        changed = conn.total_changes - before
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info("Updated %d rows of table %s on %s", changed, table_name, key_columns)
+    return changed
+
+def _rows(df: pd.DataFrame):
+    """Row tuples of plain Python values, built column-wise (SQLite stores a bound NaN as NULL)."""
+    columns = []
+    for _, values in df.items():
+        if values.dtype == np.float32:
+            # Through the shortest decimal repr, so 21.3 is stored as 21.3 rather than 21.299999237060547
+            columns.append(values.to_numpy().astype(str).astype(np.float64).tolist())
+        elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufO":
+            columns.append(values.tolist())
+        else:
+            # Extension dtypes (nullable ints, categoricals, arrow strings) may hold pd.NA
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return zip(*columns)
+
+def _bulk_columns(schema: dict, df: pd.DataFrame, table_name: str) -> list[tuple[str, str, bool]]:
+    """(name, SQL type, nullable) for the declared columns plus any undeclared ones found in df."""
+    columns = [(name, SQL_TYPES[spec["type"]], spec.get("nullable", True))
+               for name, spec in schema["columns"].items()]
+    extra = [c for c in df.columns if c not in schema["columns"]]
+    if extra:
+        logger.warning("Columns %s are not declared for %s, loading them untyped", extra, table_name)
+        columns += [(c, _sql_type(df[c].dtype), True) for c in extra]
+    return columns
+
+def bulk_load_chunks(chunks: Iterable[pd.DataFrame], table_name: str, db_path: Path = TARGET_DB,
+                     batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """
+    Rebuild a target table from its declared schema and swap it in atomically.
+    Rows go into a keyless staging table with executemany, the staging table is renamed over the old one
+    and the primary key and secondary indexes are built once the data is in, all in one transaction.
+    """
+    schema = target_schema(table_name)
+    keys = schema.get("primary_key", [])
+    staging_table = f"{table_name}__staging"
+
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        tune_connection(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DROP TABLE IF EXISTS {_quote(staging_table)}")
+        columns, total = None, 0
+        for chunk in chunks:
+            if columns is None:
+                columns = _bulk_columns(schema, chunk, table_name)
+                definitions = [f"{_quote(name)} {sql_type}{'' if nullable else ' NOT NULL'}"
+                               for name, sql_type, nullable in columns]
+                conn.execute(f"CREATE TABLE {_quote(staging_table)} ({', '.join(definitions)})")
+                sql = (f"INSERT INTO {_quote(staging_table)} ({', '.join(_quote(name) for name, _, _ in columns)}) "
+                       f"VALUES ({', '.join('?' * len(columns))})")
+            values = chunk.reindex(columns=[name for name, _, _ in columns])
+            for start in range(0, len(values), batch_size):
+                conn.executemany(sql, _rows(values.iloc[start:start + batch_size]))
+            total += len(chunk)
+
+        if columns is None:
+            logger.warning("No rows to bulk load into %s, keeping the existing table", table_name)
+            conn.execute("ROLLBACK")
+            return 0
+
+        conn.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+        conn.execute(f"ALTER TABLE {_quote(staging_table)} RENAME TO {_quote(table_name)}")
+        if keys:
+            _create_unique_key(conn, table_name, keys)
+        _create_declared_indexes(conn, table_name)
+        (loaded,) = conn.execute(f"SELECT COUNT(*) FROM {_quote(table_name)}").fetchone()
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    if loaded != total:
+        logger.warning("Dropped %d rows with a duplicate %s while loading %s", total - loaded, keys, table_name)
+    logger.info("Bulk loaded %d rows into table %s", loaded, table_name)
+    return loaded
+
+def _create_unique_key(conn: sqlite3.Connection, table_name: str, keys: list[str]):
+    """Index the primary key in one pass over the loaded rows; on duplicates keep the last row per key."""
+    key_list = ", ".join(_quote(k) for k in keys)
+    sql = f"CREATE UNIQUE INDEX {_quote('ux_' + table_name + '_pk')} ON {_quote(table_name)} ({key_list})"
+    try:
+        conn.execute(sql)
+    except sqlite3.IntegrityError:
+        conn.execute(f"DELETE FROM {_quote(table_name)} WHERE rowid NOT IN "
+                     f"(SELECT MAX(rowid) FROM {_quote(table_name)} GROUP BY {key_list})")
+        conn.execute(sql)
+
+def _create_declared_indexes(conn: sqlite3.Connection, table_name: str):
+    """Create the secondary indexes declared for the table (config/schema_config.yaml), if missing."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table_name)})")}
+    for index_columns in _target_tables().get(table_name, {}).get("indexes", []):
+        if not set(index_columns) <= existing:
+            logger.warning("Table %s has no column(s) %s, not indexing them", table_name,
+                           sorted(set(index_columns) - existing))
+            continue
+        index_name = f"ix_{table_name}_{'_'.join(index_columns)}".replace(" ", "_").lower()
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON {_quote(table_name)} "
+                     f"({', '.join(_quote(c) for c in index_columns)})")
+
+def bulk_load(df: pd.DataFrame, table_name: str, db_path: Path = TARGET_DB,
+              batch_size: int = LOAD_BATCH_SIZE) -> int:
+    """Bulk load a whole DataFrame; see bulk_load_chunks."""
+    return bulk_load_chunks([df], table_name, db_path, batch_size)
+
+@instrumented()
+def load_to_db(df: pd.DataFrame, table_name: str, if_exists: str = "replace", db_path: Path = TARGET_DB):
+    """
+    Load DataFrame to SQLite table.
+    "append" adds an incremental delta to it, "merge" upserts on the table's primary key
+    and "bulk" rebuilds it from the declared schema.
+    """
     logger.info("Loading %d rows into table %s", len(df), table_name)
-    with sqlite3.connect(TARGET_DB) as conn:
-        df.to_sql(table_name, conn, if_exists="replace", index=False)
+    if if_exists == "merge":
+        merge_to_db(df, table_name, db_path=db_path)
+        return
+    if if_exists == "bulk":
+        bulk_load(df, table_name, db_path=db_path)
+        return
+    with sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT) as conn:
+        df.to_sql(table_name, conn, if_exists=if_exists, index=False)
+        _create_declared_indexes(conn, table_name)
+
+def load_chunks_to_db(chunks: Iterable[pd.DataFrame], table_name: str, if_exists: str = "replace",
+                      db_path: Path = TARGET_DB) -> int:
+    """Stream DataFrame chunks into a SQLite table over one connection; return the rows written."""
+    if if_exists == "merge":
+        return merge_chunks_to_db(chunks, table_name, db_path=db_path)
+    if if_exists == "bulk":
+        return bulk_load_chunks(chunks, table_name, db_path=db_path)
+    total = 0
+    with sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT) as conn:
+        for i, chunk in enumerate(chunks):
+            chunk.to_sql(table_name, conn, if_exists=if_exists if i == 0 else "append", index=False)
+            total += len(chunk)
+        _create_declared_indexes(conn, table_name)
+    logger.info("Loaded %d rows into table %s", total, table_name)
+    return total
+
+def write_csv_chunks(chunks: Iterable[pd.DataFrame], path: Path) -> int:
+    """Stream DataFrame chunks into one CSV file; return the row count."""
+    total = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        total += len(chunk)
+    logger.info("Wrote %d rows to %s", total, path)
+    return total
 
 def load_region_mapping(region_mapping_df: pd.DataFrame):
     """Load region mapping table separately."""
@@ -0,0 +1,439 @@
+"""
+The pipeline's stages over in-memory DataFrames, and a runner that executes them in one process.
+The Airflow DAG wraps the same stages, handing data between tasks through staging files.
+
+    python -m etl.pipeline run
+    python -m etl.pipeline backfill --start 1996-07-01 --end 1998-06-01 --freq MS
+"""
+import os
+import json
+import argparse
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+from etl.extract import extract_orders_customers, extract_order_partition, commit_watermarks
+from etl.api_integration import strip_locations, weather_for_locations
+from etl.weather_client import WeatherClient
+from etl.weather_checkpoint import WeatherCheckpoint
+from etl.region_mapping import load_region_mapping
+from etl.transform import RegionIndex, enrich_with_region
+from etl.load import load_to_db, load_chunks_to_db, update_to_db, write_csv_chunks
+from etl.serving import refresh_serving_tables
+from etl.analysis import region_weather_summary, fold_weather_summary, read_weather_summary
+from etl.sales_analysis import sales_weather_summary
+from etl.weather_history import append_observations, orders_with_weather
+from etl import fingerprints, instrumentation, quality
+from etl.dtypes import apply_dtypes
+from config.config import (
+    TARGET_DB,
+    SQLITE_BUSY_TIMEOUT,
+    NORTHWIND_DB,
+    ENRICHED_CSV,
+    REGION_WEATHER_SUMMARY_CSV,
+    SALES_WEATHER_SUMMARY_CSV,
+    WEATHER_HISTORY_DIR,
+    ORDERS_WEATHER_DIR,
+    DATA_QUALITY_LOG,
+    DATA_QUALITY_JSON,
+    EXTRACT_MODE,
+    EXTRACT_FULL_REFRESH,
+    LOAD_MODE,
+    SUMMARY_MODE,
+    STREAMING,
+    CHUNK_SIZE,
+    PIPELINE_WORKERS,
+    BACKFILL_WORKERS,
+    SKIP_UNCHANGED,
+    ensure_dirs as ensure_output_dirs,
+)
+
+logger = logging.getLogger(__name__)
+
+LOCATION_COLUMNS = ["City", "Country"]
+OBSERVATION_COLUMNS = ["CityID", "ObservedAt"]
+SUMMARY_COLUMNS = ["CustomerID", "Region", "Country", "Temperature"]
+# An incremental extract holds only the new and changed customers. The weather of those already loaded is
+# refreshed by the load, and the enriched export and region summary are rebuilt from enriched_customers after it.
+FROM_TARGET = EXTRACT_MODE == "incremental"
+# Stages after the weather fetch that are skipped on unchanged inputs, with the files they leave behind:
+# a stage whose outputs are gone runs again
+STAGE_OUTPUTS = {
+    "transform": [] if FROM_TARGET else [ENRICHED_CSV],
+    "check_enriched": [],
+    "load": [TARGET_DB, ENRICHED_CSV] if FROM_TARGET else [TARGET_DB],
+    "check_load": [],
+    "region_weather_analysis": [REGION_WEATHER_SUMMARY_CSV],
+    "sales_weather_analysis": [SALES_WEATHER_SUMMARY_CSV],
+}
+
+# ------------------- Stages -------------------
+def ensure_dirs():
+    ensure_output_dirs()
+    # The checks below add to fresh reports each run
+    DATA_QUALITY_LOG.write_text("")
+    DATA_QUALITY_JSON.unlink(missing_ok=True)
+
+def extract() -> tuple[pd.DataFrame, pd.DataFrame]:
+    return extract_orders_customers()
+
+def region_mapping() -> pd.DataFrame:
+    mapping_df = apply_dtypes(load_region_mapping())
+    load_to_db(mapping_df, table_name="region_mapping", if_exists=LOAD_MODE)
+    return mapping_df
+
+def check(data: pd.DataFrame | Iterable[pd.DataFrame], dataset: str, columns: list[str] | None = None,
+          stage: str | None = None, references: dict | None = None) -> dict:
+    """Run a dataset's quality rules, reading only the columns they need from each frame."""
+    if isinstance(data, pd.DataFrame):
+        # The rules read these columns of the frame itself; no need to copy them out
+        columns = quality.rule_columns(dataset, list(data.columns))
+    return quality.check(data, dataset, columns=columns, stage=stage, references=references)
+
+def raise_on_errors(reports: list[dict]):
+    quality.write_report(reports)
+    errors = [e for r in reports for e in r["errors"]]
+    if errors:
+        raise ValueError(f"Data quality errors: {errors}")
+
+def check_sources(customers: pd.DataFrame, orders: pd.DataFrame, mapping_df: pd.DataFrame) -> list[dict]:
+    return [check(customers, "customers"), check(orders, "orders"), check(mapping_df, "region_mapping")]
+
+def weather_enabled() -> bool:
+    return bool(os.getenv("OPENWEATHER_API_KEY"))
+
+def loaded_locations() -> pd.DataFrame:
+    """Distinct locations of the customers in target.db; none before the first load."""
+    if not TARGET_DB.exists():
+        return pd.DataFrame(columns=LOCATION_COLUMNS)
+    conn = sqlite3.connect(TARGET_DB, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        if not conn.execute("PRAGMA table_info(enriched_customers)").fetchall():
+            return pd.DataFrame(columns=LOCATION_COLUMNS)
+        return pd.read_sql("SELECT DISTINCT City, Country FROM enriched_customers", conn)
+    finally:
+        conn.close()
+
+def unique_locations(customers: pd.DataFrame) -> pd.DataFrame:
+    locations = customers[LOCATION_COLUMNS]
+    if FROM_TARGET:
+        # The customers already loaded get this run's weather too; an empty frame would leak object dtypes
+        frames = [f for f in (locations, loaded_locations()) if not f.empty] or [locations]
+        locations = pd.concat(frames, ignore_index=True)
+    # Dedup before stripping too, so only distinct locations are materialized
+    locations = locations.drop_duplicates(ignore_index=True)
+    return strip_locations(locations).drop_duplicates(ignore_index=True)
+
+def weather_shard(locations: pd.DataFrame, shard: int, n_shards: int) -> pd.DataFrame:
+    """The locations a mapped fetch task owns; a stable hash, so every shard task agrees on them."""
+    owner = pd.util.hash_pandas_object(locations, index=False).to_numpy() % n_shards
+    return locations[owner == shard]
+
+def fetch_weather(locations: pd.DataFrame, client: WeatherClient | None = None,
+                  run_id: str | None = None) -> pd.DataFrame:
+    """
+    Current weather of the locations, with the reading's city id and time for the history.
+    With a run id, fetched cities are journaled as they come in, so a retry of the run only fetches the rest.
+    """
+    checkpoint = WeatherCheckpoint(run_id) if run_id else None
+    try:
+        return weather_for_locations(locations, api_key=os.getenv("OPENWEATHER_API_KEY"), client=client,
+                                     observations=True, checkpoint=checkpoint)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+def record_weather(weather: pd.DataFrame, run_id: str | None = None) -> pd.DataFrame:
+    """Keep every reading for point-in-time joins; return the current weather per location."""
+    append_observations(weather)
+    if run_id:
+        # The readings are in the history now: the run's fetch journal has served its purpose
+        with WeatherCheckpoint(run_id) as checkpoint:
+            checkpoint.discard()
+    return weather.drop(columns=OBSERVATION_COLUMNS)
+
+def merge_weather(customers: pd.DataFrame, weather: pd.DataFrame) -> pd.DataFrame:
+    # Stripping and the merge turn the location and weather columns back into plain objects
+    merged = strip_locations(customers.copy(deep=False)).merge(weather, on=LOCATION_COLUMNS, how="left")
+    return apply_dtypes(merged)
+
+def transform(customers_weather: pd.DataFrame, mapping_df: pd.DataFrame) -> pd.DataFrame:
+    enriched = enrich_with_region(customers_weather, mapping_df)
+    if not FROM_TARGET:
+        enriched.to_csv(ENRICHED_CSV, index=False)  # CSV export for downstream consumers
+    return enriched
+
+def check_enriched(enriched: pd.DataFrame | Iterable[pd.DataFrame], mapping_df: pd.DataFrame,
+                   columns: list[str] | None = None) -> list[dict]:
+    return [check(enriched, "enriched", columns=columns, references={"region_mapping": mapping_df})]
+
+def load_mode(extract_mode: str = EXTRACT_MODE, full_refresh: bool = EXTRACT_FULL_REFRESH,
+              mode: str = LOAD_MODE) -> str:
+    """How this run's extract is written to target.db (the if_exists of load_to_db)."""
+    if extract_mode != "incremental":
+        return mode
+    if full_refresh:
+        # A full refresh re-extracts every row: rebuild the table rather than add the rows again
+        return mode if mode in ("bulk", "replace") else "replace"
+    # A delta can't rebuild the table: upsert it on the primary key, so re-extracted rows replace their old versions
+    return "merge"
+
+def iter_loaded(columns: list[str] | None = None, chunksize: int = CHUNK_SIZE) -> Iterable[pd.DataFrame]:
+    """The enriched customers in target.db, in chunks."""
+    select = ", ".join(f"[{c}]" for c in columns) if columns else "*"
+    conn = sqlite3.connect(TARGET_DB, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        yield from pd.read_sql(f"SELECT {select} FROM enriched_customers", conn, chunksize=chunksize)
+    finally:
+        conn.close()
+
+def load(enriched: pd.DataFrame | Iterable[pd.DataFrame], orders: pd.DataFrame | Iterable[pd.DataFrame],
+         weather: pd.DataFrame | None = None):
+    """
+    Load the enriched customers and the orders (DataFrames or chunk streams) into target.db.
+    After an incremental delta, the run's `weather` is also set on the customers loaded before.
+    """
+    if_exists = load_mode()
+    # Orders are loaded alongside the customers so the sales analysis can join them in SQLite
+    for data, table in ((enriched, "enriched_customers"), (orders, "orders")):
+        if isinstance(data, pd.DataFrame):
+            load_to_db(data, table_name=table, if_exists=if_exists)
+        else:
+            load_chunks_to_db(data, table_name=table, if_exists=if_exists)
+    if FROM_TARGET:
+        if weather is not None:
+            weather = weather.drop(columns=OBSERVATION_COLUMNS, errors="ignore")
+            update_to_db(weather, "enriched_customers", key_columns=LOCATION_COLUMNS)
+        write_csv_chunks(iter_loaded(), ENRICHED_CSV)
+    # Consumers query these rather than scanning enriched_customers
+    refresh_serving_tables()
+    if EXTRACT_MODE == "incremental":
+        commit_watermarks()
+
+def check_load() -> list[dict]:
+    with sqlite3.connect(TARGET_DB) as conn:
+        table_columns = [row[1] for row in conn.execute("PRAGMA table_info(enriched_customers)")]
+        if not table_columns:
+            raise ValueError(f"Table enriched_customers not found in {TARGET_DB}")
+        columns = quality.rule_columns("enriched", table_columns)
+        mapping_df = pd.read_sql("SELECT * FROM region_mapping", conn)
+        query = f"SELECT {', '.join(f'[{c}]' for c in columns)} FROM enriched_customers"
+        data = pd.read_sql(query, conn, chunksize=CHUNK_SIZE if STREAMING else None)
+        report = check(data, "enriched", columns=columns, stage="loaded", references={"region_mapping": mapping_df})
+    return [report]
+
+def region_analysis(enriched: pd.DataFrame | Iterable[pd.DataFrame] | None,
+                    run_id: str | None = None) -> pd.DataFrame:
+    """
+    Region summary, recomputed or folded into the stored state (SUMMARY_MODE); exported as CSV.
+    After an incremental extract, it covers the customers in target.db rather than `enriched`.
+    """
+    if FROM_TARGET:
+        enriched = iter_loaded(SUMMARY_COLUMNS)
+    if SUMMARY_MODE == "incremental":
+        # Fold every current customer into the stored state once they're loaded: only new and changed ones
+        # are folded, and those no longer there are taken out.
+        # The run id makes a retried task skip a fold that already went through.
+        fold_weather_summary(enriched, complete=True, batch_id=run_id)
+        summary = read_weather_summary("region")
+    else:
+        if not isinstance(enriched, pd.DataFrame):
+            enriched = pd.concat(enriched, ignore_index=True)
+        summary = region_weather_summary(enriched)
+    summary.to_csv(REGION_WEATHER_SUMMARY_CSV, index=False)
+    return summary
+
+def sales_analysis() -> pd.DataFrame:
+    # Aggregated inside target.db; only the summary rows come back to Python
+    summary = sales_weather_summary()
+    summary.to_csv(SALES_WEATHER_SUMMARY_CSV, index=False)
+    return summary
+
+def data_quality_summary():
+    reports = json.loads(DATA_QUALITY_JSON.read_text()) if DATA_QUALITY_JSON.exists() else {}
+    for stage, report in reports.items():
+        logger.info("Data quality %s: %d rows, %d errors, %d warnings", stage, report["rows"],
+                    len(report["errors"]), len(report["warnings"]))
+    logger.info("Full report: %s", DATA_QUALITY_JSON)
+
+# ------------------- Change detection -------------------
+def input_fingerprint(weather: pd.DataFrame | None = None) -> str | None:
+    """
+    Fingerprint of the run's inputs, including the weather for the stages after it.
+    None, so nothing is skipped, when SKIP_UNCHANGED is off.
+    """
+    if not SKIP_UNCHANGED:
+        return None
+    if weather is not None:
+        # When a reading was taken goes to the history only; the merged values are what count
+        weather = weather.drop(columns=OBSERVATION_COLUMNS, errors="ignore")
+    return fingerprints.inputs_fingerprint(weather)
+
+def unchanged(stage: str, fingerprint: str | None, outputs: Iterable[Path] = ()) -> dict | None:
+    """The stage's last successful run if it had the same inputs and its outputs are still there; else None."""
+    if fingerprint is None:
+        return None
+    return fingerprints.previous_run(stage, fingerprint, outputs)
+
+def succeeded(stage: str, fingerprint: str | None, result=None, run_id: str | None = None):
+    if fingerprint is not None:
+        fingerprints.record(stage, fingerprint, result, run_id)
+
+def run_checks(stage: str, fingerprint: str | None, checks, run_id: str | None = None):
+    """
+    Run a quality stage's `checks` (a callable returning reports) and raise on errors.
+    On unchanged inputs, the reports of its last run are written again instead.
+    """
+    previous = unchanged(stage, fingerprint)
+    if previous is not None:
+        logger.info("Skipping %s: inputs unchanged since run %s", stage, previous["run_id"])
+        raise_on_errors(previous["result"])
+        return
+    reports = checks()
+    raise_on_errors(reports)
+    succeeded(stage, fingerprint, reports, run_id)
+
+# ------------------- In-process runner -------------------
+def run_pipeline(run_id: str | None = None, max_workers: int = PIPELINE_WORKERS):
+    """
+    Run the DAG's stages in this process, with the same dependencies, passing DataFrames in memory.
+    Stages that don't depend on each other run concurrently on a thread pool.
+    """
+    run_id = run_id or f"local__{datetime.now(timezone.utc):%Y-%m-%dT%H:%M:%S}"
+
+    def stage(name, fn, *args):
+        with instrumentation.stage(name, task=name, run_id=run_id):
+            return fn(*args)
+
+    try:
+        stage("ensure_dirs", ensure_dirs)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            mapping_future = pool.submit(stage, "region_mapping", region_mapping)
+            customers, orders = stage("extract", extract)
+            weather_future = None
+            if weather_enabled():
+                weather_future = pool.submit(stage, "fetch_weather", fetch_weather, unique_locations(customers),
+                                             None, run_id)
+            mapping_df = mapping_future.result()
+            stage("check_sources", run_checks, "check_sources", input_fingerprint(),
+                  lambda: check_sources(customers, orders, mapping_df), run_id)
+            if weather_future is None:
+                # As in the DAG, the weather gate skips everything downstream of it
+                logger.warning("OPENWEATHER_API_KEY is not set; skipping weather enrichment and the stages after it")
+                return
+
+            weather = stage("record_weather", record_weather, weather_future.result(), run_id)
+            inputs = input_fingerprint(weather)
+            previous = {name: unchanged(name, inputs, outputs) for name, outputs in STAGE_OUTPUTS.items()}
+            if all(previous.values()):
+                # The last run already produced what these inputs give; only its quality reports are brought back
+                logger.info("Inputs unchanged since run %s; skipping the stages after the weather fetch",
+                            previous["load"]["run_id"])
+                quality.write_report(previous["check_enriched"]["result"] + previous["check_load"]["result"])
+            else:
+                customers_weather = stage("merge_weather", merge_weather, customers, weather)
+                enriched = stage("transform", transform, customers_weather, mapping_df)
+                succeeded("transform", inputs, run_id=run_id)
+                stage("check_enriched", run_checks, "check_enriched", inputs,
+                      lambda: check_enriched(enriched, mapping_df), run_id)
+
+                analysis = ("region_weather_analysis", region_analysis, enriched[SUMMARY_COLUMNS], run_id)
+                # The incremental fold writes target.db, and after a delta the summary reads it:
+                # after the load, not alongside it
+                after_load = SUMMARY_MODE == "incremental" or FROM_TARGET
+                analysis_future = None if after_load else pool.submit(stage, *analysis)
+                stage("load", load, enriched, orders, weather)
+                succeeded("load", inputs, run_id=run_id)
+                if analysis_future is None:
+                    analysis_future = pool.submit(stage, *analysis)
+                sales_future = pool.submit(stage, "sales_weather_analysis", sales_analysis)
+                stage("check_load", run_checks, "check_load", inputs, check_load, run_id)
+                analysis_future.result()
+                succeeded("region_weather_analysis", inputs, run_id=run_id)
+                sales_future.result()
+                succeeded("sales_weather_analysis", inputs, run_id=run_id)
+        stage("data_quality_summary", data_quality_summary)
+    finally:
+        instrumentation.flush(run_id)
+
+# ------------------- Backfill -------------------
+def backfill_partition(start: str, end: str, source_db: Path = NORTHWIND_DB,
+                       history_dir: Path = WEATHER_HISTORY_DIR, output_dir: Path = ORDERS_WEATHER_DIR,
+                       mapping_df: pd.DataFrame | None = None) -> dict:
+    """
+    Orders placed in [start, end) with their customer's region and the weather observed nearest to the
+    order date, written to one order_date partition of `output_dir` (replacing an earlier backfill of it).
+    Past dates can't be fetched live, so the weather comes from the observation history.
+    """
+    if mapping_df is None:
+        mapping_df = load_region_mapping()
+    customers, orders = extract_order_partition(start, end, source_db)
+    report = check(orders, "orders", stage=f"orders {start}")
+    located = orders_with_weather(orders, customers, history_dir)
+    enriched = RegionIndex(mapping_df).join(located)
+
+    partition = Path(output_dir) / f"order_date={start}"
+    partition.mkdir(parents=True, exist_ok=True)
+    enriched.to_parquet(partition / "part-0.parquet", index=False)
+    return {
+        "partition": start,
+        "orders": len(enriched),
+        "with_weather": int(enriched["ObservedAt"].notna().sum()),
+        "errors": report["errors"],
+    }
+
+def backfill(start, end, freq: str = "MS", max_workers: int = BACKFILL_WORKERS, source_db: Path = NORTHWIND_DB,
+             history_dir: Path = WEATHER_HISTORY_DIR, output_dir: Path = ORDERS_WEATHER_DIR,
+             mapping_df: pd.DataFrame | None = None) -> list[dict]:
+    """Backfill the order-date partitions between `start` and `end` (pandas `freq` steps) on a process pool."""
+    bounds = pd.date_range(start, end, freq=freq)
+    if len(bounds) == 0 or bounds[0] > pd.Timestamp(start):
+        bounds = bounds.insert(0, pd.Timestamp(start))
+    if bounds[-1] < pd.Timestamp(end):
+        bounds = bounds.append(pd.DatetimeIndex([pd.Timestamp(end)]))
+    partitions = [(a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")) for a, b in zip(bounds[:-1], bounds[1:])]
+    logger.info("Backfilling %d partitions on %d processes", len(partitions), max_workers)
+    # Loaded once here and handed to the workers, rather than each one re-reading the workbook
+    if mapping_df is None:
+        mapping_df = load_region_mapping()
+
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(partitions)))) as pool:
+        futures = [pool.submit(backfill_partition, a, b, source_db, history_dir, output_dir, mapping_df)
+                   for a, b in partitions]
+        results = [f.result() for f in futures]
+    errors = [e for r in results for e in r["errors"]]
+    logger.info("Backfilled %d orders (%d with weather) into %s", sum(r["orders"] for r in results),
+                sum(r["with_weather"] for r in results), output_dir)
+    if errors:
+        raise ValueError(f"Data quality errors: {errors}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the whole pipeline once")
+    run.add_argument("--run-id")
+    run.add_argument("--workers", type=int, default=PIPELINE_WORKERS)
+    fill = commands.add_parser("backfill", help="rebuild order-date partitions of orders with weather")
+    fill.add_argument("--start", required=True)
+    fill.add_argument("--end", required=True, help="exclusive")
+    fill.add_argument("--freq", default="MS", help="partition size as a pandas frequency (D, W-MON, MS, ...)")
+    fill.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    args = parser.parse_args()
+
+    # Logging is configured by entry points only, so importing the etl modules leaves it to the host
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "run":
+        run_pipeline(args.run_id, args.workers)
+    else:
+        backfill(args.start, args.end, args.freq, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import json
+import time
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from config.config import SCHEMA_CONFIG_YAML, DATA_QUALITY_JSON, DATA_QUALITY_LOG
+
+logger = logging.getLogger(__name__)
+
+# Rule types checked from column names alone
+SCHEMA_RULES = ("columns", "column_prefix")
+DEFAULT_SEVERITY = {
+    "columns": "error",
+    "column_prefix": "error",
+    "unique": "error",
+    "not_null": "warning",
+    "coverage": "warning",
+    "range": "warning",
+}
+SAMPLE_SIZE = 5
+MAX_TRACKED_VALUES = 1000  # distinct uncovered values remembered per column
+
+@lru_cache(maxsize=None)
+def _quality_rules() -> dict:
+    with open(SCHEMA_CONFIG_YAML, "r") as f:
+        return (yaml.safe_load(f) or {}).get("quality_rules", {})
+
+def rules_for(dataset: str, only: Iterable[str] | None = None) -> dict:
+    """Declared quality rules of a dataset, optionally limited to some rule types."""
+    rules = _quality_rules().get(dataset)
+    if rules is None:
+        raise ValueError(f"No quality rules declared for '{dataset}' in {SCHEMA_CONFIG_YAML}")
+    if only is not None:
+        rules = {k: v for k, v in rules.items() if k in only or k == "severity"}
+    return rules
+
+def _resolve(columns: list[str], spec) -> str | None:
+    """Actual column for a rule column spec: a name or a list of alternatives, case-insensitive."""
+    lowered = {c.lower(): c for c in reversed(columns)}
+    for name in [spec] if isinstance(spec, str) else spec:
+        if name.lower() in lowered:
+            return lowered[name.lower()]
+    return None
+
+def _label(spec) -> str:
+    return spec if isinstance(spec, str) else "/".join(spec)
+
+def rule_columns(dataset: str, columns: list[str], rules: dict | None = None) -> list[str]:
+    """The subset of `columns` the rules read, so callers can load only those."""
+    rules = rules if rules is not None else rules_for(dataset)
+    specs = [*rules.get("columns", []), *rules.get("not_null", []), *rules.get("unique", []),
+             *rules.get("coverage", {}), *rules.get("range", {})]
+    needed = {_resolve(columns, spec) for spec in specs}
+    prefix = rules.get("column_prefix")
+    if prefix:
+        needed.update(c for c in columns if c.lower().startswith(prefix.lower()))
+    return [c for c in columns if c in needed]
+
+
+class QualityCheck:
+    """Evaluates a dataset's rules over a DataFrame or a stream of chunks in a single pass."""
+
+    def __init__(self, dataset: str, rules: dict | None = None, references: dict[str, pd.DataFrame] | None = None,
+                 columns: list[str] | None = None, stage: str | None = None):
+        self.dataset = dataset
+        self.stage = stage or dataset
+        self.rules = rules if rules is not None else rules_for(dataset)
+        self.severity = {**DEFAULT_SEVERITY, **self.rules.get("severity", {})}
+        self.references = references or {}
+        self.rows = 0
+        self.columns = None
+        self._started = time.perf_counter()
+        if columns is not None:
+            self._plan(list(columns))
+
+    def _plan(self, columns: list[str]):
+        """Resolve rule columns once, against the first chunk's (or the declared) columns."""
+        self.columns = columns
+        self.missing = [_label(spec) for spec in self.rules.get("columns", []) if _resolve(columns, spec) is None]
+        prefix = self.rules.get("column_prefix")
+        self.prefix_missing = bool(prefix) and not any(c.lower().startswith(prefix.lower()) for c in columns)
+
+        def resolved(rule):
+            return [c for c in (_resolve(columns, spec) for spec in self.rules.get(rule, [])) if c is not None]
+
+        self.nulls = dict.fromkeys(resolved("not_null"), 0)
+        self.null_samples = {c: [] for c in self.nulls}
+        self.key_hashes = {c: [] for c in resolved("unique")}
+        # Offending rows are identified by the dataset's first unique key, when there is one
+        self.id_column = next(iter(self.key_hashes), None)
+
+        self.coverage = {}
+        for spec, reference in self.rules.get("coverage", {}).items():
+            column = _resolve(columns, spec)
+            ref_name, ref_spec = reference.split(".", 1)
+            ref_df = self.references.get(ref_name)
+            ref_column = _resolve(list(ref_df.columns), ref_spec) if ref_df is not None else None
+            if column is None or ref_column is None:
+                continue
+            known = pd.Index(ref_df[ref_column].dropna().unique())
+            self.coverage[column] = {"reference": reference, "known": known, "failed": 0, "values": set()}
+
+        self.ranges = {}
+        for spec, (low, high) in self.rules.get("range", {}).items():
+            column = _resolve(columns, spec)
+            if column is not None:
+                self.ranges[column] = {"low": low, "high": high, "failed": 0, "min": None, "max": None}
+
+    def update(self, df: pd.DataFrame) -> "QualityCheck":
+        if self.columns is None:
+            self._plan(list(df.columns))
+        offset = self.rows
+        self.rows += len(df)
+
+        if self.nulls:
+            is_null = df[list(self.nulls)].isna()
+            for column, n_null in is_null.sum().items():
+                self.nulls[column] += int(n_null)
+                sample = self.null_samples[column]
+                if n_null and len(sample) < SAMPLE_SIZE:
+                    # Sample by key when the dataset has one, else by row number
+                    positions = np.flatnonzero(is_null[column].to_numpy())[:SAMPLE_SIZE - len(sample)]
+                    sample += (df[self.id_column].iloc[positions].tolist() if self.id_column
+                               else (positions + offset).tolist())
+
+        for column, hashes in self.key_hashes.items():
+            values = df[column]
+            # Null keys are a not_null concern, not duplicates
+            hashes.append(pd.util.hash_pandas_object(values[values.notna()], index=False).to_numpy())
+
+        for column, state in self.coverage.items():
+            values = df[column]
+            uncovered = values[values.notna() & ~values.isin(state["known"])]
+            state["failed"] += len(uncovered)
+            if len(state["values"]) < MAX_TRACKED_VALUES:
+                state["values"].update(uncovered.unique()[:MAX_TRACKED_VALUES].tolist())
+
+        for column, state in self.ranges.items():
+            values = pd.to_numeric(df[column], errors="coerce")
+            state["failed"] += int((values.notna() & ~values.between(state["low"], state["high"])).sum())
+            low, high = values.min(), values.max()
+            if pd.notna(low):
+                state["min"] = low if state["min"] is None else min(state["min"], low)
+                state["max"] = high if state["max"] is None else max(state["max"], high)
+        return self
+
+    def report(self) -> dict:
+        """Structured result: one entry per evaluated rule plus flat error/warning messages."""
+        if self.columns is None:
+            self._plan([])
+        checks = [{"rule": "columns", "column": c, "failed": 1, "message": f"missing required column: {c}"}
+                  for c in self.missing]
+        if self.prefix_missing:
+            prefix = self.rules["column_prefix"]
+            checks.append({"rule": "column_prefix", "column": f"{prefix}*", "failed": 1,
+                           "message": f"does not contain any '{prefix}*' columns"})
+        for column, n_null in self.nulls.items():
+            checks.append({"rule": "not_null", "column": column, "failed": n_null,
+                           "message": f"Nulls found in {column}: {n_null}", "sample": self.null_samples[column]})
+        for column, hashes in self.key_hashes.items():
+            hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+            n_duplicates = len(hashes) - len(np.unique(hashes))
+            checks.append({"rule": "unique", "column": column, "failed": n_duplicates,
+                           "message": f"Duplicate {column} values: {n_duplicates}"})
+        for column, state in self.coverage.items():
+            values = sorted(map(str, state["values"]))
+            checks.append({"rule": "coverage", "column": column, "failed": state["failed"],
+                           "message": f"{state['failed']} rows with {column} not in {state['reference']}: "
+                                      f"{values[:SAMPLE_SIZE]}",
+                           "sample": values[:SAMPLE_SIZE]})
+        for column, state in self.ranges.items():
+            checks.append({"rule": "range", "column": column, "failed": state["failed"],
+                           "message": f"{state['failed']} {column} values outside "
+                                      f"[{state['low']}, {state['high']}]",
+                           "min": None if state["min"] is None else float(state["min"]),
+                           "max": None if state["max"] is None else float(state["max"])})
+
+        for check in checks:
+            check["severity"] = self.severity[check["rule"]]
+            if check["rule"] in SCHEMA_RULES:
+                check["message"] = f"{self.dataset} {check['message']}"
+        failed = [c for c in checks if c["failed"]]
+        errors = [c["message"] for c in failed if c["severity"] == "error"]
+        report = {
+            "stage": self.stage,
+            "dataset": self.dataset,
+            "rows": self.rows,
+            "passed": not errors,
+            "errors": errors,
+            "warnings": [c["message"] for c in failed if c["severity"] == "warning"],
+            "checks": checks,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 2),
+        }
+        logger.info("Data quality %s: %d rows, %d errors, %d warnings in %.1f ms", self.stage, self.rows,
+                    len(report["errors"]), len(report["warnings"]), report["duration_ms"])
+        return report
+
+
+def check(data: pd.DataFrame | Iterable[pd.DataFrame], dataset: str, **kwargs) -> dict:
+    """Run a dataset's quality rules over a DataFrame or an iterable of chunks; return the report."""
+    quality = QualityCheck(dataset, **kwargs)
+    for chunk in [data] if isinstance(data, pd.DataFrame) else data:
+        quality.update(chunk)
+    return quality.report()
+
+def write_log(reports: list[dict], log_path: Path = DATA_QUALITY_LOG):
+    """Append reports to the human-readable data quality log."""
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "a") as f:
+        for r in reports:
+            f.write(f"== {r['stage']} ==\n")
+            for e in r.get("errors", []):
+                f.write(f"ERROR: {e}\n")
+            for w in r.get("warnings", []):
+                f.write(f"WARNING: {w}\n")
+            f.write("\n")
+
+def write_report(reports: list[dict], json_path: Path = DATA_QUALITY_JSON, log_path: Path = DATA_QUALITY_LOG):
+    """Record reports in the JSON report (keyed by stage, replacing earlier runs of a stage) and the log."""
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    combined = json.loads(json_path.read_text()) if json_path.exists() and json_path.stat().st_size else {}
+    combined.update({r["stage"]: r for r in reports})
+    json_path.write_text(json.dumps(combined, indent=2, default=str))
+    write_log(reports, log_path)
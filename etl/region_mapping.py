@@ -1,13 +1,71 @@
-import pandas as pd
+import os
+import json
+import hashlib
 import logging
-from config.config import REGION_MAPPING_XLSX
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config.config import REGION_MAPPING_XLSX, REGION_MAPPING_CACHE
+from etl.instrumentation import instrumented
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_region_mapping():
-    """Load region mapping Excel file."""
-    if not REGION_MAPPING_XLSX.exists():
-        raise FileNotFoundError(f"Region mapping file not found: {REGION_MAPPING_XLSX}")
-    logger.info("Loading region mapping from %s", REGION_MAPPING_XLSX)
-    return pd.read_excel(REGION_MAPPING_XLSX)
\ No newline at end of file
+# Parquet schema metadata key recording which workbook the cache was converted from
+SOURCE_METADATA_KEY = b"region_mapping_source"
+
+# In-process memo: source path -> ((mtime_ns, size), mapping)
+_memo: dict[str, tuple[tuple[int, int], pd.DataFrame]] = {}
+
+def _stamp(path: Path) -> tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def _cache_source(cache_path: Path) -> dict:
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return {}
+    return json.loads(metadata.get(SOURCE_METADATA_KEY, b"{}"))
+
+def _write_cache(df: pd.DataFrame, cache_path: Path, source: dict):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, SOURCE_METADATA_KEY: json.dumps(source)})
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+def _cached_region_mapping(source: Path, cache_path: Path, stamp: tuple[int, int]) -> pd.DataFrame:
+    """Read the Parquet cache if it matches the workbook (by mtime/size, else by content hash); rebuild otherwise."""
+    cached = _cache_source(cache_path)
+    if (cached.get("mtime_ns"), cached.get("size")) == stamp:
+        return pq.read_table(cache_path).to_pandas()
+
+    digest = _sha256(source)
+    if cached.get("sha256") == digest:
+        # Touched or copied but unchanged: keep the data, refresh the stamp
+        df = pq.read_table(cache_path).to_pandas()
+    else:
+        logger.info("Converting region mapping %s to %s", source, cache_path)
+        df = pd.read_excel(source)
+    _write_cache(df, cache_path, {"mtime_ns": stamp[0], "size": stamp[1], "sha256": digest})
+    return df
+
+@instrumented()
+def load_region_mapping(source: Path = REGION_MAPPING_XLSX, cache_path: Path = REGION_MAPPING_CACHE) -> pd.DataFrame:
+    """Load the region mapping; the workbook is only parsed when it changed since it was last converted."""
+    source = Path(source)
+    if not source.exists():
+        raise FileNotFoundError(f"Region mapping file not found: {source}")
+    stamp = _stamp(source)
+    memo = _memo.get(str(source))
+    if memo is None or memo[0] != stamp:
+        logger.info("Loading region mapping from %s", source)
+        memo = _memo[str(source)] = (stamp, _cached_region_mapping(source, Path(cache_path), stamp))
+    # Callers rename and join on the frame; hand out a copy so the memo stays intact
+    return memo[1].copy()
@@ -0,0 +1,96 @@
+import sqlite3
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config.config import TARGET_DB
+
+logger = logging.getLogger(__name__)
+
+# Dimension -> (SQL expression over enriched_customers c / orders o, source column for the pandas path)
+DIMENSIONS = {
+    # The customer's own region, as in the region weather summary (etl/analysis.py)
+    "region": ('c."Region"', "Region"),
+    "weather": ('c."Weather"', "Weather"),
+    "country": ('c."Country"', "Country"),
+    "month": ("o.month", "OrderDate"),
+}
+METRICS = ["customers", "active_customers", "orders", "freight_total", "avg_freight"]
+
+def _check_dimensions(by: tuple[str, ...]):
+    unknown = [d for d in by if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions {unknown}, expected some of {list(DIMENSIONS)}")
+
+def _finish(summary: pd.DataFrame, by: tuple[str, ...]) -> pd.DataFrame:
+    # Same row order from both paths: by dimension, missing values last
+    summary = summary.sort_values(list(by), na_position="last", kind="stable", ignore_index=True)
+    summary[list(by)] = summary[list(by)].where(summary[list(by)].notna(), np.nan)
+    summary["freight_total"] = summary["freight_total"].fillna(0.0)
+    return summary[[*by, *METRICS]]
+
+def sales_weather_summary(db_path: Path = TARGET_DB, by: tuple[str, ...] = ("region", "weather")) -> pd.DataFrame:
+    """
+    Orders, freight and customer activity per region/weather condition, aggregated inside SQLite.
+    Customers without orders count towards `customers` but not `active_customers`.
+    """
+    _check_dimensions(by)
+    dims = ", ".join(f"{DIMENSIONS[d][0]} AS {d}" for d in by)
+    # Orders are reduced to one row per customer (and month) before the join
+    order_keys = 'o."CustomerID", substr(o."OrderDate", 1, 7) AS month' if "month" in by else 'o."CustomerID"'
+    query = f"""
+        WITH o AS (
+            SELECT {order_keys},
+                   COUNT(*) AS orders,
+                   SUM(o."Freight") AS freight,
+                   COUNT(o."Freight") AS freight_count
+            FROM orders o
+            GROUP BY {", ".join(str(i + 1) for i in range(2 if "month" in by else 1))}
+        )
+        SELECT {dims},
+               COUNT(DISTINCT c."CustomerID") AS customers,
+               COUNT(DISTINCT o."CustomerID") AS active_customers,
+               COALESCE(SUM(o.orders), 0) AS orders,
+               SUM(o.freight) AS freight_total,
+               SUM(o.freight) / SUM(o.freight_count) AS avg_freight
+        FROM enriched_customers c
+        LEFT JOIN o ON o."CustomerID" = c."CustomerID"
+        GROUP BY {", ".join(str(i + 1) for i in range(len(by)))}
+    """
+    # Orders are aggregated per customer from ix_orders_customerid_orderdate_freight, built by every load
+    with sqlite3.connect(db_path) as conn:
+        summary = pd.read_sql(query, conn)
+        (unmatched,) = conn.execute("""
+            SELECT COUNT(*) FROM orders o
+            WHERE NOT EXISTS (SELECT 1 FROM enriched_customers c WHERE c."CustomerID" = o."CustomerID")
+        """).fetchone()
+    if unmatched:
+        logger.warning("%d orders have no enriched customer and are left out of the sales summary", unmatched)
+    return _finish(summary, by)
+
+def sales_weather_summary_frames(orders: pd.DataFrame, customers: pd.DataFrame,
+                                 by: tuple[str, ...] = ("region", "weather")) -> pd.DataFrame:
+    """Vectorized pandas counterpart of sales_weather_summary for frames that aren't in target.db."""
+    _check_dimensions(by)
+    customer_dims = [DIMENSIONS[d][1] for d in by if d != "month"]
+    joined = customers[["CustomerID", *customer_dims]].merge(
+        orders[["OrderID", "CustomerID", "OrderDate", "Freight"]], on="CustomerID", how="left",
+        validate="one_to_many",
+    )
+    keys = pd.DataFrame({d: joined[DIMENSIONS[d][1]] for d in by})
+    if "month" in by:
+        keys["month"] = joined["OrderDate"].astype("string").str[:7].astype(object)
+    grouped = joined.assign(
+        **keys,
+        active=joined["CustomerID"].where(joined["OrderID"].notna()),
+    ).groupby(list(by), dropna=False, sort=False)
+    summary = grouped.agg(
+        customers=("CustomerID", "nunique"),
+        active_customers=("active", "nunique"),
+        orders=("OrderID", "count"),
+        freight_total=("Freight", "sum"),
+        avg_freight=("Freight", "mean"),
+    ).reset_index()
+    return _finish(summary, by)
@@ -0,0 +1,162 @@
+import queue
+import sqlite3
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+
+from etl.load import tune_connection
+from config.config import TARGET_DB, SERVING_POOL_SIZE, SQLITE_BUSY_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# ------------------- Serving tables -------------------
+# Read-side copies of the enriched customers, rebuilt after every load: one narrow table for row lookups,
+# with an index per query shape that holds every selected column (a lookup never touches the table), and
+# per-city and per-region rollups. Region is the customer's own, as in the region weather summary.
+REGION = '"Region"'
+CUSTOMER_COLUMNS = "region, country, city, customer_id, company_name, weather, temperature"
+
+SERVING_TABLES = {
+    "serve_customers": (f"""
+        SELECT {REGION} AS region, "Country" AS country, "City" AS city, "CustomerID" AS customer_id,
+               "CompanyName" AS company_name, "Weather" AS weather, "Temperature" AS temperature
+        FROM enriched_customers
+    """, [
+        ("region", "country", "city", "customer_id", "company_name", "weather", "temperature"),
+        ("country", "city", "customer_id", "region", "company_name", "weather", "temperature"),
+        ("temperature", "region", "country", "city", "customer_id", "company_name", "weather"),
+    ]),
+    "serve_city_weather": (f"""
+        SELECT "Country" AS country, "City" AS city, MAX({REGION}) AS region, MAX("Weather") AS weather,
+               AVG("Temperature") AS temperature, COUNT(*) AS customers
+        FROM enriched_customers
+        GROUP BY "Country", "City"
+    """, [
+        ("country", "city"),
+        ("region", "country", "city"),
+    ]),
+    "serve_region_weather": (f"""
+        SELECT {REGION} AS region, COUNT(DISTINCT "CustomerID") AS customers,
+               COUNT(DISTINCT "Country" || '|' || "City") AS cities, AVG("Temperature") AS avg_temp_c,
+               MIN("Temperature") AS min_temp_c, MAX("Temperature") AS max_temp_c
+        FROM enriched_customers
+        GROUP BY {REGION}
+    """, [
+        ("region",),
+    ]),
+}
+
+def refresh_serving_tables(db_path: Path = TARGET_DB) -> dict[str, int]:
+    """
+    Rebuild the serving tables from enriched_customers in one transaction.
+    Readers keep seeing the previous tables (WAL snapshot) until it commits. Returns rows per table.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        tune_connection(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        counts = {}
+        for table, (select, indexes) in SERVING_TABLES.items():
+            # Build aside and swap in, like the bulk loader; index names are free once the old table is gone
+            conn.execute(f"DROP TABLE IF EXISTS {table}__new")
+            conn.execute(f"CREATE TABLE {table}__new AS {select}")
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+            for columns in indexes:
+                conn.execute(f"CREATE INDEX ix_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+            conn.execute(f"ANALYZE {table}")  # lets the planner pick between the covering indexes
+            (counts[table],) = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info("Refreshed serving tables: %s", counts)
+    return counts
+
+# ------------------- Queries -------------------
+# Fixed, parameterized SQL: each pooled connection prepares a statement once and reuses it
+QUERIES = {
+    "customers_by_region": f"SELECT {CUSTOMER_COLUMNS} FROM serve_customers WHERE region = :region "
+                           "ORDER BY country, city, customer_id LIMIT :limit",
+    "customers_by_country": f"SELECT {CUSTOMER_COLUMNS} FROM serve_customers WHERE country = :country "
+                            "ORDER BY city, customer_id LIMIT :limit",
+    "customers_by_city": f"SELECT {CUSTOMER_COLUMNS} FROM serve_customers WHERE country = :country AND city = :city "
+                         "ORDER BY customer_id LIMIT :limit",
+    "customers_by_temperature": f"SELECT {CUSTOMER_COLUMNS} FROM serve_customers "
+                                "WHERE temperature BETWEEN :low AND :high ORDER BY temperature LIMIT :limit",
+    "cities_by_country": "SELECT * FROM serve_city_weather WHERE country = :country ORDER BY city",
+    "cities_by_region": "SELECT * FROM serve_city_weather WHERE region = :region ORDER BY country, city",
+    "region_summary": "SELECT * FROM serve_region_weather ORDER BY region IS NULL, region",
+}
+DEFAULT_LIMIT = 1000
+
+
+class ReadPool:
+    """Fixed pool of read-only connections to target.db, shared by threads."""
+
+    def __init__(self, db_path: Path = TARGET_DB, size: int = SERVING_POOL_SIZE):
+        self.db_path = Path(db_path)
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"No database at {self.db_path}; run the pipeline's load first")
+        self._idle: queue.Queue[sqlite3.Connection] = queue.Queue()
+        self._connections = [self._open() for _ in range(max(1, size))]
+        for conn in self._connections:
+            self._idle.put(conn)
+
+    def _open(self) -> sqlite3.Connection:
+        # The writer puts target.db in WAL mode, so these readers never block a load nor wait for one
+        conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=len(QUERIES) * 2)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, waiting for one to be free."""
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def query(self, name: str, **params) -> list[dict]:
+        """Run one of QUERIES with its named parameters."""
+        if name not in QUERIES:
+            raise ValueError(f"Unknown query '{name}', expected one of {list(QUERIES)}")
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(QUERIES[name], params)]
+
+    def customers_by_region(self, region: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        return self.query("customers_by_region", region=region, limit=limit)
+
+    def customers_by_country(self, country: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        return self.query("customers_by_country", country=country, limit=limit)
+
+    def customers_by_city(self, country: str, city: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        return self.query("customers_by_city", country=country, city=city, limit=limit)
+
+    def customers_by_temperature(self, low: float, high: float, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        return self.query("customers_by_temperature", low=low, high=high, limit=limit)
+
+    def cities_by_country(self, country: str) -> list[dict]:
+        return self.query("cities_by_country", country=country)
+
+    def cities_by_region(self, region: str) -> list[dict]:
+        return self.query("cities_by_region", region=region)
+
+    def region_summary(self) -> list[dict]:
+        return self.query("region_summary")
@@ -0,0 +1,132 @@
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from config.config import STAGING_DIR, STAGING_FORMAT, CHUNK_SIZE
+from etl.dtypes import arrow_to_pandas
+
+logger = logging.getLogger(__name__)
+
+# Datasets handed between DAG tasks
+CUSTOMERS = "customers"
+ORDERS = "orders"
+CUSTOMERS_WEATHER = "customers_weather"
+REGION_MAPPING = "region_mapping"
+ENRICHED = "enriched"
+WEATHER = "weather"  # per-shard weather tables written by the mapped DAG tasks
+
+# Columnar formats only: a CSV loses the dtypes (leading-zero postal codes, categories) the tasks rely on
+EXTENSIONS = {"parquet": ".parquet", "feather": ".feather"}
+
+
+def staging_path(name: str, fmt: str = STAGING_FORMAT, staging_dir: Path = STAGING_DIR) -> Path:
+    """Location of a staged dataset in the given format."""
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unsupported staging format '{fmt}', expected one of {list(EXTENSIONS)}")
+    return Path(staging_dir) / f"{name}{EXTENSIONS[fmt]}"
+
+
+def write_staging(df: pd.DataFrame, name: str, fmt: str = STAGING_FORMAT, staging_dir: Path = STAGING_DIR) -> Path:
+    """Write a whole DataFrame to the staging area."""
+    path = staging_path(name, fmt, staging_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == "parquet":
+        pq.write_table(table, path)
+    else:
+        # Uncompressed, so memory-mapped reads are zero-copy
+        feather.write_feather(table, path, compression="uncompressed")
+    logger.info("Staged %d rows to %s", len(df), path)
+    return path
+
+
+def read_staging(name: str, columns: list[str] | None = None, fmt: str = STAGING_FORMAT,
+                 staging_dir: Path = STAGING_DIR) -> pd.DataFrame:
+    """Read a staged dataset, optionally only the listed columns."""
+    path = staging_path(name, fmt, staging_dir)
+    if fmt == "parquet":
+        return arrow_to_pandas(pq.read_table(path, columns=columns))
+    return arrow_to_pandas(feather.read_table(path, columns=columns, memory_map=True))
+
+
+def staged_columns(name: str, fmt: str = STAGING_FORMAT, staging_dir: Path = STAGING_DIR) -> list[str]:
+    """Column names of a staged dataset, read from its schema without loading any rows."""
+    path = staging_path(name, fmt, staging_dir)
+    if fmt == "parquet":
+        return pq.read_schema(path).names
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def shard_names(name: str, fmt: str = STAGING_FORMAT, staging_dir: Path = STAGING_DIR) -> list[str]:
+    """Names of the staged shards of a dataset (name_0, name_1, ...), in shard order."""
+    suffix = EXTENSIONS[fmt]
+    shards = [p.name[:-len(suffix)] for p in Path(staging_dir).glob(f"{name}_*{suffix}")]
+    return sorted((s for s in shards if s.rsplit("_", 1)[1].isdigit()), key=lambda s: int(s.rsplit("_", 1)[1]))
+
+
+def clear_shards(name: str, fmt: str = STAGING_FORMAT, staging_dir: Path = STAGING_DIR):
+    """Remove shards left over from a previous run, which may have used more shards."""
+    for shard in shard_names(name, fmt, staging_dir):
+        staging_path(shard, fmt, staging_dir).unlink()
+
+
+def _writer_schema(table: pa.Table) -> pa.Schema:
+    # An all-null column in the first chunk would pin the file to the null type; text is the safe guess.
+    # A categorical's code width depends on its chunk's categories: widen it so later chunks fit.
+    def field_type(field):
+        if pa.types.is_null(field.type):
+            return pa.string()
+        if pa.types.is_dictionary(field.type):
+            return pa.dictionary(pa.int32(), field.type.value_type)
+        return field.type
+    return pa.schema([field.with_type(field_type(field)) for field in table.schema], metadata=table.schema.metadata)
+
+
+def write_staging_chunks(chunks: Iterable[pd.DataFrame], name: str, fmt: str = STAGING_FORMAT,
+                         staging_dir: Path = STAGING_DIR) -> int:
+    """
+    Stream DataFrame chunks into one staged dataset; return the row count.
+    No chunks still writes an (empty) file, so a previous run's dataset is never read as this run's.
+    """
+    path = staging_path(name, fmt, staging_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    total = 0
+    writer, schema = None, None
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = _writer_schema(table)
+                writer = (pq.ParquetWriter(path, schema) if fmt == "parquet"
+                          else pa.ipc.new_file(path, schema))
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        write_staging(pd.DataFrame(), name, fmt, staging_dir)
+    logger.info("Staged %d rows to %s", total, path)
+    return total
+
+
+def iter_staging(name: str, columns: list[str] | None = None, chunksize: int = CHUNK_SIZE,
+                 fmt: str = STAGING_FORMAT, staging_dir: Path = STAGING_DIR) -> Iterator[pd.DataFrame]:
+    """Stream a staged dataset in chunks of about `chunksize` rows."""
+    path = staging_path(name, fmt, staging_dir)
+    if fmt == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield arrow_to_pandas(batch)
+    else:
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield arrow_to_pandas(batch.select(columns) if columns else batch)
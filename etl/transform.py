@@ -1,24 +1,79 @@
+from typing import Iterable, Iterator
+import numpy as np
 import pandas as pd
 import logging
 
-logging.basicConfig(level=logging.INFO)
+from etl.instrumentation import instrumented
+
 logger = logging.getLogger(__name__)
 
+class RegionIndex:
+    """Country -> region mapping row, validated and indexed once, then joined by position."""
+
+    def __init__(self, mapping_df: pd.DataFrame, key: str = "Country"):
+        duplicated = mapping_df[key].dropna()
+        duplicated = duplicated[duplicated.duplicated()].unique().tolist()
+        if duplicated:
+            # A duplicate key would fan out the join into repeated customers
+            raise ValueError(f"Region mapping has duplicate {key} values: {duplicated}")
+        n_null = int(mapping_df[key].isna().sum())
+        if n_null:
+            logger.warning("Ignoring %d region mapping rows without a %s", n_null, key)
+            mapping_df = mapping_df[mapping_df[key].notna()]
+        self.key = key
+        self.index = pd.Index(mapping_df[key])
+        # numpy arrays for numpy dtypes, extension arrays (categorical, string, ...) kept as they are
+        self.columns = {
+            c: mapping_df[c].to_numpy() if isinstance(mapping_df[c].dtype, np.dtype) else mapping_df[c].array
+            for c in mapping_df.columns if c != key
+        }
+
+    def positions(self, keys: pd.Series) -> np.ndarray:
+        """Mapping row of each key, -1 where unmatched; each distinct key is hashed once."""
+        codes, uniques = pd.factorize(keys)
+        # Trailing -1 is picked up by the -1 codes of missing keys
+        lookup = np.append(self.index.get_indexer(uniques), -1)
+        return lookup[codes]
+
+    def join(self, customers_df: pd.DataFrame) -> pd.DataFrame:
+        """Left join: customers_df with the mapping's columns attached, row for row."""
+        positions = self.positions(customers_df[self.key])
+        enriched = customers_df.copy(deep=False)
+        for column, values in self.columns.items():
+            taken = pd.api.extensions.take(values, positions, allow_fill=True)
+            if column in enriched.columns:
+                # Same suffixes a merge would give clashing columns
+                enriched = enriched.rename(columns={column: f"{column}_x"})
+                column = f"{column}_y"
+            enriched[column] = pd.Series(taken, index=customers_df.index)
+        n_unmatched = int((positions < 0).sum())
+        if n_unmatched:
+            logger.info("%d of %d customers have no region mapping", n_unmatched, len(positions))
+        return enriched
+
+@instrumented()
 def enrich_with_region(customers_df: pd.DataFrame, mapping_df: pd.DataFrame) -> pd.DataFrame:
     """Join customers with region mapping."""
     logger.info("Joining customers with region mapping")
-    return customers_df.merge(mapping_df, on="Country", how="left")
+    return RegionIndex(mapping_df).join(customers_df)
+
+def enrich_with_region_chunks(chunks: Iterable[pd.DataFrame], mapping_df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    """Join each customer chunk with the (small, in-memory) region mapping."""
+    logger.info("Joining customer chunks with region mapping")
+    regions = RegionIndex(mapping_df)
+    for chunk in chunks:
+        yield regions.join(chunk)
 
 def transform_data(customers_df, orders_df, mapping_df=None):
     """Main transformation entry point."""
-    if mapping_df is not None:
-        customers_df = enrich_with_region(customers_df, mapping_df)
-
-    # Deduplicate enriched dataset
+    # Deduplicate source customers; the region join itself can't fan out
     customers_before = len(customers_df)
     customers_df = customers_df.drop_duplicates(subset=["CustomerID", "Country"])
     customers_after= len(customers_df)
     if customers_before != customers_after:
         logger.info(f"Dropped {customers_before - customers_after} duplicate customers based on CustomerID and Country")
-    
+
+    if mapping_df is not None:
+        customers_df = enrich_with_region(customers_df, mapping_df)
+
     return customers_df, orders_df
\ No newline at end of file
@@ -0,0 +1,119 @@
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+
+from config.config import WEATHER_CACHE_DB, WEATHER_CACHE_TTL_MINUTES, WEATHER_CACHE_MAX_ENTRIES
+from etl import instrumentation
+
+logger = logging.getLogger(__name__)
+
+Key = tuple[str, str]  # (normalized city, country code)
+
+
+class WeatherCache:
+    """Persistent SQLite cache of OpenWeather responses with a TTL and LRU eviction."""
+
+    def __init__(self, path: Path = WEATHER_CACHE_DB, ttl_minutes: float = WEATHER_CACHE_TTL_MINUTES,
+                 max_entries: int = WEATHER_CACHE_MAX_ENTRIES, clock=time.time):
+        self.path = Path(path)
+        self.ttl = ttl_minutes * 60
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self._clock = clock
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Parallel weather shards share the cache file; wait for each other's writes
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS weather_cache (
+                city TEXT NOT NULL,
+                country_code TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (city, country_code)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_weather_cache_access ON weather_cache (last_access)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys: list[Key]) -> dict[Key, dict]:
+        """Return fresh cached payloads for `keys`; absent and stale keys are counted as misses."""
+        if not keys:
+            return {}
+        now = self._clock()
+        found = {}
+        rows = self._select(keys)
+        for city, code, payload, fetched_at in rows:
+            if now - fetched_at > self.ttl:
+                self.stats["expired"] += 1
+                continue
+            found[(city, code)] = json.loads(payload)
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(set(keys)) - len(found)
+        instrumentation.count("cache_hits", len(found))
+        instrumentation.count("cache_misses", len(set(keys)) - len(found))
+
+        if found:
+            self.conn.executemany(
+                "UPDATE weather_cache SET last_access = ? WHERE city = ? AND country_code = ?",
+                [(now, city, code) for city, code in found],
+            )
+            self.conn.commit()
+        return found
+
+    def _select(self, keys: list[Key]) -> list[tuple]:
+        # SQLite caps the number of bound parameters, so look keys up in chunks
+        rows = []
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            rows += self.conn.execute(
+                "SELECT city, country_code, payload, fetched_at FROM weather_cache WHERE (city, country_code) IN "
+                f"(VALUES {','.join(['(?, ?)'] * len(chunk))})",
+                [part for key in chunk for part in key],
+            ).fetchall()
+        return rows
+
+    def get(self, city: str, country_code: str) -> dict | None:
+        return self.get_many([(city, country_code)]).get((city, country_code))
+
+    def put_many(self, items: dict[Key, dict]):
+        """Store payloads, then evict expired and least-recently-used entries over the size cap."""
+        if not items:
+            return
+        now = self._clock()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO weather_cache (city, country_code, payload, fetched_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(city, code, json.dumps(payload), now, now) for (city, code), payload in items.items()],
+        )
+        self._evict(now)
+        self.conn.commit()
+
+    def put(self, city: str, country_code: str, payload: dict):
+        self.put_many({(city, country_code): payload})
+
+    def _evict(self, now: float):
+        evicted = self.conn.execute("DELETE FROM weather_cache WHERE fetched_at < ?", (now - self.ttl,)).rowcount
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM weather_cache").fetchone()
+        if count > self.max_entries:
+            evicted += self.conn.execute(
+                "DELETE FROM weather_cache WHERE rowid IN "
+                "(SELECT rowid FROM weather_cache ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        self.stats["evicted"] += evicted
+
+    def log_stats(self):
+        logger.info("Weather cache: %(hits)d hits, %(misses)d misses, %(expired)d expired, %(evicted)d evicted",
+                    self.stats)
@@ -0,0 +1,104 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+from config.config import WEATHER_CHECKPOINT_DB, WEATHER_CHECKPOINT_EVERY, WEATHER_CHECKPOINT_MAX_AGE_HOURS
+
+logger = logging.getLogger(__name__)
+
+Key = tuple[str, str]  # (normalized city, country code)
+
+
+class WeatherCheckpoint:
+    """
+    Append-only SQLite journal of the weather fetched by one run, committed every few cities.
+    A retry of the run opens the same journal and only fetches the cities missing from it;
+    the run discards it once the readings are safely recorded.
+    """
+
+    def __init__(self, run_key: str, path: Path = WEATHER_CHECKPOINT_DB, commit_every: int = WEATHER_CHECKPOINT_EVERY,
+                 max_age_hours: float = WEATHER_CHECKPOINT_MAX_AGE_HOURS, clock=time.time):
+        self.run_key = run_key
+        self.path = Path(path)
+        self.commit_every = max(1, commit_every)
+        self.recorded = 0
+        self._clock = clock
+        self._pending: list[tuple] = []
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Written from the client's fetch threads, under the lock; parallel shards share the file
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS weather_checkpoint (
+                run_key TEXT NOT NULL,
+                city TEXT NOT NULL,
+                country_code TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (run_key, city, country_code)
+            )
+        """)
+        # Journals of runs that never finished are too stale to resume from
+        pruned = self.conn.execute("DELETE FROM weather_checkpoint WHERE recorded_at < ?",
+                                   (clock() - max_age_hours * 3600,)).rowcount
+        if pruned:
+            logger.info("Pruned %d stale weather checkpoint entries", pruned)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Whatever was fetched before a failure is kept for the retry
+        self.flush()
+        self.conn.close()
+
+    def done(self, keys: list[Key]) -> dict[Key, dict]:
+        """Payloads journaled for `keys` by an earlier attempt of this run."""
+        found = {}
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            rows = self.conn.execute(
+                "SELECT city, country_code, payload FROM weather_checkpoint WHERE run_key = ? AND "
+                f"(city, country_code) IN (VALUES {','.join(['(?, ?)'] * len(chunk))})",
+                [self.run_key, *(part for key in chunk for part in key)],
+            ).fetchall()
+            found.update({(city, code): json.loads(payload) for city, code, payload in rows})
+        if found:
+            logger.info("Resuming weather run %s: %d of %d cities already fetched", self.run_key, len(found),
+                        len(set(keys)))
+        return found
+
+    def record(self, key: Key, payload: dict | None):
+        """Journal a fetched city; failed fetches aren't, so a retry tries them again."""
+        if payload is None:
+            return
+        with self._lock:
+            self._pending.append((self.run_key, *key, json.dumps(payload), self._clock()))
+            if len(self._pending) >= self.commit_every:
+                self._commit()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if not self._pending:
+            return
+        self.conn.executemany("INSERT OR REPLACE INTO weather_checkpoint VALUES (?, ?, ?, ?, ?)", self._pending)
+        self.conn.commit()
+        self.recorded += len(self._pending)
+        self._pending = []
+
+    def discard(self):
+        """Drop the run's journal once its readings are recorded elsewhere."""
+        with self._lock:
+            self._pending = []
+            self.conn.execute("DELETE FROM weather_checkpoint WHERE run_key = ?", (self.run_key,))
+            self.conn.commit()
@@ -0,0 +1,217 @@
+import time
+import logging
+import threading
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.config import (
+    OPENWEATHER_BASE_URL,
+    OPENWEATHER_CALLS_PER_MINUTE,
+    OPENWEATHER_CALLS_PER_MONTH,
+    OPENWEATHER_MAX_WORKERS,
+    OPENWEATHER_MAX_RETRIES,
+    OPENWEATHER_TIMEOUT,
+    OPENWEATHER_GROUP_SIZE,
+)
+from etl import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceededError(RuntimeError):
+    """Raised when the monthly call budget of the limiter is used up."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket sized from an API plan (calls/minute, calls/month)."""
+
+    def __init__(self, calls_per_minute: int = OPENWEATHER_CALLS_PER_MINUTE,
+                 calls_per_month: int | None = OPENWEATHER_CALLS_PER_MONTH,
+                 burst: int | None = None, clock=time.monotonic, sleep=time.sleep):
+        if calls_per_minute <= 0:
+            raise ValueError("calls_per_minute must be positive")
+        self.rate = calls_per_minute / 60.0
+        # Default burst is ten seconds worth of calls, so a cold start can't blow the minute window
+        self.capacity = float(burst or max(1, calls_per_minute // 6))
+        self.calls_per_month = calls_per_month
+        self.calls = 0
+        self.slept = 0.0
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Block until a call may be made; return the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self.calls_per_month is not None and self.calls >= self.calls_per_month:
+                    raise QuotaExceededError(f"Monthly quota of {self.calls_per_month} calls exhausted")
+                now = self._clock()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.calls += 1
+                    self.slept += waited
+                    if waited:
+                        instrumentation.count("rate_limit_sleep_s", waited)
+                    return waited
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            now = self._clock()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class WeatherClient:
+    """Pooled OpenWeather session that fetches many cities concurrently under a shared rate limit."""
+
+    def __init__(self, api_key: str, base_url: str = OPENWEATHER_BASE_URL,
+                 limiter: TokenBucket | None = None, max_workers: int = OPENWEATHER_MAX_WORKERS,
+                 max_retries: int = OPENWEATHER_MAX_RETRIES, timeout: float = OPENWEATHER_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.limiter = limiter or TokenBucket()
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def get(self, endpoint: str, params: dict) -> dict:
+        """GET an API endpoint, waiting on the limiter and retrying 429/5xx responses."""
+        url = f"{self.base_url}/{endpoint}"
+        params = {**params, "appid": self.api_key, "units": "metric"}
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            resp = self.session.get(url, params=params, timeout=self.timeout)
+            instrumentation.count("http_calls")
+            if resp.status_code == 429 or resp.status_code >= 500:
+                if attempt == self.max_retries:
+                    break
+                delay = _retry_after(resp)
+                if delay is None:
+                    delay = 2 ** attempt
+                logger.info("HTTP %d from OpenWeather — backing off %.1f seconds", resp.status_code, delay)
+                self.limiter.pause(delay)
+                continue
+            break
+        resp.raise_for_status()
+        return resp.json()
+
+    def current_weather(self, city: str, country_code: str) -> dict | None:
+        """Fetch current weather for one already-normalized city; None on failure."""
+        try:
+            return self.get("weather", {"q": f"{city},{country_code}"})
+        except requests.RequestException as e:
+            logger.error(f"Error fetching weather for '{city}' ({country_code}): {e}")
+            return None
+
+    def group_weather(self, city_ids: list[int]) -> dict[int, dict]:
+        """Fetch current weather for up to 20 city ids in one call; empty dict on failure."""
+        try:
+            data = self.get("group", {"id": ",".join(str(i) for i in city_ids)})
+        except requests.RequestException as e:
+            logger.error(f"Error fetching weather for city ids {city_ids}: {e}")
+            return {}
+        return {item["id"]: item for item in data.get("list", []) if "id" in item}
+
+    def fetch_group(self, city_ids: list[int], group_size: int = OPENWEATHER_GROUP_SIZE,
+                    on_result: Callable[[int, dict], None] | None = None) -> dict[int, dict]:
+        """
+        Fetch many city ids through the group endpoint, `group_size` ids per request, concurrently.
+        `on_result(city_id, payload)` is called from the fetching thread as each batch comes in.
+        """
+        if not city_ids:
+            return {}
+        batches = [city_ids[i:i + group_size] for i in range(0, len(city_ids), group_size)]
+
+        def _fetch(batch):
+            try:
+                found = self.group_weather(batch)
+            except QuotaExceededError as e:
+                logger.error(f"Skipping {len(batch)} city ids: {e}")
+                return {}
+            if on_result is not None:
+                for city_id, payload in found.items():
+                    on_result(city_id, payload)
+            return found
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            for found in pool.map(instrumentation.in_context(_fetch), batches):
+                results.update(found)
+        logger.info("Fetched %d of %d cities in %d group calls", len(results), len(city_ids), len(batches))
+        return results
+
+    def fetch_many(self, locations: list[tuple[str, str]],
+                   on_result: Callable[[tuple[str, str], dict | None], None] | None = None) -> list[dict | None]:
+        """
+        Fetch current weather for (city, country_code) pairs concurrently, preserving order.
+        `on_result(location, payload)` is called from the fetching thread as each city comes in.
+        """
+        if not locations:
+            return []
+
+        def _fetch(location):
+            try:
+                payload = self.current_weather(*location)
+            except QuotaExceededError as e:
+                logger.error(f"Skipping '{location[0]}' ({location[1]}): {e}")
+                return None
+            if on_result is not None:
+                on_result(location, payload)
+            return payload
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(locations))) as pool:
+            results = list(pool.map(instrumentation.in_context(_fetch), locations))
+        logger.info("Made %d API calls, waited %.1f seconds on the rate limiter",
+                    self.limiter.calls, self.limiter.slept)
+        return results
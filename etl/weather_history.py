@@ -0,0 +1,147 @@
+import uuid
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from config.config import WEATHER_HISTORY_DIR
+
+logger = logging.getLogger(__name__)
+
+# One row per (location, observed_at): dictionary-encoded text, float32 temperatures, second timestamps
+SCHEMA = pa.schema([
+    ("city", pa.dictionary(pa.int32(), pa.string())),
+    ("country", pa.dictionary(pa.int32(), pa.string())),
+    ("city_id", pa.int32()),
+    ("observed_at", pa.timestamp("s", tz="UTC")),
+    ("temperature", pa.float32()),
+    ("description", pa.dictionary(pa.int32(), pa.string())),
+])
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+DATASET_SCHEMA = SCHEMA.append(pa.field("date", pa.string()))  # plus the partition directory
+KEY_COLUMNS = ["city", "country", "observed_at"]
+
+def _dataset(history_dir: Path) -> ds.Dataset | None:
+    if not Path(history_dir).exists():
+        return None
+    return ds.dataset(history_dir, format="parquet", schema=DATASET_SCHEMA, partitioning=PARTITIONING)
+
+def _date_filter(start: pd.Timestamp | None, end: pd.Timestamp | None):
+    # Partition pruning on the date directories, then an exact filter on the timestamps
+    filters = []
+    if start is not None:
+        filters += [ds.field("date") >= start.strftime("%Y-%m-%d"), ds.field("observed_at") >= start]
+    if end is not None:
+        filters += [ds.field("date") <= end.strftime("%Y-%m-%d"), ds.field("observed_at") <= end]
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    return expression
+
+def _utc(ts) -> pd.Timestamp | None:
+    if ts is None:
+        return None
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def read_observations(start=None, end=None, history_dir: Path = WEATHER_HISTORY_DIR,
+                      columns: list[str] | None = None) -> pd.DataFrame:
+    """Observations between `start` and `end` (inclusive, UTC), reading only the matching date partitions."""
+    dataset = _dataset(history_dir)
+    if dataset is None:
+        return SCHEMA.empty_table().to_pandas()
+    table = dataset.to_table(columns=columns or SCHEMA.names, filter=_date_filter(_utc(start), _utc(end)))
+    return table.to_pandas()
+
+def _observation_table(weather_df: pd.DataFrame) -> pa.Table:
+    """Store layout of the records weather_for_locations(observations=True) collects."""
+    frame = pd.DataFrame({
+        "city": weather_df["City"].astype(str),
+        "country": weather_df["Country"].astype(str),
+        "city_id": pd.to_numeric(weather_df["CityID"], errors="coerce").astype("Int32"),
+        "observed_at": pd.to_datetime(weather_df["ObservedAt"], utc=True).dt.floor("s"),
+        "temperature": pd.to_numeric(weather_df["Temperature"], errors="coerce").astype(np.float32),
+        "description": weather_df["Weather"].astype(object),
+    })
+    return pa.Table.from_pandas(frame, schema=SCHEMA, preserve_index=False)
+
+def append_observations(weather_df: pd.DataFrame, history_dir: Path = WEATHER_HISTORY_DIR) -> int:
+    """Add new observations, one file per touched date partition; readings already stored are skipped."""
+    if weather_df.empty:
+        return 0
+    table = _observation_table(weather_df.dropna(subset=["ObservedAt"]))
+    new = table.to_pandas().drop_duplicates(KEY_COLUMNS)
+    new["date"] = new["observed_at"].dt.strftime("%Y-%m-%d")
+
+    written = 0
+    for day, rows in new.groupby("date", sort=True):
+        partition = Path(history_dir) / f"date={day}"
+        if partition.exists():
+            existing = ds.dataset(partition, format="parquet", schema=SCHEMA).to_table(columns=KEY_COLUMNS)
+            existing = existing.to_pandas()
+            # Cached payloads keep their reading time, so reruns would otherwise store them again
+            seen = pd.MultiIndex.from_frame(existing.astype({"city": object, "country": object}))
+            rows = rows[~pd.MultiIndex.from_frame(rows[KEY_COLUMNS].astype({"city": object, "country": object}))
+                        .isin(seen)]
+        if rows.empty:
+            continue
+        partition.mkdir(parents=True, exist_ok=True)
+        rows = rows.sort_values(["city", "country", "observed_at"])
+        ds.write_dataset(
+            pa.Table.from_pandas(rows.drop(columns="date"), schema=SCHEMA, preserve_index=False),
+            partition, format="parquet", basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        written += len(rows)
+    logger.info("Stored %d new weather observations in %s", written, history_dir)
+    return written
+
+def attach_weather_asof(df: pd.DataFrame, time_column: str, history_dir: Path = WEATHER_HISTORY_DIR,
+                        tolerance: pd.Timedelta = pd.Timedelta(days=1),
+                        direction: str = "nearest") -> pd.DataFrame:
+    """
+    Attach the observation nearest to each row's `time_column` for its City/Country, within `tolerance`,
+    as ObservedAt, ObservedTemperature and ObservedWeather. Row order and index are preserved.
+    """
+    times = pd.to_datetime(df[time_column], utc=True)
+    valid = times.dropna()
+    if valid.empty:
+        observations = read_observations(history_dir=history_dir).iloc[:0]
+    else:
+        observations = read_observations(valid.min() - tolerance, valid.max() + tolerance, history_dir)
+    right = pd.DataFrame({
+        "City": observations["city"].astype(object),
+        "Country": observations["country"].astype(object),
+        "ObservedAt": observations["observed_at"].astype("datetime64[s, UTC]"),
+        "ObservedTemperature": observations["temperature"],
+        "ObservedWeather": observations["description"].astype(object),
+    }).sort_values("ObservedAt", kind="stable")
+
+    # merge_asof needs both sides sorted on time; rows without a time or location can't match
+    left = pd.DataFrame({
+        "_row": np.arange(len(df)),
+        "_time": times.astype("datetime64[s, UTC]").reset_index(drop=True),
+        "City": df["City"].to_numpy(dtype=object),
+        "Country": df["Country"].to_numpy(dtype=object),
+    })
+    matchable = left["_time"].notna() & left["City"].notna() & left["Country"].notna()
+    joined = pd.merge_asof(
+        left[matchable].sort_values("_time", kind="stable"), right,
+        left_on="_time", right_on="ObservedAt", by=["City", "Country"],
+        tolerance=tolerance, direction=direction,
+    ).set_index("_row").reindex(np.arange(len(df))).set_axis(df.index)
+
+    result = df.copy()
+    for column in ("ObservedAt", "ObservedTemperature", "ObservedWeather"):
+        result[column] = joined[column]
+    return result
+
+def orders_with_weather(orders: pd.DataFrame, customers: pd.DataFrame,
+                        history_dir: Path = WEATHER_HISTORY_DIR, **kwargs) -> pd.DataFrame:
+    """Orders with the weather observed at their customer's city nearest to OrderDate."""
+    locations = customers[["CustomerID", "City", "Country"]].drop_duplicates("CustomerID")
+    located = orders.merge(locations, on="CustomerID", how="left", validate="many_to_one")
+    return attach_weather_asof(located, "OrderDate", history_dir, **kwargs)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+import json
+import time
+import random
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # many concurrent clients in benchmarks
+
+
+class StubOpenWeather:
+    """
+    Local stand-in for the OpenWeather current-weather and group endpoints.
+
+    `temperatures` maps "City,CC" to a temperature; None answers every city with a temperature derived
+    from its name. Each response waits `latency` seconds (or a uniform draw from a (low, high) pair),
+    and besides the first `throttle_first` requests a random `throttle_rate` share is answered with 429.
+    """
+
+    def __init__(self, temperatures: dict[str, float] | None = None, throttle_first: int = 0,
+                 latency: float | tuple[float, float] = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 0, seed: int = 0):
+        self.temperatures = temperatures
+        self.ids = {q: i for i, q in enumerate(temperatures or {}, start=1)}
+        self.throttle_first = throttle_first
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.throttled = 0
+        self.requests: list[str] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: dict, headers: dict | None = None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                with stub._lock:
+                    stub.requests.append(self.path)
+                    throttled = stub.throttle_first > 0
+                    if throttled:
+                        stub.throttle_first -= 1
+                    elif stub.throttle_rate:
+                        throttled = stub._rng.random() < stub.throttle_rate
+                    stub.throttled += throttled
+                    latency = stub.latency
+                    if isinstance(latency, tuple):
+                        latency = stub._rng.uniform(*latency)
+                if latency:
+                    time.sleep(latency)
+                if throttled:
+                    return self._send(429, {"cod": 429, "message": "rate limited"},
+                                      {"Retry-After": str(stub.retry_after)})
+
+                if parsed.path.endswith("/weather"):
+                    q = query.get("q", [""])[0]
+                    if not stub.knows(q):
+                        return self._send(404, {"cod": "404", "message": "city not found"})
+                    return self._send(200, stub.payload(q))
+                if parsed.path.endswith("/group"):
+                    with stub._lock:
+                        by_id = {str(i): q for q, i in stub.ids.items()}
+                    ids = query.get("id", [""])[0].split(",")
+                    found = [stub.payload(by_id[i]) for i in ids if i in by_id]
+                    return self._send(200, {"cnt": len(found), "list": found})
+                self._send(404, {"cod": "404", "message": "unknown endpoint"})
+
+        return Handler
+
+    def knows(self, q: str) -> bool:
+        return self.temperatures is None or q in self.temperatures
+
+    def payload(self, q: str) -> dict:
+        city = q.split(",")[0]
+        with self._lock:
+            city_id = self.ids.setdefault(q, len(self.ids) + 1)
+        if self.temperatures is None:
+            temperature = round(zlib.crc32(q.encode()) % 4000 / 100 - 10, 2)
+        else:
+            temperature = self.temperatures[q]
+        return {
+            "id": city_id,
+            "name": city,
+            "dt": int(time.time()),
+            "weather": [{"description": f"clear sky over {city}"}],
+            "main": {"temp": temperature},
+        }
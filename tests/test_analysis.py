@@ -0,0 +1,64 @@
+import pandas as pd
+from datetime import date
+from benchmarks.synthetic import make_enriched
+from etl.analysis import region_weather_summary, fold_weather_summary, read_weather_summary
+
+
+def test_incremental_summary_matches_full_recompute(tmp_path):
+    db = tmp_path / "target.db"
+    enriched = make_enriched(3000)
+    batches = [enriched.iloc[i:i + 1000] for i in range(0, len(enriched), 1000)]
+    for i, batch in enumerate(batches):
+        assert fold_weather_summary(batch, db, batch_id=f"run:{i}", as_of=date(2025, 1, 1))
+    # A retried batch is not counted twice
+    assert not fold_weather_summary(batches[0], db, batch_id="run:0", as_of=date(2025, 1, 1))
+
+    pd.testing.assert_frame_equal(read_weather_summary("region", db), region_weather_summary(enriched))
+    by_country = read_weather_summary("country", db)
+    assert by_country["customers"].sum() == len(enriched)
+    assert read_weather_summary("day", db)["day"].tolist() == ["2025-01-01"]
+    histogram = read_weather_summary("temp_histogram", db)
+    assert histogram["customers"].sum() == enriched["Temperature"].notna().sum()
+
+    # A rebuild replaces the snapshot rollups but keeps earlier days
+    fold_weather_summary(enriched.head(10), db, rebuild=True, as_of=date(2025, 1, 2))
+    pd.testing.assert_frame_equal(read_weather_summary("region", db), region_weather_summary(enriched.head(10)))
+    assert read_weather_summary("day", db)["day"].tolist() == ["2025-01-01", "2025-01-02"]
+
+
+def test_changed_and_removed_customers_are_corrected(tmp_path):
+    db = tmp_path / "target.db"
+    enriched = make_enriched(3000)
+    fold_weather_summary(enriched, db, complete=True, as_of=date(2025, 1, 1))
+
+    # The coldest customer warms up, another moves region and a third is gone from the full extract
+    current = enriched.copy()
+    current.loc[current["Temperature"].idxmin(), "Temperature"] = 40.0
+    current.loc[current.index[0], "Region"] = current["Region"].dropna().iloc[-1]
+    current = current.drop(current.index[1])
+    assert fold_weather_summary(current, db, complete=True, as_of=date(2025, 1, 2))
+    pd.testing.assert_frame_equal(read_weather_summary("region", db), region_weather_summary(current))
+    assert read_weather_summary("country", db)["customers"].sum() == len(current)
+    # Only the two changed customers were folded on the second day
+    assert read_weather_summary("day", db)["customers"].tolist() == [3000, 2]
+
+    # An incremental delta corrects its customers and leaves the others alone
+    delta = current.head(1).assign(Temperature=-30.0)
+    fold_weather_summary(delta, db, as_of=date(2025, 1, 2))
+    current.loc[delta.index, "Temperature"] = -30.0
+    pd.testing.assert_frame_equal(read_weather_summary("region", db), region_weather_summary(current))
+
+
+def test_hll_distinct_counts_are_close(tmp_path):
+    db = tmp_path / "target.db"
+    enriched = make_enriched(20000)
+    fold_weather_summary(enriched.iloc[:12000], db, distinct="hll", as_of=date(2025, 1, 1))
+    # The overlapping customers changed, so they're folded again the same day
+    warmer = enriched.iloc[8000:].assign(Temperature=lambda df: df["Temperature"] + 1)
+    fold_weather_summary(warmer, db, distinct="hll", as_of=date(2025, 1, 1))
+
+    estimated = read_weather_summary("day", db)["customers"].iloc[0]
+    assert abs(estimated - len(enriched)) / len(enriched) < 0.05
+    # The snapshot rollups count the stored customer rows, exactly
+    current = pd.concat([enriched.iloc[:8000], warmer])
+    pd.testing.assert_frame_equal(read_weather_summary("region", db), region_weather_summary(current))
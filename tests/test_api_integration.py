@@ -0,0 +1,194 @@
+import logging
+import pandas as pd
+import pytest
+from etl.api_integration import enrich_with_weather, normalize_locations, get_country_code, normalize_city_name
+from etl.weather_client import TokenBucket, WeatherClient
+from etl.weather_cache import WeatherCache
+from etl.weather_checkpoint import WeatherCheckpoint
+from etl.city_index import CityIdIndex
+from tests.stub_openweather import StubOpenWeather
+
+TEMPERATURES = {"Berlin,DE": 21.5, "Mexico City,MX": 25.0, "Aarhus,DK": 12.25, "London,GB": 15.0}
+
+
+def _customers():
+    return pd.DataFrame({
+        "CustomerID": ["ALFKI", "ANATR", "VAFFE", "AROUT", "BSBEV", "WOLZA"],
+        "City": ["Berlin", " México D.F.", "Århus", "London", "London", "Atlantis"],
+        "Country": ["Germany", "Mexico", "Denmark", "UK", "UK ", "Germany"],
+    })
+
+
+def test_normalize_locations_matches_scalar_lookups(caplog):
+    cities = pd.Series(["México D.F.", "Århus", "Berlin", None, "Berlin", "Köln"] * 3)
+    countries = pd.Series(["Mexico", "Denmark", "Germany", "Germany", "Atlantis", None] * 3)
+
+    with caplog.at_level(logging.WARNING, logger="etl.api_integration"):
+        result = normalize_locations(cities, countries)
+    summaries = [r.getMessage() for r in caplog.records]
+
+    assert list(result["CityAPI"]) == [normalize_city_name(c) for c in cities]
+    assert list(result["CountryCode"]) == [get_country_code(c) for c in countries]
+    # A single summary line with per-country row counts instead of one warning per row
+    assert len(summaries) == 1
+    assert "'Atlantis': 3" in summaries[0] and "'<missing>': 3" in summaries[0]
+
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    bucket = TokenBucket(calls_per_minute=60, calls_per_month=None, burst=2,
+                         clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s))
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert all(w > 0 for w in waits[2:])
+    assert now[0] >= 2.0 - 1e-9  # 60/min -> one token per second after the burst
+
+
+def test_token_bucket_pause_blocks_until_retry_after():
+    now = [0.0]
+    bucket = TokenBucket(calls_per_minute=600, calls_per_month=None,
+                         clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s))
+    bucket.pause(5)
+    bucket.acquire()
+    assert now[0] >= 5
+
+
+def _client(stub):
+    return WeatherClient("dummy", base_url=stub.base_url, max_workers=4,
+                         limiter=TokenBucket(calls_per_minute=6000, calls_per_month=None))
+
+
+def test_enrich_with_weather_against_stub_server(tmp_path):
+    with StubOpenWeather(TEMPERATURES, throttle_first=1) as stub, \
+            _client(stub) as client, WeatherCache(tmp_path / "cache.db") as cache:
+        enriched = enrich_with_weather(_customers(), client=client, cache=cache,
+                                       index=CityIdIndex(tmp_path / "ids.yaml"))
+
+    # One request per unique (city, country) with a known code, plus the throttled retry
+    assert len(stub.requests) == 6
+    assert list(enriched["CustomerID"]) == ["ALFKI", "ANATR", "VAFFE", "AROUT", "BSBEV", "WOLZA"]
+    assert list(enriched["Temperature"].iloc[:5]) == [21.5, 25.0, 12.25, 15.0, 15.0]
+    assert enriched.loc[0, "Weather"] == "clear sky over Berlin"
+    assert pd.isna(enriched.loc[5, "Temperature"])  # Atlantis is unknown to the API
+
+
+def test_warm_cache_rerun_skips_the_api(tmp_path):
+    index = CityIdIndex(tmp_path / "ids.yaml")
+    with StubOpenWeather(TEMPERATURES) as stub, _client(stub) as client:
+        with WeatherCache(tmp_path / "cache.db") as cache:
+            cold = enrich_with_weather(_customers(), client=client, cache=cache, index=index)
+        cold_requests = len(stub.requests)
+        with WeatherCache(tmp_path / "cache.db") as cache:
+            warm = enrich_with_weather(_customers(), client=client, cache=cache, index=index)
+            stats = cache.stats
+
+    # Only the unknown city is retried on the warm run
+    assert len(stub.requests) - cold_requests == 1
+    assert stats["hits"] == 4 and stats["misses"] == 1
+    pd.testing.assert_frame_equal(cold, warm)
+
+
+def test_resolved_city_ids_are_fetched_in_group_calls(tmp_path):
+    with StubOpenWeather(TEMPERATURES) as stub, _client(stub) as client:
+        with WeatherCache(tmp_path / "cold.db") as cache:
+            cold = enrich_with_weather(_customers(), client=client, cache=cache,
+                                       index=CityIdIndex(tmp_path / "ids.yaml"))
+        cold_requests = len(stub.requests)
+
+        # A fresh cache forces a refetch; the persisted index turns it into group calls
+        index = CityIdIndex(tmp_path / "ids.yaml")
+        with WeatherCache(tmp_path / "warm.db") as cache:
+            batched = enrich_with_weather(_customers(), client=client, cache=cache, index=index)
+
+    assert len(index) == 4
+    new_requests = stub.requests[cold_requests:]
+    assert sum("/group" in r for r in new_requests) == 1
+    assert sum("/weather" in r for r in new_requests) == 1  # unresolved city falls back to per-city
+    pd.testing.assert_frame_equal(cold, batched)
+
+
+def test_cache_ttl_and_lru_eviction(tmp_path):
+    now = [1000.0]
+    with WeatherCache(tmp_path / "cache.db", ttl_minutes=1, max_entries=2, clock=lambda: now[0]) as cache:
+        cache.put("Berlin", "DE", {"main": {"temp": 1}})
+        cache.put("Aarhus", "DK", {"main": {"temp": 2}})
+        now[0] += 10
+        assert cache.get("Berlin", "DE") == {"main": {"temp": 1}}  # Berlin is now most recently used
+        cache.put("London", "GB", {"main": {"temp": 3}})
+        assert cache.get("Aarhus", "DK") is None  # evicted as least recently used
+        now[0] += 120
+        assert cache.get("London", "GB") is None  # past the TTL
+        assert cache.stats == {"hits": 1, "misses": 2, "expired": 1, "evicted": 1}
+
+
+def test_parallel_city_index_saves_keep_each_others_ids(tmp_path):
+    # Two weather shards load the same index, resolve different cities and save in turn
+    path = tmp_path / "city_id_index.yaml"
+    first, second = CityIdIndex(path), CityIdIndex(path)
+    first.add("Berlin", "DE", 1)
+    second.add("Paris", "FR", 2)
+    first.save()
+    second.save()
+
+    index = CityIdIndex(path)
+    assert index.get("Berlin", "DE") == 1 and index.get("Paris", "FR") == 2
+
+
+class _CrashingClient(WeatherClient):
+    """Dies partway through, like a worker killed mid-fetch."""
+
+    def __init__(self, *args, crash_after: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crash_after = crash_after
+        self.calls = 0
+
+    def current_weather(self, city, country_code):
+        self.calls += 1
+        if self.calls > self.crash_after:
+            raise RuntimeError("worker lost")
+        return super().current_weather(city, country_code)
+
+
+def test_retry_resumes_from_the_checkpoint(tmp_path):
+    customers = pd.DataFrame({"CustomerID": [f"C{i}" for i in range(30)],
+                              "City": [f"Town {i}" for i in range(30)], "Country": "Germany"})
+
+    def attempt(client):
+        # A zero-TTL cache and an empty id index: only the checkpoint can save calls
+        with WeatherCheckpoint("run-1", tmp_path / "checkpoint.db", commit_every=5) as checkpoint, \
+                WeatherCache(tmp_path / "cache.db", ttl_minutes=0) as cache:
+            return enrich_with_weather(customers.copy(), client=client, cache=cache,
+                                       index=CityIdIndex(tmp_path / "ids.yaml"), checkpoint=checkpoint)
+
+    with StubOpenWeather() as stub:
+        limiter = TokenBucket(calls_per_minute=6000, calls_per_month=None)
+        with _CrashingClient("dummy", base_url=stub.base_url, max_workers=1, limiter=limiter,
+                             crash_after=12) as client, pytest.raises(RuntimeError):
+            attempt(client)
+        assert len(stub.requests) == 12
+        with _client(stub) as client:
+            enriched = attempt(client)
+
+    # The retry only fetched the 18 cities the failed attempt hadn't
+    assert len(stub.requests) == 30
+    assert enriched["Temperature"].notna().all()
+    with WeatherCheckpoint("run-1", tmp_path / "checkpoint.db") as checkpoint:
+        assert len(checkpoint.done([("Town 0", "DE")])) == 1
+        checkpoint.discard()
+        assert checkpoint.done([("Town 0", "DE")]) == {}
+
+
+def test_resumed_cities_are_not_cached_again(tmp_path):
+    customers = pd.DataFrame({"CustomerID": ["C0", "C1"], "City": ["Town 0", "Town 1"], "Country": "Germany"})
+    with StubOpenWeather() as stub, _client(stub) as client:
+        with WeatherCheckpoint("run-1", tmp_path / "checkpoint.db") as checkpoint:
+            checkpoint.record(("Town 0", "DE"), client.current_weather("Town 0", "DE"))
+            checkpoint.flush()
+            with WeatherCache(tmp_path / "cache.db") as cache:
+                enriched = enrich_with_weather(customers, client=client, cache=cache,
+                                               index=CityIdIndex(tmp_path / "ids.yaml"), checkpoint=checkpoint)
+                cached = cache.get_many([("Town 0", "DE"), ("Town 1", "DE")])
+
+    assert enriched["Temperature"].notna().all()
+    # The journaled reading is used but keeps its age: only the city fetched now goes into the cache
+    assert list(cached) == [("Town 1", "DE")]
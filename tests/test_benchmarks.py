@@ -0,0 +1,20 @@
+from benchmarks import bench_pipeline
+
+
+def test_stage_benchmarks_against_stub_are_stored_and_compared(tmp_path):
+    results = bench_pipeline.run([300], ["extract", "enrich", "weather_shards", "pipeline"], repeats=1,
+                                 n_cities=40, throttle_rate=0.2, shards=2)
+    by_stage = {r["stage"]: r for r in results}
+    assert by_stage["extract"]["rows"] == 300 * (1 + bench_pipeline.ORDERS_PER_CUSTOMER)
+    assert by_stage["enrich"]["rows"] == 300
+    assert 0 < by_stage["weather_shards"]["rows"] <= 40  # each distinct city fetched by exactly one shard
+    # One call per distinct city; throttled calls are retried on top
+    assert by_stage["enrich"]["http_calls"] >= 40 and by_stage["enrich"]["throttled"] > 0
+    assert all(r["p50_s"] > 0 and r["peak_rss_mb"] for r in results)
+
+    db_path = tmp_path / "benchmarks.db"
+    bench_pipeline.store(results, {}, db_path)
+    assert all(c["p50_change"] is None for c in bench_pipeline.compare(db_path))
+    faster = [{**r, "p50_s": r["p50_s"] / 2} for r in results]
+    bench_pipeline.store(faster, {}, db_path)
+    assert [c["p50_change"] for c in bench_pipeline.compare(db_path)] == [-0.5] * 4
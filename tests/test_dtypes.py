@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import make_customers, make_region_mapping
+from etl import pipeline
+from etl.dtypes import apply_dtypes
+from etl.transform import enrich_with_region
+
+
+def _weather(customers: pd.DataFrame) -> pd.DataFrame:
+    locations = pipeline.unique_locations(customers)
+    rng = np.random.default_rng(0)
+    return locations.assign(Weather=rng.choice(["clear sky", "light rain", "overcast clouds"], len(locations)),
+                            Temperature=rng.uniform(-10, 35, len(locations)).round(2))
+
+
+def test_dtype_policy_shrinks_the_enriched_dataset_threefold():
+    customers, mapping = make_customers(20_000, n_cities=500), make_region_mapping()
+    weather = _weather(customers)
+
+    # Plain object-dtype strings, as the pipeline held them before the policy
+    plain = enrich_with_region(customers.merge(weather, on=pipeline.LOCATION_COLUMNS, how="left"), mapping)
+    compact = enrich_with_region(pipeline.merge_weather(apply_dtypes(customers), weather), apply_dtypes(mapping))
+
+    assert isinstance(compact["City"].dtype, pd.CategoricalDtype)
+    assert isinstance(compact["Region starting 2016"].dtype, pd.CategoricalDtype)
+    assert compact["CustomerID"].dtype == pd.StringDtype("pyarrow")
+    assert compact["Temperature"].dtype == np.float32
+    plain_bytes, compact_bytes = plain.memory_usage(deep=True).sum(), compact.memory_usage(deep=True).sum()
+    assert plain_bytes >= 3 * compact_bytes
+
+    # Same rows and values, only held differently
+    assert compact["CustomerID"].tolist() == plain["CustomerID"].tolist()
+    for column in ("City", "Country", "Weather", "Region starting 2016"):
+        assert compact[column].astype(object).tolist() == plain[column].tolist()
+    np.testing.assert_allclose(compact["Temperature"], plain["Temperature"], rtol=1e-6)
+
+
+def test_policy_is_idempotent_and_shares_converted_columns():
+    orders = pd.DataFrame({"OrderID": [1, 2], "ShipCountry": ["France", "France"], "Freight": [1.5, 2.0]})
+    once = apply_dtypes(orders)
+    assert once["OrderID"].dtype == "Int32" and once["Freight"].dtype == np.float64
+    assert apply_dtypes(once) is once
+    assert apply_dtypes(orders, enabled=False) is orders
@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import pandas as pd
+from etl import instrumentation
+from etl.transform import enrich_with_region
+
+
+def test_nested_stages_counters_and_flush(tmp_path):
+    instrumentation._finished.clear()
+    customers = pd.DataFrame({"CustomerID": ["A", "B", "C"], "Country": ["Germany", "Mexico", "Atlantis"]})
+    mapping = pd.DataFrame({"Country": ["Germany", "Mexico"], "Region starting 2016": ["Germany", "USA"]})
+
+    with instrumentation.stage("transform", task="transform", run_id="run-1"):
+        instrumentation.count("http_calls", 2)
+        enrich_with_region(customers, mapping)
+        with instrumentation.stage("allocate") as metrics:
+            block = np.ones(50_000_000, dtype=np.uint8)  # ~50 MB touched
+            metrics.rows_out = int(block.sum() > 0)
+            del block
+    instrumentation.count("http_calls")  # outside any stage: ignored
+
+    db_path, json_path = tmp_path / "target.db", tmp_path / "metrics.json"
+    records = instrumentation.flush("run-1", db_path=db_path, json_path=json_path)
+    by_stage = {r["stage"]: r for r in records}
+    assert list(by_stage) == ["enrich_with_region", "allocate", "transform"]
+    assert by_stage["enrich_with_region"]["rows_in"] == 3 and by_stage["enrich_with_region"]["rows_out"] == 3
+    assert {r["task"] for r in records} == {"transform"}
+    assert by_stage["transform"]["http_calls"] == 2 and by_stage["allocate"]["http_calls"] == 0
+    # The parent's peak covers its children's, even though each child resets the high-water mark
+    assert by_stage["transform"]["peak_rss_mb"] >= by_stage["allocate"]["peak_rss_mb"]
+    assert by_stage["transform"]["wall_s"] >= by_stage["allocate"]["wall_s"]
+
+    assert instrumentation.flush("run-1", db_path=db_path, json_path=json_path) == []
+    stored = instrumentation.read_metrics("run-1", db_path=db_path)
+    assert len(stored) == 3 and set(stored["run_id"]) == {"run-1"}
+    assert [s["stage"] for s in json.loads(json_path.read_text())["stages"]] == list(by_stage)
+
+    # A new run replaces the JSON file but the table keeps every run
+    with instrumentation.stage("load", task="load"):
+        pass
+    instrumentation.flush("run-2", db_path=db_path, json_path=json_path)
+    assert json.loads(json_path.read_text())["run_id"] == "run-2"
+    assert len(instrumentation.read_metrics(db_path=db_path)) == 4
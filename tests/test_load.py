@@ -1,6 +1,8 @@
 import pandas as pd
 import sqlite3
 from tests import dq
+from etl.load import load_to_db, merge_to_db, bulk_load, _prepare_merge_table
+from etl.pipeline import load_mode
 from config.config import OUTPUT_DIR, TARGET_DB, ENRICHED_CSV
 
 # Ensure output dir exists
@@ -38,4 +40,120 @@ def test_loaded_data_quality():
     dq.write_report([report_schema, report_data], OUTPUT_DIR)
 
     # Assertions only for schema issues
-    assert not report_schema["errors"], f"Schema errors: {report_schema['errors']}"
\ No newline at end of file
+    assert not report_schema["errors"], f"Schema errors: {report_schema['errors']}"
+
+def test_merge_load_upserts_on_primary_key(tmp_path):
+    db = tmp_path / "target.db"
+    first = pd.DataFrame({"CustomerID": ["ALFKI", "ANATR"], "City": ["Berlin", "México D.F."],
+                          "Temperature": [25.12, None]})
+    assert merge_to_db(first, "enriched_customers", db_path=db) == 2
+    # Re-loading identical rows writes nothing
+    assert merge_to_db(first, "enriched_customers", db_path=db) == 0
+
+    second = pd.DataFrame({"CustomerID": ["ANATR", "ANTON"], "City": ["México D.F.", "México D.F."],
+                           "Temperature": [20.53, 20.53]})
+    assert merge_to_db(second, "enriched_customers", db_path=db) == 2
+
+    conn = sqlite3.connect(db)
+    try:
+        rows = conn.execute("SELECT CustomerID, Temperature FROM enriched_customers ORDER BY CustomerID").fetchall()
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    finally:
+        conn.close()
+    assert rows == [("ALFKI", 25.12), ("ANATR", 20.53), ("ANTON", 20.53)]
+    assert journal_mode == "wal"
+
+
+def test_merge_after_bulk_load_leaves_float32_rows_unchanged(tmp_path):
+    db = tmp_path / "target.db"
+    enriched = pd.DataFrame({"CustomerID": ["ALFKI", "ANATR"], "City": ["Berlin", "México D.F."],
+                             "Temperature": pd.array([21.3, None], dtype="float32")})
+    bulk_load(enriched, "enriched_customers", db_path=db)
+    # Both paths store 21.3, so the same rows merged again are not rewritten
+    assert merge_to_db(enriched, "enriched_customers", db_path=db) == 0
+    assert merge_to_db(enriched.assign(CustomerID=["ANTON", "AROUT"]), "enriched_customers", db_path=db) == 2
+
+    conn = sqlite3.connect(db)
+    try:
+        temperatures = conn.execute("SELECT DISTINCT Temperature FROM enriched_customers ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+    assert temperatures == [(None,), (21.3,)]
+
+
+def test_merge_load_adopts_table_created_by_replace(tmp_path):
+    db = tmp_path / "target.db"
+    mapping = pd.DataFrame({"Country": ["Germany", "France"], "Region until 2017": ["Europe", "Europe"]})
+    load_to_db(pd.concat([mapping, mapping]), "region_mapping", db_path=db)
+
+    load_to_db(mapping.assign(**{"Region until 2017": ["DACH", "Europe"]}), "region_mapping",
+               if_exists="merge", db_path=db)
+
+    conn = sqlite3.connect(db)
+    try:
+        rows = conn.execute('SELECT Country, "Region until 2017" FROM region_mapping ORDER BY Country').fetchall()
+    finally:
+        conn.close()
+    assert rows == [("France", "Europe"), ("Germany", "DACH")]
+
+    # The table now has its unique key: later merges skip the full-table dedupe
+    conn = sqlite3.connect(db)
+    try:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        _prepare_merge_table(conn, mapping, "region_mapping", ["Country"])
+    finally:
+        conn.close()
+    assert not [s for s in statements if s.startswith(("DELETE", "CREATE"))]
+
+
+def test_bulk_load_builds_declared_schema_and_indexes(tmp_path):
+    db = tmp_path / "target.db"
+    enriched = pd.DataFrame({
+        "CustomerID": ["ALFKI", "ANATR", "ALFKI"],
+        "City": ["Berlin", "México D.F.", "Berlin"],
+        "Country": ["Germany", "Mexico", "Germany"],
+        "Temperature": [25.12, None, 26.0],
+    })
+    load_to_db(enriched, "enriched_customers", db_path=db)  # an old to_sql table gets swapped out
+
+    assert bulk_load(enriched, "enriched_customers", db_path=db) == 2
+
+    conn = sqlite3.connect(db)
+    try:
+        columns = {row[1]: (row[2], row[3], row[5]) for row in conn.execute("PRAGMA table_info(enriched_customers)")}
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(enriched_customers)")}
+        unique = {row[1] for row in conn.execute("PRAGMA index_list(enriched_customers)") if row[2]}
+        rows = conn.execute("SELECT CustomerID, Temperature, Region FROM enriched_customers ORDER BY 1").fetchall()
+        leftovers = conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%staging%'").fetchall()
+    finally:
+        conn.close()
+
+    assert columns["CustomerID"][:2] == ("TEXT", 1)  # NOT NULL
+    assert "ux_enriched_customers_pk" in unique  # the primary key, indexed after the rows are in
+    assert columns["Temperature"][0] == "REAL"
+    assert {"ix_enriched_customers_region", "ix_enriched_customers_country",
+            "ix_enriched_customers_city"} <= indexes
+    assert rows == [("ALFKI", 26.0, None), ("ANATR", None, None)]  # last duplicate wins
+    assert not leftovers
+
+
+def test_incremental_delta_upserts_into_bulk_loaded_table(tmp_path):
+    assert load_mode("incremental", False, "bulk") == "merge"
+    assert load_mode("incremental", True, "bulk") == "bulk"
+    assert load_mode("incremental", True, "merge") == "replace"
+    assert load_mode("full", False, "bulk") == "bulk"
+
+    db = tmp_path / "target.db"
+    bulk_load(pd.DataFrame({"CustomerID": ["ALFKI", "ANATR"], "City": ["Berlin", "México D.F."]}),
+              "enriched_customers", db_path=db)
+    # A re-extracted customer next to a new one: no IntegrityError, no duplicate
+    delta = pd.DataFrame({"CustomerID": ["ANATR", "ANTON"], "City": ["Mexico City", "México D.F."]})
+    load_to_db(delta, "enriched_customers", if_exists=load_mode("incremental", False, "bulk"), db_path=db)
+
+    conn = sqlite3.connect(db)
+    try:
+        rows = conn.execute("SELECT CustomerID, City FROM enriched_customers ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+    assert rows == [("ALFKI", "Berlin"), ("ANATR", "Mexico City"), ("ANTON", "México D.F.")]
@@ -0,0 +1,167 @@
+import os
+import json
+import shutil
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+from benchmarks.synthetic import write_northwind, write_region_mapping_xlsx
+from config.config import PROJECT_ROOT, CONFIG_DIR
+from etl.pipeline import backfill
+from etl.region_mapping import load_region_mapping
+from etl.weather_history import append_observations
+
+RUN_WITH_STUB = """
+import os, sys
+from tests.stub_openweather import StubOpenWeather
+with StubOpenWeather() as stub:
+    os.environ["OPENWEATHER_BASE_URL"] = stub.base_url
+    from etl.pipeline import run_pipeline
+    run_pipeline(sys.argv[1])
+"""
+# Runs DAG task functions in a fresh process, after `step` ("extract" or "commit_watermarks")
+RUN_DAG_TASK = """
+import sys
+from dags import etl_pipeline as dag
+from etl.extract import commit_watermarks
+dag._ensure_dirs()
+if sys.argv[1] == "extract":
+    dag._task_extract(run_id=sys.argv[2])
+else:
+    commit_watermarks()
+"""
+
+
+def _workspace(tmp_path) -> dict:
+    """Environment for a pipeline run on a small synthetic Northwind under tmp_path."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_northwind(data_dir / "northwind.db", 300, 900, n_cities=30)
+    write_region_mapping_xlsx(data_dir / "region_mapping.xlsx")
+    shutil.copytree(CONFIG_DIR, tmp_path / "config")  # the run records city ids there
+    return {**os.environ, "DATA_DIR": str(data_dir), "OUTPUT_DIR": str(tmp_path / "output"),
+            "CONFIG_DIR": str(tmp_path / "config"), "OPENWEATHER_API_KEY": "dummy",
+            "OPENWEATHER_CALLS_PER_MINUTE": "60000", "PYTHONPATH": str(PROJECT_ROOT)}
+
+
+def _run(env: dict, run_id: str = "test-run") -> dict:
+    """Run the pipeline in a subprocess; the metrics of its stages by name."""
+    subprocess.run([sys.executable, "-c", RUN_WITH_STUB, run_id], env=env, cwd=PROJECT_ROOT, check=True)
+    metrics = json.loads((Path(env["OUTPUT_DIR"]) / "etl_metrics.json").read_text())
+    return {s["stage"]: s for s in metrics["stages"]}
+
+
+def test_in_process_run_writes_every_output(tmp_path):
+    env = _workspace(tmp_path)
+    output_dir = tmp_path / "output"
+    stages = _run(env)
+
+    with sqlite3.connect(output_dir / "target.db") as conn:
+        assert conn.execute("SELECT COUNT(*), COUNT(Temperature) FROM enriched_customers").fetchone() == (300, 300)
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone() == (900,)
+    conn.close()
+    assert len(pd.read_csv(output_dir / "region_weather_summary.csv")) > 0
+    assert set(json.loads((output_dir / "data_quality_report.json").read_text())) == \
+        {"customers", "orders", "region_mapping", "enriched", "loaded"}
+    assert stages["fetch_weather"]["http_calls"] >= 30 and stages["extract_orders_customers"]["rows_out"] == 1200
+
+
+def test_unchanged_inputs_skip_the_stages_after_the_weather_fetch(tmp_path):
+    env = _workspace(tmp_path)
+    output_dir = tmp_path / "output"
+    assert {"transform", "load", "check_load"} <= set(_run(env))
+
+    # Same source, mapping and config, and the weather comes from the cache: nothing to redo
+    stages = _run(env, "second")
+    assert "transform" not in stages and "load" not in stages
+    assert set(json.loads((output_dir / "data_quality_report.json").read_text())) == \
+        {"customers", "orders", "region_mapping", "enriched", "loaded"}
+
+    # A new customer in a city the weather cache already knows changes the source fingerprint
+    with sqlite3.connect(tmp_path / "data" / "northwind.db") as conn:
+        conn.execute("INSERT INTO Customers (CustomerID, CompanyName, City, Country) "
+                     "SELECT 'NEW01', 'New Co', City, Country FROM Customers LIMIT 1")
+    conn.close()
+    assert {"transform", "load"} <= set(_run(env, "third"))
+    with sqlite3.connect(output_dir / "target.db") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM enriched_customers").fetchone() == (301,)
+    conn.close()
+
+
+
+def test_incremental_runs_keep_every_customer_in_the_exports(tmp_path):
+    env = {**_workspace(tmp_path), "EXTRACT_MODE": "incremental"}
+    output_dir = tmp_path / "output"
+
+    def exported() -> tuple[int, int]:
+        summary = pd.read_csv(output_dir / "region_weather_summary.csv")
+        return len(pd.read_csv(output_dir / "enriched.csv")), int(summary["customers"].sum())
+
+    _run(env)
+    assert exported() == (300, 300)
+    # No source change: the delta is empty, but the exports still cover every loaded customer
+    _run(env, "second")
+    assert exported() == (300, 300)
+
+    # A one-customer delta; the customers already loaded get this run's weather too
+    with sqlite3.connect(tmp_path / "data" / "northwind.db") as conn:
+        conn.execute("INSERT INTO Customers (CustomerID, CompanyName, City, Country) "
+                     "SELECT 'NEW01', 'New Co', City, Country FROM Customers LIMIT 1")
+    conn.close()
+    with sqlite3.connect(output_dir / "target.db") as conn:
+        conn.execute("UPDATE enriched_customers SET Temperature = -99")
+    conn.close()
+    _run(env, "third")
+    assert exported() == (301, 301)
+    with sqlite3.connect(output_dir / "target.db") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM enriched_customers WHERE Temperature = -99").fetchone() == (0,)
+    conn.close()
+    assert (pd.read_csv(output_dir / "enriched.csv")["Temperature"] != -99).all()
+
+@pytest.mark.parametrize("extract_mode", ["full", "incremental"])
+def test_dag_extract_skip_respects_the_watermarks(tmp_path, extract_mode):
+    pytest.importorskip("airflow")
+    pytest.importorskip("dotenv")
+    env = {**_workspace(tmp_path), "EXTRACT_MODE": extract_mode}
+    staged = tmp_path / "output" / "staging" / "customers.parquet"
+
+    def task(*args):
+        subprocess.run([sys.executable, "-c", RUN_DAG_TASK, *args], env=env, cwd=PROJECT_ROOT, check=True)
+
+    task("extract", "first")
+    first = staged.stat().st_mtime_ns
+    task("commit_watermarks")  # as the load does once the delta is in
+    task("extract", "second")
+    if extract_mode == "full":
+        # Same source and config: the staged extract is reused
+        assert staged.stat().st_mtime_ns == first
+    else:
+        # The committed delta must not be staged again for the load
+        assert len(pd.read_parquet(staged)) == 0
+
+
+def test_backfill_partitions_orders_with_weather_as_of_order_date(tmp_path):
+    source = write_northwind(tmp_path / "northwind.db", 200, 600, n_cities=20)
+    with sqlite3.connect(source) as conn:
+        customers = pd.read_sql("SELECT DISTINCT City, Country FROM Customers", conn)
+    conn.close()
+    history = tmp_path / "history"
+    for day in pd.date_range("1996-07-01", "1996-09-30"):
+        append_observations(customers.assign(Weather="clear sky", Temperature=20.0, CityID=1,
+                                             ObservedAt=day + pd.Timedelta(hours=12)), history)
+
+    output = tmp_path / "orders_weather"
+    mapping = load_region_mapping(write_region_mapping_xlsx(tmp_path / "region_mapping.xlsx"),
+                                  tmp_path / "region_mapping.cache.parquet")
+    results = backfill("1996-07-01", "1996-10-01", freq="MS", max_workers=2, source_db=source,
+                       history_dir=history, output_dir=output, mapping_df=mapping)
+    assert [r["partition"] for r in results] == ["1996-07-01", "1996-08-01", "1996-09-01"]
+    assert sorted(p.name for p in output.iterdir()) == [f"order_date={r['partition']}" for r in results]
+
+    september = pd.read_parquet(output / "order_date=1996-09-01")
+    assert september["OrderDate"].between("1996-09-01", "1996-09-30").all()
+    assert len(september) == results[2]["orders"] > 0
+    assert results[2]["with_weather"] == results[2]["orders"]
+    assert {"Region starting 2016", "ObservedTemperature"} <= set(september.columns)
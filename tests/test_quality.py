@@ -0,0 +1,56 @@
+import json
+import numpy as np
+import pandas as pd
+from etl import quality
+
+
+def _enriched():
+    return pd.DataFrame({
+        "CustomerID": ["ALFKI", "ANATR", "ANATR", "BERGS", "BLAUS", None],
+        "City": ["Berlin", "México D.F.", "México D.F.", None, "Mannheim", "Luleå"],
+        "Country": ["Germany", "Mexico", "Mexico", "Sweden", "Germany", "Atlantis"],
+        "region": ["Germany", "USA", "USA", "North", None, None],
+        "Temperature": [12.5, 25.0, 25.0, 99.0, np.nan, -3.0],
+    })
+
+
+def _mapping():
+    return pd.DataFrame({"Country": ["Germany", "Mexico", "Sweden"], "Region starting 2016": ["Germany", "USA", "North"]})
+
+
+def test_rules_evaluated_in_one_pass_over_chunks():
+    df = _enriched()
+    references = {"region_mapping": _mapping()}
+    whole = quality.check(df, "enriched", references=references)
+    chunked = quality.check((df.iloc[i:i + 2] for i in range(0, len(df), 2)), "enriched", references=references)
+
+    failed = {(c["rule"], c["column"]): c for c in whole["checks"] if c["failed"]}
+    assert failed[("not_null", "City")]["failed"] == 1 and failed[("not_null", "City")]["sample"] == ["BERGS"]
+    assert failed[("not_null", "region")]["failed"] == 2  # matched case-insensitively
+    assert failed[("not_null", "Temperature")]["failed"] == 1
+    assert failed[("unique", "CustomerID")]["failed"] == 1  # the null key is not a duplicate
+    assert failed[("coverage", "Country")]["sample"] == ["Atlantis"]
+    assert failed[("range", "Temperature")]["failed"] == 1
+    assert whole["errors"] == ["Duplicate CustomerID values: 1"] and not whole["passed"]
+
+    assert chunked["checks"] == whole["checks"] and chunked["rows"] == whole["rows"] == 6
+
+
+def test_schema_rules_and_json_report(tmp_path):
+    orders = pd.DataFrame(columns=["Id", "CustomerID"])
+    mapping = pd.DataFrame(columns=["Country", "Zone"])
+    reports = [
+        quality.check(orders, "orders"),
+        quality.check(mapping, "region_mapping", stage="mapping"),
+    ]
+    assert reports[0]["passed"]  # Id stands in for OrderID
+    assert reports[1]["errors"] == ["region_mapping does not contain any 'Region*' columns"]
+    assert quality.rule_columns("enriched", ["Phone", "Temperature", "City", "CustomerID"]) == \
+        ["Temperature", "City", "CustomerID"]
+
+    json_path, log_path = tmp_path / "dq.json", tmp_path / "dq.log"
+    quality.write_report(reports, json_path, log_path)
+    quality.write_report([quality.check(orders, "orders")], json_path, log_path)
+    written = json.loads(json_path.read_text())
+    assert set(written) == {"orders", "mapping"}
+    assert "ERROR: region_mapping does not contain any 'Region*' columns" in log_path.read_text()
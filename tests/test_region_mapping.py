@@ -0,0 +1,34 @@
+import os
+import pandas as pd
+from etl import region_mapping
+from config.config import REGION_MAPPING_XLSX
+
+
+def test_workbook_parsed_only_when_it_changes(tmp_path, monkeypatch):
+    source, cache = tmp_path / "region_mapping.xlsx", tmp_path / "region_mapping.cache.parquet"
+    pd.DataFrame({"Country": ["France", "Brazil"], "Region starting 2016": ["France", "Brazil"]}).to_excel(
+        source, index=False)
+    parsed = []
+    read_excel = pd.read_excel
+    monkeypatch.setattr(pd, "read_excel", lambda *a, **kw: parsed.append(a) or read_excel(*a, **kw))
+
+    first = region_mapping.load_region_mapping(source, cache)
+    first["Country"] = "mutated"
+    assert list(region_mapping.load_region_mapping(source, cache)["Country"]) == ["France", "Brazil"]
+    assert len(parsed) == 1 and cache.exists()
+
+    # A new process (empty memo) reads the Parquet copy, also after the workbook is touched
+    region_mapping._memo.clear()
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert list(region_mapping.load_region_mapping(source, cache)["Country"]) == ["France", "Brazil"]
+    assert len(parsed) == 1
+
+    pd.DataFrame({"Country": ["Spain"], "Region starting 2016": ["Spain"]}).to_excel(source, index=False)
+    assert list(region_mapping.load_region_mapping(source, cache)["Country"]) == ["Spain"]
+    assert len(parsed) == 2
+
+
+def test_cached_workbook_matches_excel(tmp_path):
+    cached = region_mapping.load_region_mapping(REGION_MAPPING_XLSX, tmp_path / "region_mapping.cache.parquet")
+    pd.testing.assert_frame_equal(cached, pd.read_excel(REGION_MAPPING_XLSX))
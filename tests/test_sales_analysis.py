@@ -0,0 +1,46 @@
+import sqlite3
+import pandas as pd
+from benchmarks.synthetic import make_enriched, make_orders
+from etl.load import bulk_load, load_to_db
+from etl.sales_analysis import sales_weather_summary, sales_weather_summary_frames
+
+
+def test_sql_pushdown_matches_pandas_fallback(tmp_path):
+    db = tmp_path / "target.db"
+    customers = make_enriched(500)
+    # Leave some customers without orders and add orders from an unknown customer
+    orders = make_orders(3000, customers["CustomerID"].iloc[:400])
+    orders.loc[:9, "CustomerID"] = "GHOST"
+    bulk_load(customers, "enriched_customers", db_path=db)
+    bulk_load(orders, "orders", db_path=db)
+
+    for by in [("region", "weather"), ("country", "month")]:
+        in_sql = sales_weather_summary(db, by=by)
+        in_pandas = sales_weather_summary_frames(orders, customers, by=by)
+        pd.testing.assert_frame_equal(in_sql, in_pandas)
+
+    summary = sales_weather_summary(db)
+    assert summary["customers"].sum() == 500
+    assert summary["active_customers"].sum() == 400
+    assert summary["orders"].sum() == 2990
+
+
+def test_summary_reads_indexes_built_by_every_load_mode(tmp_path):
+    customers = make_enriched(50)
+    orders = make_orders(200, customers["CustomerID"])
+    for mode in ("replace", "merge", "bulk"):
+        db = tmp_path / f"{mode}.db"
+        load_to_db(customers, "enriched_customers", if_exists=mode, db_path=db)
+        load_to_db(orders, "orders", if_exists=mode, db_path=db)
+        with sqlite3.connect(db) as conn:
+            indexes = {row[1] for row in conn.execute("PRAGMA index_list(orders)")}
+        assert "ix_orders_customerid_orderdate_freight" in indexes
+
+        # The analysis itself leaves the schema alone
+        with sqlite3.connect(db) as conn:
+            schema = conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+        summary = sales_weather_summary(db)
+        with sqlite3.connect(db) as conn:
+            assert conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == schema
+        # Grouped by the customers' own Region, like the region weather summary
+        assert set(summary["region"].dropna()) <= set(customers["Region"].dropna())
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl import staging
+from etl.dtypes import apply_dtypes
+
+
+def _customers():
+    return pd.DataFrame({
+        "CustomerID": ["ALFKI", "ANATR", "ANTON", "AROUT"],
+        "PostalCode": ["12209", "05021", None, "WA1 1DP"],
+        "Region": [None, None, None, None],
+        "Temperature": [25.12, np.nan, 20.5, 17.87],
+        "ShipVia": [3, 1, 2, 3],
+    })
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_columnar_staging_preserves_dtypes(tmp_path, fmt):
+    df = _customers()
+    staging.write_staging(df, staging.CUSTOMERS, fmt=fmt, staging_dir=tmp_path)
+    # Leading zeros survive, unlike a CSV round trip that re-infers PostalCode as a number;
+    # reads come back with the in-memory dtype policy applied
+    pd.testing.assert_frame_equal(staging.read_staging(staging.CUSTOMERS, fmt=fmt, staging_dir=tmp_path),
+                                  apply_dtypes(df))
+
+    projected = staging.read_staging(staging.CUSTOMERS, columns=["CustomerID", "Temperature"],
+                                     fmt=fmt, staging_dir=tmp_path)
+    assert list(projected.columns) == ["CustomerID", "Temperature"]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_chunked_staging_round_trip(tmp_path, fmt):
+    df = _customers()
+    # The first chunk's all-null Region must not pin the file schema to the null type
+    chunks = [df.iloc[:2], df.iloc[2:].assign(Region=["Isle of Wight", None])]
+    assert staging.write_staging_chunks(chunks, staging.ENRICHED, fmt=fmt, staging_dir=tmp_path) == 4
+
+    read_back = pd.concat(staging.iter_staging(staging.ENRICHED, columns=["CustomerID", "Region"], chunksize=3,
+                                               fmt=fmt, staging_dir=tmp_path), ignore_index=True)
+    assert list(read_back["CustomerID"]) == list(df["CustomerID"])
+    assert read_back["Region"].iloc[2] == "Isle of Wight"
+
+    # An empty stream replaces the previous run's dataset rather than leaving it to be read again
+    assert staging.write_staging_chunks([], staging.ENRICHED, fmt=fmt, staging_dir=tmp_path) == 0
+    assert list(staging.iter_staging(staging.ENRICHED, fmt=fmt, staging_dir=tmp_path)) == []
+    assert staging.read_staging(staging.ENRICHED, fmt=fmt, staging_dir=tmp_path).empty
+
+
+def test_csv_is_not_a_staging_format(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported staging format"):
+        staging.write_staging(_customers(), staging.CUSTOMERS, fmt="csv", staging_dir=tmp_path)
+
+
+def test_shards_listed_in_order_and_cleared(tmp_path):
+    for i in (0, 2, 10):
+        staging.write_staging(pd.DataFrame({"Shard": [i]}), f"{staging.WEATHER}_{i}", staging_dir=tmp_path)
+    staging.write_staging(pd.DataFrame({"x": [1]}), staging.WEATHER, staging_dir=tmp_path)
+
+    assert staging.shard_names(staging.WEATHER, staging_dir=tmp_path) == ["weather_0", "weather_2", "weather_10"]
+    staging.clear_shards(staging.WEATHER, staging_dir=tmp_path)
+    assert staging.shard_names(staging.WEATHER, staging_dir=tmp_path) == []
+    assert staging.staging_path(staging.WEATHER, staging_dir=tmp_path).exists()
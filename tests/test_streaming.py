@@ -0,0 +1,89 @@
+import sys
+import sqlite3
+import subprocess
+import textwrap
+import numpy as np
+import pytest
+import pandas as pd
+from config.config import PROJECT_ROOT
+from etl.transform import enrich_with_region, enrich_with_region_chunks
+from etl.load import load_to_db, load_chunks_to_db, write_csv_chunks
+
+COUNTRIES = ["Germany", "France", "Mexico", "UK", "Brazil", "Atlantis"]
+
+
+def _write_customers(path, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "CustomerID": [f"C{i:07d}" for i in range(n_rows)],
+        "CompanyName": [f"Company {i} GmbH & Co. KG" for i in range(n_rows)],
+        "Address": [f"Street {i % 997}, building {i % 13}" for i in range(n_rows)],
+        "City": rng.choice(["Berlin", "Paris", "México D.F.", "London", "Rio"], n_rows),
+        "Country": rng.choice(COUNTRIES, n_rows),
+        "Weather": rng.choice(["clear sky", "light rain", None], n_rows),
+        "Temperature": rng.normal(15, 8, n_rows).round(2),
+    }).to_csv(path, index=False)
+
+
+def _mapping():
+    return pd.DataFrame({
+        "Country": COUNTRIES[:-1],
+        "Region starting 2016": ["Germany", "France", "Mexico", "UK", "Brazil"],
+        "Region until 2017": ["Europe", "Europe", "Americas", "Europe", "Americas"],
+    })
+
+
+def test_streaming_matches_in_memory_path(tmp_path):
+    source = tmp_path / "customers_weather.csv"
+    _write_customers(source, 10_000)
+
+    enrich_with_region(pd.read_csv(source), _mapping()).to_csv(tmp_path / "whole.csv", index=False)
+    load_to_db(pd.read_csv(tmp_path / "whole.csv"), "enriched_customers", db_path=tmp_path / "whole.db")
+
+    chunks = enrich_with_region_chunks(pd.read_csv(source, chunksize=1_000), _mapping())
+    write_csv_chunks(chunks, tmp_path / "chunked.csv")
+    loaded = load_chunks_to_db(pd.read_csv(tmp_path / "chunked.csv", chunksize=1_000), "enriched_customers",
+                               db_path=tmp_path / "chunked.db")
+
+    assert loaded == 10_000
+    assert (tmp_path / "whole.csv").read_bytes() == (tmp_path / "chunked.csv").read_bytes()
+    frames = []
+    for db in ("whole.db", "chunked.db"):
+        with sqlite3.connect(tmp_path / db) as conn:
+            frames.append(pd.read_sql("SELECT * FROM enriched_customers", conn))
+    pd.testing.assert_frame_equal(*frames)
+
+
+STREAM_SCRIPT = textwrap.dedent("""
+    import sys
+    import pandas as pd
+    from etl.transform import enrich_with_region_chunks
+    from etl.load import load_chunks_to_db, write_csv_chunks
+    source, mapping, out_csv, out_db = sys.argv[1:5]
+    chunks = enrich_with_region_chunks(pd.read_csv(source, chunksize=5_000), pd.read_csv(mapping))
+    write_csv_chunks(chunks, out_csv)
+    load_chunks_to_db(pd.read_csv(out_csv, chunksize=5_000), "enriched_customers", db_path=out_db)
+    # VmHWM resets on exec, unlike ru_maxrss which inherits the forking test process' peak
+    with open("/proc/self/status") as f:
+        print(next(line.split()[1] for line in f if line.startswith("VmHWM")))
+""")
+
+
+def _peak_rss_kb(tmp_path, n_rows):
+    source = tmp_path / f"customers_{n_rows}.csv"
+    _write_customers(source, n_rows)
+    _mapping().to_csv(tmp_path / "mapping.csv", index=False)
+    result = subprocess.run(
+        [sys.executable, "-c", STREAM_SCRIPT, str(source), str(tmp_path / "mapping.csv"),
+         str(tmp_path / f"out_{n_rows}.csv"), str(tmp_path / f"out_{n_rows}.db")],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads peak RSS from /proc")
+def test_streaming_peak_rss_stays_flat(tmp_path):
+    small = _peak_rss_kb(tmp_path, 20_000)
+    large = _peak_rss_kb(tmp_path, 200_000)
+    # 10x the rows may not cost more than a few chunks' worth of extra memory
+    assert large - small < 20 * 1024, f"peak RSS grew from {small} KB to {large} KB"
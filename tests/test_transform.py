@@ -1,5 +1,7 @@
 import pandas as pd
+import pytest
 from tests import dq
+from etl.transform import enrich_with_region, enrich_with_region_chunks
 from config.config import OUTPUT_DIR, ENRICHED_CSV, REGION_MAPPING_XLSX
 
 # Ensure output dir exists
@@ -26,4 +28,22 @@ def test_enriched_data_quality():
     dq.write_report([report_schema, report_data], OUTPUT_DIR)
 
     # Assertions: ignore null/missing rows, only fail for schema issues
-    assert not report_schema["errors"], f"Schema errors: {report_schema['errors']}"
\ No newline at end of file
+    assert not report_schema["errors"], f"Schema errors: {report_schema['errors']}"
+
+
+def test_region_index_join_matches_merge():
+    customers = pd.DataFrame({
+        "CustomerID": ["A", "B", "C", "D", "E"],
+        "Country": ["Germany", "Mexico", None, "Atlantis", "Germany"],
+    })
+    mapping = pd.DataFrame({"Country": ["Mexico", "Germany"], "Region starting 2016": ["USA", "Germany"],
+                            "Rank": [2, 1]})
+    expected = customers.merge(mapping, on="Country", how="left")
+    pd.testing.assert_frame_equal(enrich_with_region(customers, mapping), expected)
+
+    chunks = enrich_with_region_chunks((customers.iloc[:2], customers.iloc[2:]), mapping)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+    # A duplicate Country would fan the join out, so it's rejected up front
+    with pytest.raises(ValueError, match="duplicate Country"):
+        enrich_with_region(customers, pd.concat([mapping, mapping.head(1)]))
@@ -0,0 +1,44 @@
+import pandas as pd
+from etl.weather_history import append_observations, read_observations, attach_weather_asof, orders_with_weather
+
+
+def _readings(observed_at, temperature):
+    return pd.DataFrame({
+        "City": ["Berlin", "Paris"],
+        "Country": ["Germany", "France"],
+        "Weather": ["light rain", "clear sky"],
+        "Temperature": temperature,
+        "CityID": [2950159, 2988507],
+        "ObservedAt": pd.to_datetime(observed_at, utc=True),
+    })
+
+
+def test_history_is_partitioned_typed_and_deduplicated(tmp_path):
+    assert append_observations(_readings(["2024-01-01 12:00", "2024-01-01 13:00"], [1.5, 4.0]), tmp_path) == 2
+    assert append_observations(_readings(["2024-01-02 12:00", "2024-01-01 13:00"], [2.5, 4.0]), tmp_path) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["date=2024-01-01", "date=2024-01-02"]
+
+    history = read_observations(history_dir=tmp_path)
+    assert len(history) == 3
+    assert history["temperature"].dtype == "float32" and history["city"].dtype == "category"
+    assert len(read_observations("2024-01-02", history_dir=tmp_path)) == 1
+
+
+def test_orders_get_the_nearest_observation(tmp_path):
+    append_observations(_readings(["2024-01-01 06:00", "2024-01-01 06:00"], [1.0, 8.0]), tmp_path)
+    append_observations(_readings(["2024-01-03 06:00", "2024-01-03 06:00"], [3.0, 9.0]), tmp_path)
+    customers = pd.DataFrame({"CustomerID": ["A", "B", "C"], "City": ["Berlin", "Paris", "Oslo"],
+                              "Country": ["Germany", "France", "Norway"]})
+    orders = pd.DataFrame({"OrderID": [1, 2, 3, 4, 5], "CustomerID": ["A", "B", "A", "C", "B"],
+                           "OrderDate": ["2024-01-03", "2024-01-01", "2024-01-01", "2024-01-02", None]},
+                          index=[10, 11, 12, 13, 14])
+
+    enriched = orders_with_weather(orders, customers, tmp_path)
+    assert enriched["OrderID"].tolist() == [1, 2, 3, 4, 5]
+    assert enriched["ObservedTemperature"].tolist()[:3] == [3.0, 8.0, 1.0]
+    assert enriched["ObservedTemperature"].isna().tolist()[3:] == [True, True]  # unknown city, no date
+
+    # Outside the tolerance nothing is attached
+    far = attach_weather_asof(pd.DataFrame({"City": ["Berlin"], "Country": ["Germany"], "At": ["2024-02-01"]}),
+                              "At", tmp_path)
+    assert far["ObservedAt"].isna().all()